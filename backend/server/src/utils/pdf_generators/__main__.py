@@ -0,0 +1,11 @@
+import os
+import sys
+
+# python -m pdf_generators (from backend/server/src/utils) or python pdf_generators.pyz.
+# The modules import each other as top-level modules, so their directory goes
+# on sys.path (inside a zipapp the archive is already there).
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import cli
+
+sys.exit(cli.main(sys.argv[1:]))
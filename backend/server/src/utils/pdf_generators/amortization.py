@@ -0,0 +1,182 @@
+import sys
+import json
+import calendar
+from datetime import date
+
+from statement_summary import np, to_cents, format_cents
+
+# Amortization engine for monthly instalment loans. Amounts are integer cents,
+# rounded per period (half to even); the last instalment absorbs the rounding
+# so the principal always closes at exactly zero.
+#
+#   french - constant instalment: P * r / (1 - (1 + r) ** -n), interest on the outstanding balance
+#   flat   - flat rate: interest on the original principal every month, principal repaid in equal parts
+#
+# portfolio_schedule() computes many loans at once (one numpy step per month
+# across every loan, or a per-loan loop without numpy); loan_schedule(),
+# instalment() and statement_rows() are the single-loan helpers the
+# contract, approval proof and loan statement use when the caller leaves the
+# numbers out.
+
+METHODS = ("french", "flat")
+
+def _check_method(method):
+    if method not in METHODS:
+        raise ValueError(f"Unknown amortization method '{method}'. Expected one of: {', '.join(METHODS)}")
+
+def _loan_cents(principal, monthly_rate, months, method):
+    # One loan: lists of payment, principal, interest and balance (cents) per month
+    payments, principals, interests, balances = [], [], [], []
+    balance = principal
+    if method == "french":
+        payment = round(principal * monthly_rate / (1 - (1 + monthly_rate) ** -months) if monthly_rate else principal / months)
+    else:
+        flat_interest = round(principal * monthly_rate)
+        total_interest = round(principal * monthly_rate * months)
+        flat_principal = round(principal / months)
+    for k in range(months):
+        last = k == months - 1
+        if method == "french":
+            interest = round(balance * monthly_rate)
+            repaid = balance if last else payment - interest
+        else:
+            interest = total_interest - flat_interest * (months - 1) if last else flat_interest
+            repaid = balance if last else flat_principal
+        balance -= repaid
+        payments.append(repaid + interest)
+        principals.append(repaid)
+        interests.append(interest)
+        balances.append(balance)
+    return payments, principals, interests, balances
+
+def _portfolio_cents_np(principal, monthly_rate, months, method):
+    loans = len(principal)
+    max_months = int(months.max()) if loans else 0
+    shape = (loans, max_months)
+    payments, principals, interests, balances = (np.zeros(shape, dtype=np.int64) for _ in range(4))
+    balance = principal.copy()
+    if method == "french":
+        with np.errstate(divide="ignore", invalid="ignore"):
+            payment = np.where(
+                monthly_rate > 0,
+                principal * monthly_rate / (1 - (1 + monthly_rate) ** -months),
+                principal / months,
+            )
+        payment = np.rint(payment).astype(np.int64)
+    else:
+        flat_interest = np.rint(principal * monthly_rate).astype(np.int64)
+        total_interest = np.rint(principal * monthly_rate * months).astype(np.int64)
+        flat_principal = np.rint(principal / months).astype(np.int64)
+    for k in range(max_months):
+        active = k < months
+        last = k == months - 1
+        if method == "french":
+            interest = np.rint(balance * monthly_rate).astype(np.int64)
+            repaid = np.where(last, balance, payment - interest)
+        else:
+            interest = np.where(last, total_interest - flat_interest * (months - 1), flat_interest)
+            repaid = np.where(last, balance, flat_principal)
+        interest = np.where(active, interest, 0)
+        repaid = np.where(active, repaid, 0)
+        balance = balance - repaid
+        payments[:, k] = repaid + interest
+        principals[:, k] = repaid
+        interests[:, k] = interest
+        balances[:, k] = np.where(active, balance, 0)
+    return payments, principals, interests, balances
+
+def portfolio_schedule(principals, annual_rates, terms, method="french"):
+    # principals in currency units, annual_rates in % (TAN), terms in months.
+    # Returns {"payment", "principal", "interest", "balance"}: loans x max(terms)
+    # tables of cents, zero past each loan's term (numpy arrays, or lists of
+    # lists without numpy).
+    _check_method(method)
+    if not (len(principals) == len(annual_rates) == len(terms)):
+        raise ValueError("principals, annual_rates and terms must have the same length.")
+    if any(int(n) <= 0 for n in terms):
+        raise ValueError("Loan terms must be at least one month.")
+    if np is not None:
+        tables = _portfolio_cents_np(
+            np.array([to_cents(p) for p in principals], dtype=np.int64),
+            np.array([float(r) for r in annual_rates], dtype=np.float64) / 1200,
+            np.array([int(n) for n in terms], dtype=np.int64),
+            method,
+        )
+    else:
+        max_months = max((int(n) for n in terms), default=0)
+        tables = ([], [], [], [])
+        for p, r, n in zip(principals, annual_rates, terms):
+            for table, column in zip(tables, _loan_cents(to_cents(p), float(r) / 1200, int(n), method)):
+                table.append(column + [0] * (max_months - int(n)))
+    return dict(zip(("payment", "principal", "interest", "balance"), tables))
+
+def loan_schedule(principal, annual_rate, months, method="french", first_due_date=None):
+    # [(number, due_date, payment, principal, interest, balance), ...] with amounts in cents;
+    # due_date is "" unless first_due_date ("YYYY-MM-DD") is given
+    months = int(months)
+    tables = portfolio_schedule([principal], [annual_rate], [months], method)
+    dates = due_dates(first_due_date, months) if first_due_date else [""] * months
+    return [
+        (k + 1, dates[k], int(tables["payment"][0][k]), int(tables["principal"][0][k]), int(tables["interest"][0][k]), int(tables["balance"][0][k]))
+        for k in range(months)
+    ]
+
+def instalment(principal, annual_rate, months, method="french"):
+    # The regular monthly instalment (cents); only the last one may differ by rounding
+    return int(portfolio_schedule([principal], [annual_rate], [int(months)], method)["payment"][0][0])
+
+def instalment_text(data, amount_key="valor_aprovado", rate_key="taxa_juro", term_key="prazo_meses", method_key="metodo_amortizacao"):
+    # Formatted instalment for contract/approval data, or None when the loan terms are missing or invalid
+    try:
+        return format_cents(instalment(data[amount_key], data[rate_key], data[term_key], data.get(method_key) or "french"))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def add_months(start, months):
+    month_index = start.month - 1 + months
+    year = start.year + month_index // 12
+    month = month_index % 12 + 1
+    return date(year, month, min(start.day, calendar.monthrange(year, month)[1]))
+
+def due_dates(first_due_date, months):
+    start = date.fromisoformat(first_due_date)
+    return [add_months(start, k).isoformat() for k in range(months)]
+
+def statement_rows(loan_details, period_start="", period_end=""):
+    # Loan statement rows derived from the loan terms:
+    # [due_date, payment_date, description, principal, interest, status]
+    # loan_details: amount_approved, interest_rate, repayment_term_months, and optionally
+    # first_due_date, amortization_method and installments_paid. Rows are limited to
+    # the statement period when both bounds and first_due_date are given.
+    missing = [key for key in ("amount_approved", "interest_rate", "repayment_term_months") if loan_details.get(key) in (None, "")]
+    if missing:
+        raise ValueError(f"Loan details are missing {', '.join(missing)} needed to derive the schedule.")
+    schedule = loan_schedule(
+        loan_details["amount_approved"],
+        loan_details["interest_rate"],
+        loan_details["repayment_term_months"],
+        loan_details.get("amortization_method") or "french",
+        loan_details.get("first_due_date"),
+    )
+    paid = int(loan_details.get("installments_paid") or 0)
+    rows = []
+    for number, due_date, _, principal, interest, _ in schedule:
+        if due_date and period_start and period_end and not (period_start <= due_date <= period_end):
+            continue
+        rows.append([due_date, "", f"Prestação {number}", format_cents(principal), format_cents(interest), "paid" if number <= paid else "pending"])
+    return rows
+
+if __name__ == "__main__":
+    if len(sys.argv) > 3:
+        method = sys.argv[4] if len(sys.argv) > 4 else "french"
+        first_due_date = sys.argv[5] if len(sys.argv) > 5 else None
+        try:
+            schedule = loan_schedule(sys.argv[1], sys.argv[2], sys.argv[3], method, first_due_date)
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        for number, due_date, payment, principal, interest, balance in schedule:
+            print(json.dumps([number, due_date, format_cents(payment), format_cents(principal), format_cents(interest), format_cents(balance)], ensure_ascii=False))
+    else:
+        print("Usage: python amortization.py <principal> <annual_rate_pct> <months> [french|flat] [first_due_date]", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,308 @@
+import sys
+import os
+import re
+import json
+import time
+import argparse
+import platform
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Benchmark suite for the PDF generators. Every case renders in a fresh
+# process so peak RSS belongs to that case alone. Payloads are synthetic and
+# modelled on the __main__ test data of each generator; statements are scaled
+# by row count and the contract carries a long "garantias" clause.
+#
+#   python benchmark.py --output results.json
+#   python benchmark.py --output results.json --save-baseline benchmark_baseline.json
+#   python benchmark.py --baseline benchmark_baseline.json   # exit status 1 on regression
+#
+# A case regresses when its wall time or output size grows by more than
+# --threshold (default 10%) over the stored baseline.
+#
+# --workers 2,4,8 also renders each statement scale with parallel_statement.py
+# on that many processes (cases "<statement>_<n>_w<k>") and reports the
+# wall-time speedup over the single-process render under "scaling":
+#
+#   python benchmark.py --scales 10000,100000 --only statement --workers 2,4,8
+
+DEFAULT_SCALES = [10, 100, 1000, 10000, 100000]
+ISSUED_AT = "2025-05-31T18:00:00"
+PAGE_RE = re.compile(rb"/Type\s*/Page\b")
+WORKERS_RE = re.compile(r"_w(\d+)$")
+
+def member_statement_rows(n):
+    rows = []
+    balance = 1000.0
+    for i in range(n):
+        month = i // 2 % 12 + 1
+        if i % 2 == 0:
+            balance -= 100.0
+            rows.append([f"2025-{month:02d}-01", f"Quota {month:02d} (Devida)", "100.00", "", f"{balance:.2f}"])
+        else:
+            balance += 100.0
+            rows.append([f"2025-{month:02d}-15", f"Pagamento Quota {month:02d}", "", "100.00", f"{balance:.2f}"])
+    return rows
+
+# Loan statements are a schedule of one loan over n months, LOAN_PER_ROW of
+# principal per instalment, so the totals and the principal still owed add up
+LOAN_PER_ROW = 250
+LOAN_RATE = 5.5
+
+def loan_details(n):
+    return {
+        "amount_approved": f"{LOAN_PER_ROW * n:.2f}",
+        "interest_rate": f"{LOAN_RATE:.2f}",
+        "repayment_term_months": str(n),
+        "amortization_method": "flat",
+    }
+
+def loan_statement_rows(n):
+    import amortization
+    from statement_summary import format_cents
+    rows = []
+    for number, _, _, principal, interest, _ in amortization.loan_schedule(LOAN_PER_ROW * n, LOAN_RATE, n, "flat"):
+        i = number - 1
+        month = i % 12 + 1
+        paid = i % 3 == 2
+        rows.append([
+            f"2025-{month:02d}-23",
+            f"2025-{month:02d}-20" if paid else "",
+            f"Prestação {number}",
+            format_cents(principal),
+            format_cents(interest),
+            "paid" if paid else "pending",
+        ])
+    return rows
+
+def build_cases(scales, workers=()):
+    cases = {
+        "receipt": ("receipt", {"receipt_data": {
+            "Recibo Nº": "Q202505-001",
+            "Data Pagamento": "2025-05-18 10:00:00",
+            "Sócio": "Nome Exemplo Sócio",
+            "Referente a": "Quota Mensal",
+            "Mês/Ano": "Maio/2025",
+            "Valor Pago": "100.00 EUR",
+            "Método Pagamento": "Transferência Bancária",
+        }}),
+        "loan_payment_receipt": ("loan_payment_receipt", {"receipt_data": {
+            "Recibo Nº": "LP202505-001",
+            "Data Pagamento": "2025-05-18 10:00:00",
+            "Cliente": "Nome Exemplo Cliente",
+            "Empréstimo ID": "L005",
+            "Nº Prestação": "3",
+            "Valor Pago": "215.50 EUR",
+            "Método Pagamento": "Débito Direto",
+        }}),
+        "transfer_proof": ("transfer_proof", {"proof_data": {
+            "ID Transferência": "T001",
+            "Data Transferência": "2025-05-18 10:00:00",
+            "Conta Origem": "Conta Principal (ID: 1)",
+            "Conta Destino": "Conta Reserva (ID: 2)",
+            "Valor": "500.00 EUR",
+            "Descrição": "Transferência para reforço de reserva.",
+            "Registado por": "Admin User (ID: 1)",
+        }}),
+        "credit_approval_proof": ("credit_approval_proof", {"approval_data": {
+            "data_emissao": "2025-05-23",
+            "cliente_nome": "João Silva (Teste)",
+            "cliente_doc": "123456789",
+            "cliente_morada": "Av. Teste, 456, Porto",
+            "loan_id": "L005-Test",
+            "valor_aprovado": "5000.00",
+            "taxa_juro": "5.50",
+            "prazo_meses": "24",
+            "valor_prestacao": "220.46",
+            "data_aprovacao": "2025-05-23",
+        }}),
+        "membership_agreement": ("membership_agreement", {"member_data": {
+            "nome_completo": "Maria Santos (Teste)",
+            "nif": "987654321",
+            "morada": "Rua Teste Nova, 789, Faro",
+            "email": "maria.teste@example.com",
+            "telefone": "912345678",
+            "data_adesao": "2025-05-01",
+            "contribuicao_inicial": "50.00",
+            "quota_mensal": "10.00",
+            "data_assinatura": "____/____/______",
+        }}),
+        "loan_contract": ("loan_contract", {"contract_data": {
+            "loan_id": "L005-Test",
+            "mutuante_nome": "Fininvest Fundo Coletivo",
+            "mutuante_nif": "999888777",
+            "mutuante_sede": "Rua Exemplo, 123, Lisboa",
+            "mutuario_nome": "João Silva (Teste)",
+            "mutuario_doc": "123456789",
+            "mutuario_morada": "Av. Teste, 456, Porto",
+            "mutuario_email": "joao.teste@example.com",
+            "valor_aprovado": "5000.00",
+            "taxa_juro": "5.50",
+            "prazo_meses": "24",
+            "finalidade": "Renovação da cozinha",
+            "data_aprovacao": "2025-05-23",
+            "data_desembolso": "2025-05-24",
+            "valor_prestacao": "220.46",
+            "data_primeira_prestacao": "2025-06-24",
+            "garantias": " ".join(
+                f"Hipoteca voluntária sobre o imóvel {i}, sito na Rua Exemplo {i}, Lisboa, inscrito na matriz sob o artigo {1000 + i}."
+                for i in range(60)
+            ),
+            "data_assinatura": "____/____/______",
+        }}),
+    }
+    for n in scales:
+        cases[f"member_statement_{n}"] = ("member_statement", {
+            "member_name": "Nome Exemplo Sócio",
+            "period_start": "2025-01-01",
+            "period_end": "2025-12-31",
+            "statement_data": ("member_statement_rows", n),
+        })
+        cases[f"loan_statement_{n}"] = ("loan_statement", {
+            "client_name": "Nome Exemplo Cliente",
+            "loan_id": "L005",
+            "period_start": "2025-01-01",
+            "period_end": "2025-12-31",
+            "loan_details": loan_details(n),
+            "statement_data": ("loan_statement_rows", n),
+        })
+        for k in workers:
+            if k > 1:
+                for doc_type in ("member_statement", "loan_statement"):
+                    doc_type, payload = cases[f"{doc_type}_{n}"]
+                    cases[f"{doc_type}_{n}_w{k}"] = (doc_type, dict(payload, workers=k))
+    return cases
+
+def scaling(results):
+    # Speedup of each "_w<k>" case over the same statement in one process
+    out = {}
+    for name, r in results.items():
+        m = WORKERS_RE.search(name)
+        base = results.get(name[:m.start()]) if m else None
+        if base and r["wall_s"]:
+            out[name] = {"workers": int(m.group(1)), "speedup": round(base["wall_s"] / r["wall_s"], 2)}
+    return out
+
+def run_case(doc_type, payload, repeat):
+    # Runs in a fresh child process; rows are generated here so the parent
+    # never pickles 100k-row payloads.
+    import resource
+    import warnings
+    import registry
+    warnings.simplefilter("ignore", DeprecationWarning)
+    rows_spec = payload.get("statement_data")
+    if isinstance(rows_spec, (list, tuple)) and len(rows_spec) == 2 and isinstance(rows_spec[0], str):
+        payload = dict(payload, statement_data=globals()[rows_spec[0]](rows_spec[1]))
+    payload = dict(payload, issued_at=ISSUED_AT)
+    registry.get_generator(doc_type)
+    rss_before_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = []
+    pdf_bytes = b""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        pdf_bytes = registry.render_bytes(doc_type, payload)
+        timings.append(time.perf_counter() - start)
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    pages = len(PAGE_RE.findall(pdf_bytes))
+    best = min(timings)
+    return {
+        "doc_type": doc_type,
+        "wall_s": round(best, 6),
+        "wall_s_mean": round(sum(timings) / len(timings), 6),
+        "pages": pages,
+        "pages_per_s": round(pages / best, 2) if best else None,
+        "peak_rss_kb": peak_rss_kb,
+        "rss_growth_kb": peak_rss_kb - rss_before_kb,
+        "output_bytes": len(pdf_bytes),
+    }
+
+def run_suite(cases, repeat, selected=None):
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    for name, (doc_type, payload) in cases.items():
+        if selected and not any(s in name for s in selected):
+            continue
+        # Large statements are slow enough that one run is representative
+        case_repeat = 1 if WORKERS_RE.sub("", name).endswith(("_10000", "_100000")) else repeat
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+            results[name] = executor.submit(run_case, doc_type, payload, case_repeat).result()
+        r = results[name]
+        print(
+            f"{name:32} {r['wall_s'] * 1000:10.1f} ms {r['pages']:6d} pages {r['pages_per_s'] or 0:9.1f} p/s "
+            f"{r['peak_rss_kb'] / 1024:8.1f} MB RSS {r['output_bytes']:10d} B",
+            file=sys.stderr,
+        )
+    return results
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric in ("wall_s", "output_bytes", "peak_rss_kb"):
+            if base.get(metric) and r[metric] > base[metric] * (1 + threshold):
+                regressions.append({
+                    "case": name,
+                    "metric": metric,
+                    "baseline": base[metric],
+                    "current": r[metric],
+                    "change_pct": round((r[metric] / base[metric] - 1) * 100, 1),
+                })
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Fininvest PDF generators.")
+    parser.add_argument("--scales", default=",".join(str(n) for n in DEFAULT_SCALES), help="Comma-separated statement row counts")
+    parser.add_argument("--repeat", type=int, default=3, help="Renders per case (best time is reported)")
+    parser.add_argument("--only", default="", help="Comma-separated substrings selecting cases")
+    parser.add_argument("--output", default=None, help="Write JSON results to this path")
+    parser.add_argument("--baseline", default=None, help="Compare against this JSON baseline")
+    parser.add_argument("--save-baseline", default=None, help="Also store these results as a baseline")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed growth before flagging a regression")
+    parser.add_argument("--workers", default="", help="Comma-separated process counts to also render the statements with (see parallel_statement.py)")
+    args = parser.parse_args()
+
+    # Children import the generators from this directory
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [sys.path[0], os.environ.get("PYTHONPATH")]))
+
+    scales = [int(n) for n in args.scales.split(",") if n]
+    selected = [s for s in args.only.split(",") if s]
+    workers = [int(k) for k in args.workers.split(",") if k]
+    results = run_suite(build_cases(scales, workers), args.repeat, selected)
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    if workers:
+        report["scaling"] = scaling(results)
+        for name, s in report["scaling"].items():
+            print(f"{name:32} {s['speedup']:10.2f}x on {s['workers']} workers ({os.cpu_count()} CPUs)", file=sys.stderr)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        report["regressions"] = compare(results, baseline, args.threshold)
+        for reg in report["regressions"]:
+            print(f"REGRESSION {reg['case']} {reg['metric']}: {reg['baseline']} -> {reg['current']} (+{reg['change_pct']}%)", file=sys.stderr)
+        if report["regressions"]:
+            exit_code = 1
+        else:
+            print("No regressions against baseline.", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"meta": report["meta"], "results": results}, f, indent=2)
+    sys.exit(exit_code)
@@ -0,0 +1,59 @@
+import sys
+import os
+import glob
+import shutil
+import argparse
+import tempfile
+import zipapp
+import py_compile
+
+# Packs the generators into one executable zipapp with precompiled bytecode:
+#
+#   python build_zipapp.py dist/pdf_generators.pyz
+#   python dist/pdf_generators.pyz receipt out.pdf @receipt.json
+#
+# Every module is stored as source plus an unchecked-hash .pyc next to it,
+# which zipimport loads without compiling or comparing timestamps. The .pyc
+# files only load on the Python version that built them, so build with the
+# interpreter that will run the bundle. fpdf (and numpy, if used) still come
+# from that interpreter's environment.
+
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Build-time only
+EXCLUDED = {"build_zipapp.py"}
+
+def build(target, interpreter="/usr/bin/env python3"):
+    with tempfile.TemporaryDirectory() as staging:
+        modules = 0
+        for path in sorted(glob.glob(os.path.join(SOURCE_DIR, "*.py"))):
+            name = os.path.basename(path)
+            if name in EXCLUDED:
+                continue
+            shutil.copy2(path, os.path.join(staging, name))
+            # zipapp runs __main__.py from source; everything it imports is precompiled
+            if name != "__main__.py":
+                py_compile.compile(
+                    path,
+                    cfile=os.path.join(staging, name + "c"),
+                    dfile=name,
+                    doraise=True,
+                    invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH,
+                )
+            modules += 1
+        target_dir = os.path.dirname(target)
+        if target_dir:
+            os.makedirs(target_dir, exist_ok=True)
+        zipapp.create_archive(staging, target, interpreter=interpreter, compressed=True)
+    return {"modules": modules, "bytes": os.path.getsize(target), "python": sys.version.split()[0]}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a precompiled zipapp of the PDF generators.")
+    parser.add_argument("output", nargs="?", default="pdf_generators.pyz", help="Target .pyz path (default: pdf_generators.pyz)")
+    parser.add_argument("--python", default="/usr/bin/env python3", help="Interpreter for the #! line")
+    args = parser.parse_args()
+    try:
+        summary = build(args.output, args.python)
+    except (OSError, py_compile.PyCompileError) as e:
+        print(f"Error building zipapp: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Built {args.output}: {summary['modules']} modules, {summary['bytes']} bytes (Python {summary['python']})")
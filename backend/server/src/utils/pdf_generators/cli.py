@@ -0,0 +1,101 @@
+import sys
+
+# Single entry point for the generators and tools:
+#
+#   python -m pdf_generators <doc_type> <output_path|-> [payload]
+#   python -m pdf_generators <tool> [tool args...]
+#   python -m pdf_generators list
+#
+# payload is the registry/worker job payload as a JSON string, @file.json, or
+# - for stdin (default: {}), e.g.
+#   python -m pdf_generators receipt - '{"receipt_data": {"Recibo Nº": "Q202505-001"}, "issued_at": "2025-05-31T18:00:00"}'
+#
+# Only what the command needs is imported: the usage and argument-error paths
+# never load fpdf, and a render imports the one generator module it uses. Tools
+# run their own command line (python -m pdf_generators merge --help).
+#
+# Also runs from a zipapp built with build_zipapp.py:
+#   python pdf_generators.pyz receipt out.pdf @receipt.json
+
+# Tool name -> module whose __main__ block implements it
+TOOLS = {
+    "merge": "merge_documents",
+    "append": "statement_append",
+    "compact": "pdf_compact",
+    "batch": "render_batch",
+    "pool": "render_pool",
+    "worker": "render_worker",
+    "service": "render_service",
+    "queue": "job_queue",
+    "amortization": "amortization",
+    "benchmark": "benchmark",
+    "startup-benchmark": "startup_benchmark",
+    "build-zipapp": "build_zipapp",
+}
+
+def usage(doc_types):
+    return "\n".join([
+        "Usage: python -m pdf_generators <doc_type> <output_path|-> [payload_json | @payload.json | -]",
+        "       python -m pdf_generators <tool> [args...]",
+        "       python -m pdf_generators list",
+        f"doc_types: {', '.join(sorted(doc_types))}",
+        f"tools: {', '.join(TOOLS)}",
+    ])
+
+def read_payload(arg):
+    import json
+    if arg is None:
+        text = "{}"
+    elif arg == "-":
+        text = sys.stdin.read()
+    elif arg.startswith("@"):
+        with open(arg[1:], encoding="utf-8") as f:
+            text = f.read()
+    else:
+        text = arg
+    payload = json.loads(text)
+    if not isinstance(payload, dict):
+        raise ValueError("Payload must be a JSON object.")
+    return payload
+
+def run_tool(module_name, args):
+    # Runs the module as if started as a script, with its own argv
+    import runpy
+    sys.argv = [f"{module_name}.py", *args]
+    runpy.run_module(module_name, run_name="__main__", alter_sys=True)
+    return 0
+
+def main(argv):
+    # registry only maps names to modules; importing it doesn't load any generator
+    from registry import GENERATORS
+
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage(GENERATORS))
+        return 0 if argv else 1
+    command, args = argv[0], argv[1:]
+    if command == "list":
+        print("\n".join(sorted(GENERATORS)))
+        return 0
+    if command in TOOLS:
+        return run_tool(TOOLS[command], args)
+    if command not in GENERATORS:
+        print(f"Error: unknown doc_type or tool '{command}'.", file=sys.stderr)
+        print(usage(GENERATORS), file=sys.stderr)
+        return 1
+    if not 1 <= len(args) <= 2:
+        print(usage(GENERATORS), file=sys.stderr)
+        return 1
+    output_path = args[0]
+    try:
+        payload = read_payload(args[1] if len(args) > 1 else None)
+    except (OSError, ValueError) as e:
+        print(f"Error reading payload: {e}", file=sys.stderr)
+        return 1
+
+    import registry
+    try:
+        registry.render(command, output_path, payload)
+    except (TypeError, ValueError) as e:
+        print(f"Error rendering {command}: {e}", file=sys.stderr)
+        return 1
+    return 0
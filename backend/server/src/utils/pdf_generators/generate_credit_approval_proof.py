@@ -1,31 +1,21 @@
 import sys
 import os
-from fpdf import FPDF
+from pdf_base import FininvestPDF
+from pdf_output import write_pdf
+import instrumentation
+from amortization import instalment_text
 from datetime import datetime
 
-class PDFCreditApprovalProof(FPDF):
+class PDFCreditApprovalProof(FininvestPDF):
+    title_text = "Comprovativo de Aprovação de Crédito"
+    title_font_size = 16
+    key_width = 60 # Wider key cell
+
     def __init__(self, approval_data={}, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.approval_data = approval_data
         self.line_height = 6
         self.body_font_size = 11
-        self.footer_text = "Fininvest - Gestão de Microcrédito"
-
-    def header(self):
-        self.set_font("Helvetica", "B", 16)
-        title = "Comprovativo de Aprovação de Crédito"
-        title_w = self.get_string_width(title) + 6
-        doc_w = self.w
-        self.set_x((doc_w - title_w) / 2)
-        self.cell(title_w, 10, title, border=0, ln=1, align="C", fill=0)
-        self.ln(10)
-
-    def footer(self):
-        self.set_y(-15)
-        self.set_font("Helvetica", "I", 8)
-        self.set_text_color(128)
-        self.cell(0, 10, f"Página {self.page_no()}", align="C")
-        self.cell(0, 10, self.footer_text, align="R")
 
     def add_section_title(self, title):
         self.set_font("Helvetica", "B", 12)
@@ -37,18 +27,16 @@ class PDFCreditApprovalProof(FPDF):
         self.multi_cell(0, self.line_height, text, align="L")
         self.ln(self.line_height / 2)
 
-    def add_key_value(self, key, value):
-        self.set_font("Helvetica", "B", self.body_font_size)
-        self.cell(60, self.line_height, f"{key}:") # Wider key cell
-        self.set_font("Helvetica", "", self.body_font_size)
-        self.multi_cell(0, self.line_height, str(value), ln=1)
+    def valor_prestacao(self):
+        # Derived from the loan terms (see amortization.py) unless the caller passes it
+        return self.approval_data.get("valor_prestacao") or instalment_text(self.approval_data) or "N/A"
 
     def print_proof(self):
         self.add_page()
         
         # Date
         self.set_font("Helvetica", "", 10)
-        self.cell(0, 6, f"Data de Emissão: {self.approval_data.get("data_emissao", datetime.now().strftime("%Y-%m-%d"))}", ln=1, align="R")
+        self.cell(0, 6, f"Data de Emissão: {self.approval_data.get("data_emissao", self.issued_at_text("%Y-%m-%d"))}", ln=1, align="R")
         self.ln(5)
 
         # Recipient Details
@@ -69,7 +57,7 @@ class PDFCreditApprovalProof(FPDF):
         self.add_key_value("Montante Aprovado", f"{self.approval_data.get("valor_aprovado", "0.00")} EUR")
         self.add_key_value("Taxa de Juro Anual Nominal (TAN)", f"{self.approval_data.get("taxa_juro", "0.00")} %")
         self.add_key_value("Prazo de Reembolso", f"{self.approval_data.get("prazo_meses", "0")} meses")
-        self.add_key_value("Valor Estimado da Prestação Mensal", f"{self.approval_data.get("valor_prestacao", "N/A")} EUR")
+        self.add_key_value("Valor Estimado da Prestação Mensal", f"{self.valor_prestacao()} EUR")
         self.add_key_value("Data de Aprovação", self.approval_data.get("data_aprovacao", "N/A"))
         self.ln(5)
 
@@ -90,16 +78,24 @@ class PDFCreditApprovalProof(FPDF):
         self.cell(0, self.line_height, "_____________________________", ln=1)
         self.cell(0, self.line_height, "A Gerência - Fininvest", ln=1)
 
-def generate_pdf(output_path, approval_data):
+def build_pdf(approval_data, issued_at=None):
     pdf = PDFCreditApprovalProof(approval_data)
+    if issued_at:
+        pdf.set_issued_at(issued_at)
     pdf.set_title(f"Comprovativo Aprovação Crédito {approval_data.get("loan_id", "")}")
     pdf.set_author("Fininvest Platform")
     pdf.print_proof()
-    pdf.output(output_path)
-    print(f"PDF credit approval proof generated successfully at: {output_path}")
+    return pdf
+
+def render_bytes(approval_data, issued_at=None):
+    return build_pdf(approval_data, issued_at=issued_at).output_bytes()
+
+def generate_pdf(output_path, approval_data, issued_at=None):
+    write_pdf(render_bytes(approval_data, issued_at=issued_at), output_path, "credit approval proof")
 
 if __name__ == "__main__":
     if len(sys.argv) > 2:
+        instrumentation.begin("credit_approval_proof")
         output_filename = sys.argv[1]
         import json
         try:
@@ -108,9 +104,9 @@ if __name__ == "__main__":
             if not isinstance(approval_data, dict):
                  raise ValueError("Approval data must be a JSON object.")
         except (IndexError, json.JSONDecodeError, ValueError) as e:
-            print(f"Error processing approval data: {e}")
-            print("Expected JSON string as 2nd argument: ")
-            print(json.dumps({"loan_id": "L005", "cliente_nome": "Cliente X", "valor_aprovado": "5000.00", "..."}))
+            print(f"Error processing approval data: {e}", file=sys.stderr)
+            print("Expected JSON string as 2nd argument: ", file=sys.stderr)
+            print(json.dumps({"loan_id": "L005", "cliente_nome": "Cliente X", "valor_aprovado": "5000.00", "...": "..."}), file=sys.stderr)
             sys.exit(1)
         
         output_dir = os.path.dirname(output_filename)
@@ -119,7 +115,7 @@ if __name__ == "__main__":
 
         generate_pdf(output_filename, approval_data)
     else:
-        print("Usage: python generate_credit_approval_proof.py <output_path> <json_approval_data>")
+        print("Usage: python generate_credit_approval_proof.py <output_path|-> <json_approval_data>", file=sys.stderr)
         # Example default generation for testing
         test_data = {
             "data_emissao": datetime.now().strftime("%Y-%m-%d"),
@@ -130,7 +126,6 @@ if __name__ == "__main__":
             "valor_aprovado": "5000.00",
             "taxa_juro": "5.50",
             "prazo_meses": "24",
-            "valor_prestacao": "220.46", # Example
             "data_aprovacao": "2025-05-23"
         }
         test_output = "/home/ubuntu/fininvest/credit_approval_proof_example.pdf"
@@ -1,31 +1,21 @@
 import sys
 import os
-from fpdf import FPDF
+from pdf_base import FininvestPDF
+from pdf_output import write_pdf
+import instrumentation
+from amortization import instalment_text
+from layout_cache import static_multi_cell
 from datetime import datetime
 
-class PDFLoanContract(FPDF):
+class PDFLoanContract(FininvestPDF):
+    title_text = "Contrato de Mútuo (Empréstimo)"
+    title_font_size = 16
+
     def __init__(self, contract_data={}, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.contract_data = contract_data
         self.line_height = 5 # Smaller line height for dense text
         self.body_font_size = 10
-        self.footer_text = "Fininvest - Gestão de Microcrédito"
-
-    def header(self):
-        self.set_font("Helvetica", "B", 16)
-        title = "Contrato de Mútuo (Empréstimo)"
-        title_w = self.get_string_width(title) + 6
-        doc_w = self.w
-        self.set_x((doc_w - title_w) / 2)
-        self.cell(title_w, 10, title, border=0, ln=1, align="C", fill=0)
-        self.ln(10)
-
-    def footer(self):
-        self.set_y(-15)
-        self.set_font("Helvetica", "I", 8)
-        self.set_text_color(128)
-        self.cell(0, 10, f"Página {self.page_no()}", align="C")
-        self.cell(0, 10, self.footer_text, align="R")
 
     def add_section_title(self, title):
         self.set_font("Helvetica", "B", 12)
@@ -37,11 +27,15 @@ class PDFLoanContract(FPDF):
         self.multi_cell(0, self.line_height, text, align="J") # Justify text
         self.ln(self.line_height / 2)
 
-    def add_key_value(self, key, value):
-        self.set_font("Helvetica", "B", self.body_font_size)
-        self.cell(50, self.line_height, f"{key}:")
+    def add_static_paragraph(self, text):
+        # For clause text without per-client values: line breaking is cached across documents
         self.set_font("Helvetica", "", self.body_font_size)
-        self.multi_cell(0, self.line_height, str(value), ln=1)
+        static_multi_cell(self, 0, self.line_height, text, align="J")
+        self.ln(self.line_height / 2)
+
+    def valor_prestacao(self):
+        # Derived from the loan terms (see amortization.py) unless the caller passes it
+        return self.contract_data.get("valor_prestacao") or instalment_text(self.contract_data) or "N/A"
 
     def print_contract(self):
         self.add_page()
@@ -60,7 +54,7 @@ class PDFLoanContract(FPDF):
 
         # Loan Details
         self.add_section_title("Objeto do Contrato")
-        self.add_paragraph(
+        self.add_static_paragraph(
             "Pelo presente contrato, o Mutuante concede ao Mutuário, a título de mútuo (empréstimo), "
             "a quantia infra indicada, nos termos e condições seguintes:"
         )
@@ -76,14 +70,14 @@ class PDFLoanContract(FPDF):
         self.add_section_title("Condições de Reembolso")
         self.add_paragraph(
             f"O reembolso do capital e juros será efetuado em {self.contract_data.get("prazo_meses", "0")} prestações mensais, constantes e sucessivas, "
-            f"no valor de {self.contract_data.get("valor_prestacao", "N/A")} EUR cada, vencendo-se a primeira em {self.contract_data.get("data_primeira_prestacao", "N/A")} "
+            f"no valor de {self.valor_prestacao()} EUR cada, vencendo-se a primeira em {self.contract_data.get("data_primeira_prestacao", "N/A")} "
             "e as seguintes em igual dia dos meses subsequentes."
         )
-        self.add_paragraph(
+        self.add_static_paragraph(
             "O pagamento será efetuado por [Método de Pagamento - e.g., Débito Direto na conta com IBAN X, Transferência para IBAN Y] até ao dia de vencimento de cada prestação."
         )
         # Add clause about late payments (example)
-        self.add_paragraph(
+        self.add_static_paragraph(
             "Em caso de mora no pagamento de qualquer prestação, serão devidos juros de mora à taxa legal em vigor sobre o montante em dívida, "
             "sem prejuízo do direito do Mutuante de exigir o cumprimento integral do contrato ou a sua resolução."
         )
@@ -97,9 +91,9 @@ class PDFLoanContract(FPDF):
 
         # Other Clauses (Placeholders)
         self.add_section_title("Outras Cláusulas")
-        self.add_paragraph("1. Comunicações: Todas as comunicações relativas a este contrato deverão ser feitas por escrito para os contactos indicados.")
-        self.add_paragraph("2. Lei Aplicável e Foro: O presente contrato rege-se pela lei portuguesa. Para a resolução de quaisquer litígios emergentes, é competente o foro da comarca de [Localidade], com expressa renúncia a qualquer outro.")
-        self.add_paragraph("3. Proteção de Dados: Os dados pessoais recolhidos serão tratados pela Fininvest para gestão do contrato, nos termos da legislação aplicável.")
+        self.add_static_paragraph("1. Comunicações: Todas as comunicações relativas a este contrato deverão ser feitas por escrito para os contactos indicados.")
+        self.add_static_paragraph("2. Lei Aplicável e Foro: O presente contrato rege-se pela lei portuguesa. Para a resolução de quaisquer litígios emergentes, é competente o foro da comarca de [Localidade], com expressa renúncia a qualquer outro.")
+        self.add_static_paragraph("3. Proteção de Dados: Os dados pessoais recolhidos serão tratados pela Fininvest para gestão do contrato, nos termos da legislação aplicável.")
         self.ln(10)
 
         # Signatures
@@ -123,16 +117,24 @@ class PDFLoanContract(FPDF):
         self.cell(col_width, self.line_height, f"Data: {self.contract_data.get("data_assinatura", "____/____/______")}", align="C")
         self.ln()
 
-def generate_pdf(output_path, contract_data):
+def build_pdf(contract_data, issued_at=None):
     pdf = PDFLoanContract(contract_data)
+    if issued_at:
+        pdf.set_issued_at(issued_at)
     pdf.set_title(f"Contrato Empréstimo {contract_data.get("loan_id", "")}")
     pdf.set_author("Fininvest Platform")
     pdf.print_contract()
-    pdf.output(output_path)
-    print(f"PDF loan contract generated successfully at: {output_path}")
+    return pdf
+
+def render_bytes(contract_data, issued_at=None):
+    return build_pdf(contract_data, issued_at=issued_at).output_bytes()
+
+def generate_pdf(output_path, contract_data, issued_at=None):
+    write_pdf(render_bytes(contract_data, issued_at=issued_at), output_path, "loan contract")
 
 if __name__ == "__main__":
     if len(sys.argv) > 2:
+        instrumentation.begin("loan_contract")
         output_filename = sys.argv[1]
         import json
         try:
@@ -141,9 +143,9 @@ if __name__ == "__main__":
             if not isinstance(contract_data, dict):
                  raise ValueError("Contract data must be a JSON object.")
         except (IndexError, json.JSONDecodeError, ValueError) as e:
-            print(f"Error processing contract data: {e}")
-            print("Expected JSON string as 2nd argument: ")
-            print(json.dumps({"loan_id": "L005", "mutuario_nome": "Cliente X", "valor_aprovado": "5000.00", "..."}))
+            print(f"Error processing contract data: {e}", file=sys.stderr)
+            print("Expected JSON string as 2nd argument: ", file=sys.stderr)
+            print(json.dumps({"loan_id": "L005", "mutuario_nome": "Cliente X", "valor_aprovado": "5000.00", "...": "..."}), file=sys.stderr)
             sys.exit(1)
         
         output_dir = os.path.dirname(output_filename)
@@ -152,7 +154,7 @@ if __name__ == "__main__":
 
         generate_pdf(output_filename, contract_data)
     else:
-        print("Usage: python generate_loan_contract.py <output_path> <json_contract_data>")
+        print("Usage: python generate_loan_contract.py <output_path|-> <json_contract_data>", file=sys.stderr)
         # Example default generation for testing
         test_data = {
             "loan_id": "L005-Test",
@@ -169,7 +171,7 @@ if __name__ == "__main__":
             "finalidade": "Renovação da cozinha",
             "data_aprovacao": "2025-05-23",
             "data_desembolso": "2025-05-24",
-            "valor_prestacao": "220.46", # Example, should be calculated
+            "metodo_amortizacao": "french", # valor_prestacao is calculated from the loan terms
             "data_primeira_prestacao": "2025-06-24",
             "garantias": "Nenhuma específica.",
             "data_assinatura": "____/____/______"
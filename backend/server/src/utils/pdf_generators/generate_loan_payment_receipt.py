@@ -1,24 +1,12 @@
 import sys
 import os
-from fpdf import FPDF
+from pdf_base import FininvestPDF
+from pdf_output import write_pdf
+import instrumentation
 from datetime import datetime
 
-class PDFLoanPaymentReceipt(FPDF):
-    def header(self):
-        self.set_font("Helvetica", "B", 15)
-        title = "Recibo de Pagamento de Prestação"
-        title_w = self.get_string_width(title) + 6
-        doc_w = self.w
-        self.set_x((doc_w - title_w) / 2)
-        self.cell(title_w, 10, title, border=0, ln=1, align="C", fill=0)
-        self.ln(10)
-
-    def footer(self):
-        self.set_y(-15)
-        self.set_font("Helvetica", "I", 8)
-        self.set_text_color(128)
-        self.cell(0, 10, f"Página {self.page_no()}", align="C")
-        self.cell(0, 10, "Fininvest - Gestão de Microcrédito", align="R")
+class PDFLoanPaymentReceipt(FininvestPDF):
+    title_text = "Recibo de Pagamento de Prestação"
 
     def chapter_title(self, title):
         self.set_font("Helvetica", "B", 12)
@@ -28,10 +16,7 @@ class PDFLoanPaymentReceipt(FPDF):
     def chapter_body(self, data):
         self.set_font("Helvetica", "", 11)
         for key, value in data.items():
-             self.set_font("Helvetica", "B", 11)
-             self.cell(50, 7, f"{key}:") # Fixed width for key
-             self.set_font("Helvetica", "", 11)
-             self.multi_cell(0, 7, str(value), ln=1) # Value takes remaining width
+             self.add_key_value(key, value)
         self.ln()
 
     def print_receipt(self, receipt_data):
@@ -39,16 +24,24 @@ class PDFLoanPaymentReceipt(FPDF):
         self.chapter_title("Detalhes do Pagamento da Prestação")
         self.chapter_body(receipt_data)
 
-def generate_pdf(output_path, receipt_data):
+def build_pdf(receipt_data, issued_at=None):
     pdf = PDFLoanPaymentReceipt()
+    if issued_at:
+        pdf.set_issued_at(issued_at)
     pdf.set_title(f"Recibo Prestação {receipt_data.get("Nº Prestação", "")}")
     pdf.set_author("Fininvest Platform")
     pdf.print_receipt(receipt_data)
-    pdf.output(output_path)
-    print(f"PDF loan payment receipt generated successfully at: {output_path}")
+    return pdf
+
+def render_bytes(receipt_data, issued_at=None):
+    return build_pdf(receipt_data, issued_at=issued_at).output_bytes()
+
+def generate_pdf(output_path, receipt_data, issued_at=None):
+    write_pdf(render_bytes(receipt_data, issued_at=issued_at), output_path, "loan payment receipt")
 
 if __name__ == "__main__":
     if len(sys.argv) > 1:
+        instrumentation.begin("loan_payment_receipt")
         output_filename = sys.argv[1]
         data = {}
         i = 2
@@ -64,7 +57,7 @@ if __name__ == "__main__":
 
         generate_pdf(output_filename, data)
     else:
-        print("Usage: python generate_loan_payment_receipt.py <output_path> [key1 value1 key2 value2 ...]")
+        print("Usage: python generate_loan_payment_receipt.py <output_path|-> [key1 value1 key2 value2 ...]", file=sys.stderr)
         # Example default generation for testing
         test_data = {
             "Recibo Nº": "LP202505-001",
@@ -1,9 +1,22 @@
 import sys
 import os
-from fpdf import FPDF
-from datetime import datetime
+from pdf_base import FininvestPDF
+from table_layout import TableLayout
+from pdf_output import write_pdf, stream_pdf
+import instrumentation
+import amortization
+import statement_append
+from statement_summary import LoanStatementSummary, batched, format_cents
+
+class PDFLoanStatement(FininvestPDF):
+    title_text = "Extrato de Empréstimo"
+    title_spacing = 5
+    doc_type = "loan_statement"
+    # Embed the state statement_append.py needs to add rows to this file later
+    appendable = False
+    # Header, table header and footer text drawn once per document, as form XObjects
+    reuse_furniture = True
 
-class PDFLoanStatement(FPDF):
     def __init__(self, client_name="", loan_id="", period_start="", period_end="", loan_details={}, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.client_name = client_name
@@ -11,17 +24,22 @@ class PDFLoanStatement(FPDF):
         self.period_start = period_start
         self.period_end = period_end
         self.loan_details = loan_details # Dict with Amount, Rate, Term etc.
-        self.col_widths = [25, 35, 60, 25, 25, 20] # Due Date, Payment Date, Description, Principal, Interest, Status
         self.line_height = 7
+        # Widths until fitted to the first rows (Due Date, Payment Date, Description, Principal, Interest, Status);
+        # the description column wraps
+        self.table = TableLayout(
+            self,
+            ["Vencimento", "Data Pag.", "Descrição", "Capital", "Juros", "Estado"],
+            ["C", "C", "L", "R", "R", "C"], # Dates and status centred, Principal/Interest right
+            [25, 35, 60, 25, 25, 20],
+            wrap_column=2,
+            font_size=8,
+            header_font_size=9,
+        )
+        self.col_widths = self.table.widths
 
-    def header(self):
-        self.set_font("Helvetica", "B", 15)
-        title = "Extrato de Empréstimo"
-        title_w = self.get_string_width(title) + 6
+    def header_details(self):
         doc_w = self.w
-        self.set_x((doc_w - title_w) / 2)
-        self.cell(title_w, 10, title, border=0, ln=1, align="C", fill=0)
-        self.ln(5)
         self.set_font("Helvetica", "", 11)
         self.cell(0, 6, f"Cliente: {self.client_name}", ln=1)
         self.cell(0, 6, f"Empréstimo ID: {self.loan_id}", ln=1)
@@ -35,74 +53,135 @@ class PDFLoanStatement(FPDF):
         details_str = f"Valor Aprovado: {self.loan_details.get("amount_approved", "N/A")} EUR | Taxa Juro: {self.loan_details.get("interest_rate", "N/A")} % | Prazo: {self.loan_details.get("repayment_term_months", "N/A")} meses"
         self.multi_cell(0, 5, details_str, ln=1)
         self.ln(10)
-        # Table Header
-        self.set_font("Helvetica", "B", 9) # Smaller font for more columns
-        self.set_fill_color(230, 230, 230)
-        headers = ["Vencimento", "Data Pag.", "Descrição", "Capital", "Juros", "Estado"]
-        for i, header in enumerate(headers):
-            self.cell(self.col_widths[i], self.line_height, header, border=1, align="C", fill=1)
-        self.ln()
+        # The table's column headers are drawn by self.table above the first row of each page
 
-    def footer(self):
-        self.set_y(-15)
-        self.set_font("Helvetica", "I", 8)
-        self.set_text_color(128)
-        self.cell(0, 10, f"Página {self.page_no()}", align="C")
-        self.cell(0, 10, f"Emitido em: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}", align="L")
-        self.cell(0, 10, "Fininvest - Gestão de Microcrédito", align="R")
+    def footer_details(self):
+        self.cell(0, 10, f"Emitido em: {self.issued_at_text()}", align="L")
 
     def add_table_row(self, row_data):
-        self.set_font("Helvetica", "", 8) # Smaller font for table content
-        if len(row_data) != len(self.col_widths):
-            print(f"Warning: Row data length mismatch. Expected {len(self.col_widths)}, got {len(row_data)}")
-            return
-            
-        if self.get_y() + self.line_height > self.page_break_trigger:
-            self.add_page(self.cur_orientation)
-
-        for i, item in enumerate(row_data):
-            align = "L"
-            if i == 3 or i == 4: # Align numeric columns (Principal, Interest) to the right
-                align = "R"
-            elif i == 0 or i == 1 or i == 5: # Center dates and status
-                 align = "C"
-            self.cell(self.col_widths[i], self.line_height, str(item), border=1, align=align)
-        self.ln()
+        self.table.add_row(row_data)
 
     def print_statement(self, statement_data):
         self.add_page()
-        # statement_data should be a list of lists/tuples: 
+        # statement_data should be an iterable of lists/tuples (a list, or rows streamed from row_sources):
         # [ [due_date, payment_date, description, principal, interest, status], ... ]
-        for row in statement_data:
-            self.add_table_row(row)
-        
-        # Add summary/totals if needed
-        # Example: Calculate total paid, remaining balance
-        # total_principal_paid = sum(float(row[3]) for row in statement_data if row[5] == "paid" and row[3])
-        # total_interest_paid = sum(float(row[4]) for row in statement_data if row[5] == "paid" and row[4])
-        # remaining_principal = float(self.loan_details.get("amount_approved", 0)) - total_principal_paid
-        # self.ln(5)
-        # self.set_font("Helvetica", "B", 10)
-        # self.cell(sum(self.col_widths[:3]), self.line_height, "Total Capital Pago:", border=0, align="R")
-        # self.cell(self.col_widths[3], self.line_height, f"{total_principal_paid:.2f}", border=1, align="R")
-        # self.ln()
-        # self.cell(sum(self.col_widths[:4]), self.line_height, "Total Juros Pago:", border=0, align="R")
-        # self.cell(self.col_widths[4], self.line_height, f"{total_interest_paid:.2f}", border=1, align="R")
-        # self.ln()
-        # self.cell(sum(self.col_widths[:3]), self.line_height, "Saldo Capital Devedor:", border=0, align="R")
-        # self.cell(self.col_widths[3], self.line_height, f"{remaining_principal:.2f}", border=1, align="R")
-        # self.ln()
-
-def generate_pdf(output_path, client_name, loan_id, period_start, period_end, loan_details, statement_data):
+        # or None to derive the rows from loan_details with the amortization engine
+        if statement_data is None:
+            statement_data = amortization.statement_rows(self.loan_details, self.period_start, self.period_end)
+        self.continue_statement(statement_data, self.new_summary())
+
+    def new_summary(self):
+        return LoanStatementSummary(self.loan_details.get("amount_approved", 0))
+
+    def continue_statement(self, statement_data, summary):
+        # Rows from the current position on, then the summary block. statement_append.py
+        # calls this with the summary of an existing statement to add rows to it.
+        self.table.begin()
+        for batch in batched(statement_data):
+            rows = summary.process(batch)
+            if not self.table.fitted:
+                self.table.fit(rows)
+            for row in rows:
+                self.add_table_row(row)
+        if not summary.rows:
+            self.table.ensure_header()
+
+        if self.appendable:
+            statement_append.record_state(self, summary)
+        if summary.rows:
+            summary.check()
+            self.print_summary(summary)
+
+    def statement_args(self):
+        # new_pdf() arguments that recreate this document's header
+        return {
+            "client_name": self.client_name,
+            "loan_id": self.loan_id,
+            "period_start": self.period_start,
+            "period_end": self.period_end,
+            "loan_details": self.loan_details,
+        }
+
+    def print_summary(self, summary):
+        # Totals over the paid instalments and the principal still owed
+        self.ln(5)
+        self.set_font("Helvetica", "B", 10)
+        self.cell(sum(self.col_widths[:3]), self.line_height, "Total Capital Pago:", border=0, align="R")
+        self.cell(self.col_widths[3], self.line_height, format_cents(summary.principal_paid), border=1, align="R")
+        self.ln()
+        self.cell(sum(self.col_widths[:4]), self.line_height, "Total Juros Pago:", border=0, align="R")
+        self.cell(self.col_widths[4], self.line_height, format_cents(summary.interest_paid), border=1, align="R")
+        self.ln()
+        if summary.remaining_principal is not None:
+            self.cell(sum(self.col_widths[:3]), self.line_height, "Saldo Capital Devedor:", border=0, align="R")
+            self.cell(self.col_widths[3], self.line_height, format_cents(summary.remaining_principal), border=1, align="R")
+            self.ln()
+
+def new_pdf(client_name, loan_id, period_start, period_end, loan_details, issued_at=None, appendable=False):
     pdf = PDFLoanStatement(client_name, loan_id, period_start, period_end, loan_details)
+    pdf.appendable = appendable
+    if issued_at:
+        pdf.set_issued_at(issued_at)
     pdf.set_title(f"Extrato Empréstimo {loan_id} {period_start}-{period_end}")
     pdf.set_author("Fininvest Platform")
+    return pdf
+
+def build_pdf(client_name, loan_id, period_start, period_end, loan_details, statement_data=None, issued_at=None, appendable=False):
+    pdf = new_pdf(client_name, loan_id, period_start, period_end, loan_details, issued_at=issued_at, appendable=appendable)
     pdf.print_statement(statement_data)
-    pdf.output(output_path)
-    print(f"PDF loan statement generated successfully at: {output_path}")
+    return pdf
+
+def _rows(loan_details, period_start, period_end, statement_data):
+    # As print_statement: no rows means the schedule derived from the loan details
+    if statement_data is None:
+        return amortization.statement_rows(loan_details, period_start, period_end)
+    return statement_data
+
+def render_bytes(client_name, loan_id, period_start, period_end, loan_details, statement_data=None, issued_at=None, appendable=False, workers=None):
+    if workers and workers > 1 and not appendable:
+        import io
+        import parallel_statement
+        f = io.BytesIO()
+        args = {"client_name": client_name, "loan_id": loan_id, "period_start": period_start, "period_end": period_end, "loan_details": loan_details}
+        parallel_statement.render_parallel("loan_statement", f, args, _rows(loan_details, period_start, period_end, statement_data), issued_at, workers)
+        return f.getvalue()
+    return build_pdf(client_name, loan_id, period_start, period_end, loan_details, statement_data, issued_at=issued_at, appendable=appendable).output_bytes()
+
+def generate_pdf(output_path, client_name, loan_id, period_start, period_end, loan_details, statement_data=None, issued_at=None, stream=False, appendable=False, workers=None):
+    if workers and workers > 1 and not appendable:
+        # Page ranges laid out in worker processes and written in order
+        import parallel_statement
+        args = {"client_name": client_name, "loan_id": loan_id, "period_start": period_start, "period_end": period_end, "loan_details": loan_details}
+        parallel_statement.write_parallel("loan_statement", output_path, args, _rows(loan_details, period_start, period_end, statement_data), issued_at, workers, "loan statement")
+        return
+    if stream:
+        # Bounded memory: pages are written as they are finished
+        pdf = new_pdf(client_name, loan_id, period_start, period_end, loan_details, issued_at=issued_at, appendable=appendable)
+        stream_pdf(pdf, lambda: pdf.print_statement(statement_data), output_path, "loan statement")
+        return
+    write_pdf(render_bytes(client_name, loan_id, period_start, period_end, loan_details, statement_data, issued_at=issued_at, appendable=appendable), output_path, "loan statement")
 
 if __name__ == "__main__":
+    # --stream writes pages out as they are finished instead of holding the whole document in memory
+    stream = "--stream" in sys.argv
+    if stream:
+        sys.argv.remove("--stream")
+    # --appendable lets statement_append.py add next month's rows to the file
+    appendable = "--appendable" in sys.argv
+    if appendable:
+        sys.argv.remove("--appendable")
+    # --workers N lays out page ranges of the statement in N processes (see parallel_statement.py)
+    workers = None
+    if "--workers" in sys.argv:
+        index = sys.argv.index("--workers")
+        try:
+            workers = int(sys.argv[index + 1])
+        except (IndexError, ValueError):
+            print("Error: --workers expects a number of processes", file=sys.stderr)
+            sys.exit(1)
+        del sys.argv[index:index + 2]
     if len(sys.argv) > 6:
+        instrumentation.begin("loan_statement")
         output_filename = sys.argv[1]
         client_name = sys.argv[2]
         loan_id = sys.argv[3]
@@ -112,22 +191,33 @@ if __name__ == "__main__":
         try:
             loan_details_json = sys.argv[6]
             loan_details = json.loads(loan_details_json)
-            statement_data_json = sys.argv[7]
-            statement_data = json.loads(statement_data_json)
-            if not isinstance(statement_data, list) or not isinstance(loan_details, dict):
-                 raise ValueError("Loan details must be JSON object, statement data must be JSON array.")
-        except (IndexError, json.JSONDecodeError, ValueError) as e:
-            print(f"Error processing input data: {e}")
-            print("Expected JSON string for loan details (arg 6) and statement data (arg 7)")
+            if len(sys.argv) > 7 and sys.argv[7] == "--rows":
+                from row_sources import iter_rows, parse_rows_args
+                # --period-column keeps only the rows dated within period_start..period_end
+                statement_data = iter_rows(**parse_rows_args(sys.argv[7:]), period=(period_start, period_end))
+            elif len(sys.argv) > 7:
+                statement_data_json = sys.argv[7]
+                statement_data = json.loads(statement_data_json)
+                if not isinstance(statement_data, list):
+                     raise ValueError("Statement data must be JSON array.")
+            else:
+                # No rows given: derived from the loan details (amount, rate, term, first_due_date)
+                statement_data = None
+            if not isinstance(loan_details, dict):
+                 raise ValueError("Loan details must be JSON object.")
+        except (IndexError, OSError, json.JSONDecodeError, ValueError) as e:
+            print(f"Error processing input data: {e}", file=sys.stderr)
+            print("Expected JSON string for loan details (arg 6) and statement data (arg 7)", file=sys.stderr)
+            print("or: --rows <path|-> [--format jsonl|csv|arrow] [--header] [--columns a,b,...] [--match column=value] [--period-column column] in place of arg 7 (omit it to derive the rows from the loan details)", file=sys.stderr)
             sys.exit(1)
         
         output_dir = os.path.dirname(output_filename)
         if output_dir and not os.path.exists(output_dir):
              os.makedirs(output_dir)
 
-        generate_pdf(output_filename, client_name, loan_id, period_start, period_end, loan_details, statement_data)
+        generate_pdf(output_filename, client_name, loan_id, period_start, period_end, loan_details, statement_data, stream=stream, appendable=appendable, workers=workers)
     else:
-        print("Usage: python generate_loan_statement.py <output_path> <client_name> <loan_id> <period_start> <period_end> <json_loan_details> <json_statement_data>")
+        print("Usage: python generate_loan_statement.py <output_path|-> <client_name> <loan_id> <period_start> <period_end> <json_loan_details> [json_statement_data | --rows <path|-> [--format jsonl|csv|arrow] [--header] [--columns a,b,...] [--match column=value] [--period-column column]] [--stream] [--appendable] [--workers N]", file=sys.stderr)
         # Example default generation for testing
         test_client = "Nome Exemplo Cliente"
         test_loan_id = "L005"
@@ -1,115 +1,189 @@
 import sys
 import os
-from fpdf import FPDF
-from datetime import datetime
+from pdf_base import FininvestPDF
+from table_layout import TableLayout
+from pdf_output import write_pdf, stream_pdf
+import instrumentation
+import statement_append
+from statement_summary import MemberStatementSummary, batched, format_cents
+
+class PDFMemberStatement(FininvestPDF):
+    title_text = "Extrato de Conta Corrente - Sócio"
+    title_spacing = 5
+    doc_type = "member_statement"
+    # Embed the state statement_append.py needs to add rows to this file later
+    appendable = False
+    # Header, table header and footer text drawn once per document, as form XObjects
+    reuse_furniture = True
 
-class PDFMemberStatement(FPDF):
     def __init__(self, member_name="", period_start="", period_end="", *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.member_name = member_name
         self.period_start = period_start
         self.period_end = period_end
-        self.col_widths = [25, 85, 25, 25, 30] # Date, Description, Debit, Credit, Balance
         self.line_height = 7
+        # Widths until fitted to the first rows (Date, Description, Debit, Credit, Balance);
+        # the description column wraps
+        self.table = TableLayout(
+            self,
+            ["Data", "Descrição", "Débito", "Crédito", "Saldo"],
+            ["L", "L", "R", "R", "R"], # Numeric columns (Debit, Credit, Balance) aligned right
+            [25, 85, 25, 25, 30],
+            wrap_column=1,
+            font_size=9,
+            header_font_size=10,
+        )
+        self.col_widths = self.table.widths
 
-    def header(self):
-        self.set_font("Helvetica", "B", 15)
-        title = "Extrato de Conta Corrente - Sócio"
-        title_w = self.get_string_width(title) + 6
-        doc_w = self.w
-        self.set_x((doc_w - title_w) / 2)
-        self.cell(title_w, 10, title, border=0, ln=1, align="C", fill=0)
-        self.ln(5)
+    def header_details(self):
         self.set_font("Helvetica", "", 11)
         self.cell(0, 6, f"Sócio: {self.member_name}", ln=1)
         self.cell(0, 6, f"Período: {self.period_start} a {self.period_end}", ln=1)
         self.ln(10)
-        # Table Header
-        self.set_font("Helvetica", "B", 10)
-        self.set_fill_color(230, 230, 230)
-        headers = ["Data", "Descrição", "Débito", "Crédito", "Saldo"]
-        for i, header in enumerate(headers):
-            self.cell(self.col_widths[i], self.line_height, header, border=1, align="C", fill=1)
-        self.ln()
+        # The table's column headers are drawn by self.table above the first row of each page
 
-    def footer(self):
-        self.set_y(-15)
-        self.set_font("Helvetica", "I", 8)
-        self.set_text_color(128)
-        self.cell(0, 10, f"Página {self.page_no()}", align="C")
-        self.cell(0, 10, f"Emitido em: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}", align="L")
-        self.cell(0, 10, "Fininvest - Gestão de Microcrédito", align="R")
+    def footer_details(self):
+        self.cell(0, 10, f"Emitido em: {self.issued_at_text()}", align="L")
 
     def add_table_row(self, row_data):
-        self.set_font("Helvetica", "", 9)
-        # Ensure data matches column count
-        if len(row_data) != len(self.col_widths):
-            print(f"Warning: Row data length mismatch. Expected {len(self.col_widths)}, got {len(row_data)}")
-            return
-            
-        # Check page break before drawing row
-        if self.get_y() + self.line_height > self.page_break_trigger:
-            self.add_page(self.cur_orientation)
-
-        # Draw cells
-        for i, item in enumerate(row_data):
-            align = "L"
-            if i >= 2: # Align numeric columns (Debit, Credit, Balance) to the right
-                align = "R"
-            self.cell(self.col_widths[i], self.line_height, str(item), border=1, align=align)
-        self.ln()
+        self.table.add_row(row_data)
 
     def print_statement(self, statement_data):
         self.add_page()
-        # statement_data should be a list of lists/tuples: 
+        # statement_data should be an iterable of lists/tuples (a list, or rows streamed from row_sources):
         # [ [date, description, debit, credit, balance], ... ]
         # Example: [ ["2025-05-01", "Quota Maio", "100.00", "", "900.00"], ["2025-05-15", "Pagamento Quota Maio", "", "100.00", "1000.00"] ]
-        for row in statement_data:
-            self.add_table_row(row)
-        
-        # Add summary/final balance if needed
-        if statement_data:
-            final_balance = statement_data[-1][-1] # Get balance from last row
-            self.ln(5)
-            self.set_font("Helvetica", "B", 11)
-            self.cell(sum(self.col_widths[:4]), self.line_height, "Saldo Final:", border=0, align="R")
-            self.cell(self.col_widths[4], self.line_height, str(final_balance), border=1, align="R")
-            self.ln()
-
-def generate_pdf(output_path, member_name, period_start, period_end, statement_data):
+        # Rows go through the summary in batches: totals and the running balance are computed
+        # per batch (blank balances are filled in), then the rows are drawn
+        self.continue_statement(statement_data, self.new_summary())
+
+    def new_summary(self):
+        return MemberStatementSummary()
+
+    def continue_statement(self, statement_data, summary):
+        # Rows from the current position on, then the summary block. statement_append.py
+        # calls this with the summary of an existing statement to add rows to it.
+        self.table.begin()
+        for batch in batched(statement_data):
+            rows = summary.process(batch)
+            if not self.table.fitted:
+                self.table.fit(rows)
+            for row in rows:
+                self.add_table_row(row)
+        if not summary.rows:
+            self.table.ensure_header()
+
+        if self.appendable:
+            statement_append.record_state(self, summary)
+        if summary.rows:
+            summary.check()
+            self.print_summary(summary)
+
+    def statement_args(self):
+        # new_pdf() arguments that recreate this document's header
+        return {"member_name": self.member_name, "period_start": self.period_start, "period_end": self.period_end}
+
+    def print_summary(self, summary):
+        # Debit/credit totals under their columns, then the computed final balance
+        self.ln(5)
+        self.set_font("Helvetica", "B", 11)
+        self.cell(sum(self.col_widths[:2]), self.line_height, "Totais:", border=0, align="R")
+        self.cell(self.col_widths[2], self.line_height, format_cents(summary.total_debit), border=1, align="R")
+        self.cell(self.col_widths[3], self.line_height, format_cents(summary.total_credit), border=1, align="R")
+        self.ln()
+        self.cell(sum(self.col_widths[:4]), self.line_height, "Saldo Final:", border=0, align="R")
+        self.cell(self.col_widths[4], self.line_height, format_cents(summary.balance), border=1, align="R")
+        self.ln()
+
+def new_pdf(member_name, period_start, period_end, issued_at=None, appendable=False):
     pdf = PDFMemberStatement(member_name, period_start, period_end)
+    pdf.appendable = appendable
+    if issued_at:
+        pdf.set_issued_at(issued_at)
     pdf.set_title(f"Extrato Sócio {member_name} {period_start}-{period_end}")
     pdf.set_author("Fininvest Platform")
+    return pdf
+
+def build_pdf(member_name, period_start, period_end, statement_data, issued_at=None, appendable=False):
+    pdf = new_pdf(member_name, period_start, period_end, issued_at=issued_at, appendable=appendable)
     pdf.print_statement(statement_data)
-    pdf.output(output_path)
-    print(f"PDF member statement generated successfully at: {output_path}")
+    return pdf
+
+def render_bytes(member_name, period_start, period_end, statement_data, issued_at=None, appendable=False, workers=None):
+    if workers and workers > 1 and not appendable:
+        import io
+        import parallel_statement
+        f = io.BytesIO()
+        args = {"member_name": member_name, "period_start": period_start, "period_end": period_end}
+        parallel_statement.render_parallel("member_statement", f, args, statement_data, issued_at, workers)
+        return f.getvalue()
+    return build_pdf(member_name, period_start, period_end, statement_data, issued_at=issued_at, appendable=appendable).output_bytes()
+
+def generate_pdf(output_path, member_name, period_start, period_end, statement_data, issued_at=None, stream=False, appendable=False, workers=None):
+    if workers and workers > 1 and not appendable:
+        # Page ranges laid out in worker processes and written in order
+        import parallel_statement
+        args = {"member_name": member_name, "period_start": period_start, "period_end": period_end}
+        parallel_statement.write_parallel("member_statement", output_path, args, statement_data, issued_at, workers, "member statement")
+        return
+    if stream:
+        # Bounded memory: pages are written as they are finished
+        pdf = new_pdf(member_name, period_start, period_end, issued_at=issued_at, appendable=appendable)
+        stream_pdf(pdf, lambda: pdf.print_statement(statement_data), output_path, "member statement")
+        return
+    write_pdf(render_bytes(member_name, period_start, period_end, statement_data, issued_at=issued_at, appendable=appendable), output_path, "member statement")
 
 if __name__ == "__main__":
+    # --stream writes pages out as they are finished instead of holding the whole document in memory
+    stream = "--stream" in sys.argv
+    if stream:
+        sys.argv.remove("--stream")
+    # --appendable lets statement_append.py add next month's rows to the file
+    appendable = "--appendable" in sys.argv
+    if appendable:
+        sys.argv.remove("--appendable")
+    # --workers N lays out page ranges of the statement in N processes (see parallel_statement.py)
+    workers = None
+    if "--workers" in sys.argv:
+        index = sys.argv.index("--workers")
+        try:
+            workers = int(sys.argv[index + 1])
+        except (IndexError, ValueError):
+            print("Error: --workers expects a number of processes", file=sys.stderr)
+            sys.exit(1)
+        del sys.argv[index:index + 2]
     # Example Usage: Called from Node.js via child_process (passing JSON might be better)
     if len(sys.argv) > 4:
+        instrumentation.begin("member_statement")
         output_filename = sys.argv[1]
         member_name = sys.argv[2]
         period_start = sys.argv[3]
         period_end = sys.argv[4]
-        # Expecting data as a JSON string in the 5th argument
+        # Expecting data as a JSON string in the 5th argument, or rows streamed with --rows <path|->
         import json
         try:
-            statement_data_json = sys.argv[5]
-            statement_data = json.loads(statement_data_json)
-            if not isinstance(statement_data, list):
-                 raise ValueError("Statement data must be a JSON array of arrays.")
-        except (IndexError, json.JSONDecodeError, ValueError) as e:
-            print(f"Error processing statement data: {e}")
-            print("Expected JSON string as 5th argument: '[["date", "desc", "debit", "credit", "balance"], ...]' ")
+            if len(sys.argv) > 5 and sys.argv[5] == "--rows":
+                from row_sources import iter_rows, parse_rows_args
+                # --period-column keeps only the rows dated within period_start..period_end
+                statement_data = iter_rows(**parse_rows_args(sys.argv[5:]), period=(period_start, period_end))
+            else:
+                statement_data_json = sys.argv[5]
+                statement_data = json.loads(statement_data_json)
+                if not isinstance(statement_data, list):
+                     raise ValueError("Statement data must be a JSON array of arrays.")
+        except (IndexError, OSError, json.JSONDecodeError, ValueError) as e:
+            print(f"Error processing statement data: {e}", file=sys.stderr)
+            print("Expected JSON string as 5th argument: '[[\"date\", \"desc\", \"debit\", \"credit\", \"balance\"], ...]' ", file=sys.stderr)
+            print("or: --rows <path|-> [--format jsonl|csv|arrow] [--header] [--columns a,b,...] [--match column=value] [--period-column column]", file=sys.stderr)
             sys.exit(1)
         
         output_dir = os.path.dirname(output_filename)
         if output_dir and not os.path.exists(output_dir):
              os.makedirs(output_dir)
 
-        generate_pdf(output_filename, member_name, period_start, period_end, statement_data)
+        generate_pdf(output_filename, member_name, period_start, period_end, statement_data, stream=stream, appendable=appendable, workers=workers)
     else:
-        print("Usage: python generate_member_statement.py <output_path> <member_name> <period_start> <period_end> <json_statement_data>")
+        print("Usage: python generate_member_statement.py <output_path|-> <member_name> <period_start> <period_end> <json_statement_data | --rows <path|-> [--format jsonl|csv|arrow] [--header] [--columns a,b,...] [--match column=value] [--period-column column]> [--stream] [--appendable] [--workers N]", file=sys.stderr)
         # Example default generation for testing
         test_member = "Nome Exemplo Sócio"
         test_start = "2025-01-01"
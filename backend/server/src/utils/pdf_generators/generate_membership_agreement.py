@@ -1,31 +1,20 @@
 import sys
 import os
-from fpdf import FPDF
+from pdf_base import FininvestPDF
+from pdf_output import write_pdf
+import instrumentation
+from layout_cache import static_multi_cell
 from datetime import datetime
 
-class PDFMembershipAgreement(FPDF):
+class PDFMembershipAgreement(FininvestPDF):
+    title_text = "Termo de Adesão ao Fundo"
+    title_font_size = 16
+
     def __init__(self, member_data={}, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.member_data = member_data
         self.line_height = 5
         self.body_font_size = 10
-        self.footer_text = "Fininvest - Gestão de Microcrédito"
-
-    def header(self):
-        self.set_font("Helvetica", "B", 16)
-        title = "Termo de Adesão ao Fundo"
-        title_w = self.get_string_width(title) + 6
-        doc_w = self.w
-        self.set_x((doc_w - title_w) / 2)
-        self.cell(title_w, 10, title, border=0, ln=1, align="C", fill=0)
-        self.ln(10)
-
-    def footer(self):
-        self.set_y(-15)
-        self.set_font("Helvetica", "I", 8)
-        self.set_text_color(128)
-        self.cell(0, 10, f"Página {self.page_no()}", align="C")
-        self.cell(0, 10, self.footer_text, align="R")
 
     def add_section_title(self, title):
         self.set_font("Helvetica", "B", 12)
@@ -37,11 +26,11 @@ class PDFMembershipAgreement(FPDF):
         self.multi_cell(0, self.line_height, text, align="J")
         self.ln(self.line_height / 2)
 
-    def add_key_value(self, key, value):
-        self.set_font("Helvetica", "B", self.body_font_size)
-        self.cell(50, self.line_height, f"{key}:")
+    def add_static_paragraph(self, text):
+        # For clause text without per-client values: line breaking is cached across documents
         self.set_font("Helvetica", "", self.body_font_size)
-        self.multi_cell(0, self.line_height, str(value), ln=1)
+        static_multi_cell(self, 0, self.line_height, text, align="J")
+        self.ln(self.line_height / 2)
 
     def print_agreement(self):
         self.add_page()
@@ -62,7 +51,7 @@ class PDFMembershipAgreement(FPDF):
             f"Eu, {self.member_data.get("nome_completo", "[Nome do Sócio]")}, acima identificado, declaro por minha honra que tomei conhecimento "
             "dos Estatutos e Regulamento Interno do Fundo Fininvest (doravante designado Fundo), os quais aceito integralmente e me comprometo a cumprir."
         )
-        self.add_paragraph(
+        self.add_static_paragraph(
             "Declaro ainda que adiro voluntariamente ao Fundo na qualidade de Sócio, comprometendo-me a:"
         )
         self.set_left_margin(self.l_margin + 10)
@@ -72,16 +61,16 @@ class PDFMembershipAgreement(FPDF):
         self.add_paragraph(
             f"b) Pagar pontualmente a quota mensal estabelecida, no valor atual de {self.member_data.get("quota_mensal", "[Valor]")} EUR, ou outro que venha a ser fixado nos termos regulamentares."
         )
-        self.add_paragraph(
+        self.add_static_paragraph(
             "c) Participar ativamente nas atividades e deliberações do Fundo, sempre que possível."
         )
-        self.add_paragraph(
+        self.add_static_paragraph(
             "d) Informar o Fundo sobre quaisquer alterações aos meus dados de contacto."
         )
         self.set_left_margin(self.l_margin) # Reset margin
         self.ln(5)
         
-        self.add_paragraph(
+        self.add_static_paragraph(
             "Tenho conhecimento que a qualidade de sócio confere direitos e deveres, incluindo o acesso a potenciais benefícios como empréstimos em condições favoráveis "
             "e participação nos resultados do Fundo, mas também implica responsabilidade solidária nos termos definidos nos Estatutos."
         )
@@ -108,16 +97,24 @@ class PDFMembershipAgreement(FPDF):
         self.cell(col_width, self.line_height, f"Data: {self.member_data.get("data_assinatura", "____/____/______")}", align="C")
         self.ln()
 
-def generate_pdf(output_path, member_data):
+def build_pdf(member_data, issued_at=None):
     pdf = PDFMembershipAgreement(member_data)
+    if issued_at:
+        pdf.set_issued_at(issued_at)
     pdf.set_title(f"Termo Adesão {member_data.get("nome_completo", "")}")
     pdf.set_author("Fininvest Platform")
     pdf.print_agreement()
-    pdf.output(output_path)
-    print(f"PDF membership agreement generated successfully at: {output_path}")
+    return pdf
+
+def render_bytes(member_data, issued_at=None):
+    return build_pdf(member_data, issued_at=issued_at).output_bytes()
+
+def generate_pdf(output_path, member_data, issued_at=None):
+    write_pdf(render_bytes(member_data, issued_at=issued_at), output_path, "membership agreement")
 
 if __name__ == "__main__":
     if len(sys.argv) > 2:
+        instrumentation.begin("membership_agreement")
         output_filename = sys.argv[1]
         import json
         try:
@@ -126,9 +123,9 @@ if __name__ == "__main__":
             if not isinstance(member_data, dict):
                  raise ValueError("Member data must be a JSON object.")
         except (IndexError, json.JSONDecodeError, ValueError) as e:
-            print(f"Error processing member data: {e}")
-            print("Expected JSON string as 2nd argument: ")
-            print(json.dumps({"nome_completo": "Maria Teste", "nif": "987654321", "..."}))
+            print(f"Error processing member data: {e}", file=sys.stderr)
+            print("Expected JSON string as 2nd argument: ", file=sys.stderr)
+            print(json.dumps({"nome_completo": "Maria Teste", "nif": "987654321", "...": "..."}), file=sys.stderr)
             sys.exit(1)
         
         output_dir = os.path.dirname(output_filename)
@@ -137,7 +134,7 @@ if __name__ == "__main__":
 
         generate_pdf(output_filename, member_data)
     else:
-        print("Usage: python generate_membership_agreement.py <output_path> <json_member_data>")
+        print("Usage: python generate_membership_agreement.py <output_path|-> <json_member_data>", file=sys.stderr)
         # Example default generation for testing
         test_data = {
             "nome_completo": "Maria Santos (Teste)",
@@ -1,37 +1,15 @@
 import sys
 import os
-from fpdf import FPDF
+from pdf_base import FininvestPDF
+from pdf_output import write_pdf
+import instrumentation
 from datetime import datetime
 
 # Ensure the script can find fpdf library (adjust path if necessary)
 # sys.path.append('/path/to/your/python/site-packages') 
 
-class PDFReceipt(FPDF):
-    def header(self):
-        # Add font supporting basic characters + Euro symbol if needed
-        # Using built-in font for simplicity now, consider NotoSansCJK for broader support
-        self.set_font("Helvetica", "B", 15)
-        # Calculate width of title and position
-        title_w = self.get_string_width("Recibo de Pagamento de Quota") + 6
-        doc_w = self.w
-        self.set_x((doc_w - title_w) / 2)
-        # Colors of frame, background and text
-        # self.set_draw_color(0, 80, 180)
-        # self.set_fill_color(230, 230, 0)
-        # self.set_text_color(220, 50, 50)
-        # Thickness of frame (border)
-        # self.set_line_width(1)
-        # Title
-        self.cell(title_w, 10, "Recibo de Pagamento de Quota", border=0, ln=1, align="C", fill=0)
-        # Line break
-        self.ln(10)
-
-    def footer(self):
-        self.set_y(-15)
-        self.set_font("Helvetica", "I", 8)
-        self.set_text_color(128)
-        self.cell(0, 10, f"Página {self.page_no()}", align="C")
-        self.cell(0, 10, "Fininvest - Gestão de Microcrédito", align="R")
+class PDFReceipt(FininvestPDF):
+    title_text = "Recibo de Pagamento de Quota"
 
     def chapter_title(self, title):
         self.set_font("Helvetica", "B", 12)
@@ -50,17 +28,25 @@ class PDFReceipt(FPDF):
         self.chapter_title("Detalhes do Pagamento")
         self.chapter_body(receipt_data)
 
-def generate_pdf(output_path, receipt_data):
+def build_pdf(receipt_data, issued_at=None):
     pdf = PDFReceipt()
+    if issued_at:
+        pdf.set_issued_at(issued_at)
     pdf.set_title(f"Recibo Quota {receipt_data.get("Mês/Ano", "")}")
     pdf.set_author("Fininvest Platform")
     pdf.print_receipt(receipt_data)
-    pdf.output(output_path)
-    print(f"PDF receipt generated successfully at: {output_path}")
+    return pdf
+
+def render_bytes(receipt_data, issued_at=None):
+    return build_pdf(receipt_data, issued_at=issued_at).output_bytes()
+
+def generate_pdf(output_path, receipt_data, issued_at=None):
+    write_pdf(render_bytes(receipt_data, issued_at=issued_at), output_path, "receipt")
 
 if __name__ == "__main__":
     # Example Usage: Called from Node.js via child_process
     if len(sys.argv) > 1:
+        instrumentation.begin("receipt")
         output_filename = sys.argv[1]
         # Expecting data as subsequent arguments (key1 value1 key2 value2 ...)
         # This is a simple way, JSON via stdin might be more robust
@@ -79,7 +65,7 @@ if __name__ == "__main__":
 
         generate_pdf(output_filename, data)
     else:
-        print("Usage: python generate_receipt.py <output_path> [key1 value1 key2 value2 ...]")
+        print("Usage: python generate_receipt.py <output_path|-> [key1 value1 key2 value2 ...]", file=sys.stderr)
         # Example default generation for testing
         test_data = {
             "Recibo Nº": "Q202505-001",
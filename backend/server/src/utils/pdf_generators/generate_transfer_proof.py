@@ -1,23 +1,13 @@
 import sys
 import os
-from fpdf import FPDF
+from pdf_base import FininvestPDF
+from pdf_output import write_pdf
+import instrumentation
 from datetime import datetime
 
-class PDFTransferProof(FPDF):
-    def header(self):
-        self.set_font("Helvetica", "B", 15)
-        title_w = self.get_string_width("Justificativo de Transferência Interna") + 6
-        doc_w = self.w
-        self.set_x((doc_w - title_w) / 2)
-        self.cell(title_w, 10, "Justificativo de Transferência Interna", border=0, ln=1, align="C", fill=0)
-        self.ln(10)
-
-    def footer(self):
-        self.set_y(-15)
-        self.set_font("Helvetica", "I", 8)
-        self.set_text_color(128)
-        self.cell(0, 10, f"Página {self.page_no()}", align="C")
-        self.cell(0, 10, "Fininvest - Gestão de Microcrédito", align="R")
+class PDFTransferProof(FininvestPDF):
+    title_text = "Justificativo de Transferência Interna"
+    key_width = 40
 
     def chapter_title(self, title):
         self.set_font("Helvetica", "B", 12)
@@ -27,11 +17,7 @@ class PDFTransferProof(FPDF):
     def chapter_body(self, data):
         self.set_font("Helvetica", "", 11)
         for key, value in data.items():
-             # Use multi_cell for potentially long descriptions
-             self.set_font("Helvetica", "B", 11)
-             self.cell(40, 7, f"{key}:") # Fixed width for key
-             self.set_font("Helvetica", "", 11)
-             self.multi_cell(0, 7, str(value), ln=1) # Value takes remaining width
+             self.add_key_value(key, value)
         self.ln()
 
     def print_proof(self, proof_data):
@@ -39,16 +25,24 @@ class PDFTransferProof(FPDF):
         self.chapter_title("Detalhes da Transferência")
         self.chapter_body(proof_data)
 
-def generate_pdf(output_path, proof_data):
+def build_pdf(proof_data, issued_at=None):
     pdf = PDFTransferProof()
+    if issued_at:
+        pdf.set_issued_at(issued_at)
     pdf.set_title(f"Justificativo Transferência {proof_data.get("ID Transferência", "")}")
     pdf.set_author("Fininvest Platform")
     pdf.print_proof(proof_data)
-    pdf.output(output_path)
-    print(f"PDF transfer proof generated successfully at: {output_path}")
+    return pdf
+
+def render_bytes(proof_data, issued_at=None):
+    return build_pdf(proof_data, issued_at=issued_at).output_bytes()
+
+def generate_pdf(output_path, proof_data, issued_at=None):
+    write_pdf(render_bytes(proof_data, issued_at=issued_at), output_path, "transfer proof")
 
 if __name__ == "__main__":
     if len(sys.argv) > 1:
+        instrumentation.begin("transfer_proof")
         output_filename = sys.argv[1]
         data = {}
         i = 2
@@ -64,7 +58,7 @@ if __name__ == "__main__":
 
         generate_pdf(output_filename, data)
     else:
-        print("Usage: python generate_transfer_proof.py <output_path> [key1 value1 key2 value2 ...]")
+        print("Usage: python generate_transfer_proof.py <output_path|-> [key1 value1 key2 value2 ...]", file=sys.stderr)
         # Example default generation for testing
         test_data = {
             "ID Transferência": "T001",
@@ -0,0 +1,192 @@
+import os
+import sys
+import json
+import time
+import fcntl
+import contextlib
+
+# Opt-in per-render instrumentation. Each document is timed per phase:
+#   parse     - CLI argument / JSON parsing before the PDF object exists
+#   layout    - print_receipt / print_statement / ... (with per-page timings)
+#   serialise - pdf.output()
+#   write     - writing the bytes to the file or stdout
+# and counts pages, table rows and output bytes (plus "bytes_before" when
+# output compaction is on, see pdf_compact.py).
+#
+# Enable with environment variables:
+#   FININVEST_PDF_METRICS=stderr|<path>   one JSON line per document (to stderr or appended to <path>)
+#   FININVEST_PDF_METRICS_PROM=<path>     Prometheus text-format file for the node exporter textfile collector
+#
+# When neither is set, begin() returns None and nothing is recorded.
+
+PHASES = ("parse", "layout", "serialise", "write")
+
+_active = None
+
+def enabled():
+    return bool(os.environ.get("FININVEST_PDF_METRICS") or os.environ.get("FININVEST_PDF_METRICS_PROM"))
+
+class DocumentMetrics:
+    def __init__(self, doc_type):
+        self.doc_type = doc_type
+        self.started = time.perf_counter()
+        self.phases_ms = {}
+        self.pages = 0
+        self.rows = 0
+        self.bytes = 0
+        # Size before pdf_compact, when output compaction is on
+        self.bytes_before = None
+        self.page_ms = []
+        self._open = {}
+        self._page_started = None
+
+    def start(self, name):
+        self._open[name] = time.perf_counter()
+
+    def stop(self, name):
+        started = self._open.pop(name, None)
+        if started is not None:
+            self.phases_ms[name] = self.phases_ms.get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(name)
+
+    def page_started(self):
+        now = time.perf_counter()
+        if self._page_started is not None:
+            self.page_ms.append((now - self._page_started) * 1000)
+        self._page_started = now
+        self.pages += 1
+
+    def layout_done(self):
+        if self._page_started is not None:
+            self.page_ms.append((time.perf_counter() - self._page_started) * 1000)
+            self._page_started = None
+        self.stop("layout")
+
+    def to_record(self):
+        page_ms = sorted(self.page_ms)
+        record = {
+            "event": "pdf_render",
+            "doc_type": self.doc_type,
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "phases_ms": {name: round(self.phases_ms[name], 3) for name in PHASES if name in self.phases_ms},
+            "pages": self.pages,
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "page_ms": {
+                "mean": round(sum(page_ms) / len(page_ms), 3) if page_ms else 0.0,
+                "p50": round(page_ms[len(page_ms) // 2], 3) if page_ms else 0.0,
+                "max": round(page_ms[-1], 3) if page_ms else 0.0,
+            },
+        }
+        if self.bytes_before is not None:
+            record["bytes_before"] = self.bytes_before
+        return record
+
+def begin(doc_type):
+    # Starts metrics for one document; the parse phase runs until the PDF object is created
+    global _active
+    if not enabled():
+        return None
+    _active = DocumentMetrics(doc_type)
+    _active.start("parse")
+    return _active
+
+def active():
+    return _active
+
+def discard():
+    # Drops the active metrics without emitting them (the render failed)
+    global _active
+    _active = None
+
+def finish():
+    global _active
+    metrics = _active
+    _active = None
+    if metrics is None:
+        return None
+    record = metrics.to_record()
+    target = os.environ.get("FININVEST_PDF_METRICS")
+    if target:
+        line = json.dumps(record)
+        if target in ("1", "stderr"):
+            print(line, file=sys.stderr)
+        else:
+            with open(target, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    prom_path = os.environ.get("FININVEST_PDF_METRICS_PROM")
+    if prom_path:
+        update_prometheus_file(prom_path, record)
+    return record
+
+# Counters accumulate across processes: the textfile is read back, summed and
+# rewritten under an exclusive lock. Gauges hold the most recent render.
+PROM_METRICS = {
+    "fininvest_pdf_renders_total": ("counter", "Documents rendered."),
+    "fininvest_pdf_phase_seconds_total": ("counter", "Time spent per render phase."),
+    "fininvest_pdf_pages_total": ("counter", "Pages rendered."),
+    "fininvest_pdf_rows_total": ("counter", "Table rows rendered."),
+    "fininvest_pdf_bytes_total": ("counter", "PDF bytes produced."),
+    "fininvest_pdf_last_render_seconds": ("gauge", "Wall time of the most recent render."),
+    "fininvest_pdf_last_render_timestamp_seconds": ("gauge", "Unix time of the most recent render."),
+}
+
+def _read_prometheus_samples(path):
+    samples = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                key, _, value = line.rstrip("\n").rpartition(" ")
+                try:
+                    samples[key] = float(value)
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return samples
+
+def _format_sample(value):
+    return str(int(value)) if value.is_integer() else f"{value:.6f}"
+
+def update_prometheus_file(path, record):
+    doc_label = f'doc_type="{record["doc_type"]}"'
+    increments = {
+        f"fininvest_pdf_renders_total{{{doc_label}}}": 1,
+        f"fininvest_pdf_pages_total{{{doc_label}}}": record["pages"],
+        f"fininvest_pdf_rows_total{{{doc_label}}}": record["rows"],
+        f"fininvest_pdf_bytes_total{{{doc_label}}}": record["bytes"],
+    }
+    for name, ms in record["phases_ms"].items():
+        increments[f'fininvest_pdf_phase_seconds_total{{{doc_label},phase="{name}"}}'] = ms / 1000
+    gauges = {
+        f"fininvest_pdf_last_render_seconds{{{doc_label}}}": record["total_ms"] / 1000,
+        f"fininvest_pdf_last_render_timestamp_seconds{{{doc_label}}}": time.time(),
+    }
+    with open(path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        samples = _read_prometheus_samples(path)
+        for key, value in increments.items():
+            samples[key] = samples.get(key, 0.0) + value
+        samples.update(gauges)
+        lines = []
+        for name, (metric_type, help_text) in PROM_METRICS.items():
+            keys = sorted(key for key in samples if key.split("{", 1)[0] == name)
+            if not keys:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.extend(f"{key} {_format_sample(samples[key])}" for key in keys)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        # Atomic replace so the node exporter never reads a half-written file
+        os.replace(tmp_path, path)
@@ -0,0 +1,401 @@
+import sys
+import os
+import json
+import time
+import socket
+import hashlib
+import sqlite3
+import argparse
+import threading
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from render_worker import handle_job
+from memory_budget import OVER_BUDGET_CODE
+
+# Durable render job queue in a local SQLite file, for month-end runs that must
+# survive a restart. Jobs use the render_worker.py format:
+#   {"id": "stmt-2025-05-M001", "doc_type": "member_statement", "output_path": "...", "payload": {...}}
+#
+# States: queued -> running -> done
+#                           -> queued again after a failure, with exponential
+#                              backoff (backoff_s * 2 ** (attempts - 1), capped)
+#                           -> failed once max_attempts is used up, or at
+#                              once for a job over its memory budget (see
+#                              memory_budget.py), which would only go over
+#                              it again
+#
+# Lanes: "interactive" jobs are always claimed before "bulk" ones; within a
+# lane, oldest first. A job's "id" is its key (a job without one is keyed by
+# a hash of its doc_type, output_path and payload): enqueueing the same job
+# again is a no-op, so re-running an enqueue after a crash doesn't duplicate work.
+#
+# State changes are committed before and after each render, so a restarted
+# runner picks up exactly where the previous one stopped: done jobs are never
+# rendered again. A running job is leased to its runner for lease_s seconds,
+# renewed by a heartbeat while the runner is alive; once a lease runs out
+# (the runner died) any runner claims the job again (the attempt it used
+# still counts). Several runners can share a queue file; a runner only
+# records results for jobs it still holds, so one whose lease ran out doesn't
+# overwrite the state of the runner that took the job over.
+#
+# A worker process that dies (the OOM killer) breaks the whole pool: its jobs
+# are recorded as failed attempts, the job claimed but not yet handed to the
+# pool goes back to the queue, and the run continues on a fresh pool.
+#
+#   python job_queue.py month_end.db enqueue statements.jsonl --lane bulk
+#   python job_queue.py month_end.db run --workers 4
+#   python job_queue.py month_end.db status
+
+LANES = {"interactive": 0, "bulk": 1}
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BACKOFF_S = 10.0
+MAX_BACKOFF_S = 3600.0
+DEFAULT_LEASE_S = 60.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    job_key TEXT NOT NULL UNIQUE,
+    lane INTEGER NOT NULL,
+    doc_type TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    result TEXT,
+    runner_id TEXT,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (state, lane, next_attempt_at, id);
+"""
+# Columns added since the first version, for queue files created by it
+ADDED_COLUMNS = {"runner_id": "TEXT", "lease_until": "REAL"}
+
+def job_key(job):
+    if job.get("id") is not None:
+        return str(job["id"])
+    content = json.dumps([job["doc_type"], job["output_path"], job.get("payload", {})], sort_keys=True, ensure_ascii=False)
+    return "sha256:" + hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+class JobQueue:
+    def __init__(self, path, backoff_s=DEFAULT_BACKOFF_S, lease_s=DEFAULT_LEASE_S):
+        self.path = path
+        self.backoff_s = backoff_s
+        self.lease_s = lease_s
+        self.runner_id = f"{socket.gethostname()}:{os.getpid()}:{os.urandom(4).hex()}"
+        self.db = self.connect()
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        existing = {row["name"] for row in self.db.execute("PRAGMA table_info(jobs)")}
+        for name, kind in ADDED_COLUMNS.items():
+            if name not in existing:
+                self.db.execute(f"ALTER TABLE jobs ADD COLUMN {name} {kind}")
+
+    def connect(self):
+        # Autocommit; transactions are opened explicitly where a read and a write must be atomic
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA synchronous=FULL")
+        return db
+
+    def close(self):
+        self.db.close()
+
+    def enqueue(self, jobs, lane="bulk", max_attempts=DEFAULT_MAX_ATTEMPTS):
+        # jobs: iterable of job dicts; returns (added, already_present)
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane '{lane}'. Expected one of: {', '.join(LANES)}")
+        now = time.time()
+        added = skipped = 0
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            for job in jobs:
+                if not isinstance(job, dict) or not job.get("doc_type") or not job.get("output_path"):
+                    raise ValueError(f"Job requires 'doc_type' and 'output_path': {job!r}")
+                cursor = self.db.execute(
+                    "INSERT OR IGNORE INTO jobs (job_key, lane, doc_type, output_path, payload, max_attempts, next_attempt_at, created_at, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_key(job), LANES[lane], job["doc_type"], job["output_path"], json.dumps(job.get("payload", {}), ensure_ascii=False), max_attempts, now, now, now),
+                )
+                if cursor.rowcount:
+                    added += 1
+                else:
+                    skipped += 1
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        return added, skipped
+
+    def recover(self):
+        # Jobs whose runner stopped renewing their lease go back to the queue; returns how many.
+        # Jobs a live runner holds are left alone.
+        now = time.time()
+        cursor = self.db.execute(
+            "UPDATE jobs SET state = 'queued', runner_id = NULL, lease_until = NULL, next_attempt_at = ?, updated_at = ?"
+            " WHERE state = 'running' AND (lease_until IS NULL OR lease_until < ?)",
+            (now, now, now),
+        )
+        return cursor.rowcount
+
+    def renew_leases(self, db=None):
+        # Extends the leases of the jobs this runner holds (called by heartbeat())
+        (db or self.db).execute(
+            "UPDATE jobs SET lease_until = ? WHERE state = 'running' AND runner_id = ?",
+            (time.time() + self.lease_s, self.runner_id),
+        )
+
+    def claim(self):
+        # Marks the next due job running, leased to this runner, and returns it as
+        # a render_worker job dict, or None. A running job whose lease ran out is
+        # claimed as if it were queued.
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.db.execute(
+                "SELECT * FROM jobs WHERE (state = 'queued' AND next_attempt_at <= ?) OR (state = 'running' AND lease_until < ?)"
+                " ORDER BY lane, next_attempt_at, id LIMIT 1",
+                (now, now),
+            ).fetchone()
+            if row is not None:
+                self.db.execute(
+                    "UPDATE jobs SET state = 'running', attempts = attempts + 1, runner_id = ?, lease_until = ?, updated_at = ? WHERE id = ?",
+                    (self.runner_id, now + self.lease_s, now, row["id"]),
+                )
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return {"id": row["job_key"], "queue_id": row["id"], "doc_type": row["doc_type"], "output_path": row["output_path"], "payload": json.loads(row["payload"])}
+
+    def complete(self, queue_id, result):
+        # False if the job is no longer leased to this runner
+        cursor = self.db.execute(
+            "UPDATE jobs SET state = 'done', result = ?, last_error = NULL, runner_id = NULL, lease_until = NULL, updated_at = ?"
+            " WHERE id = ? AND runner_id = ?",
+            (json.dumps(result), time.time(), queue_id, self.runner_id),
+        )
+        return cursor.rowcount == 1
+
+    def release(self, queue_id):
+        # Back to the queue as it was before claim(), for a job that was never started
+        self.db.execute(
+            "UPDATE jobs SET state = 'queued', attempts = attempts - 1, runner_id = NULL, lease_until = NULL, updated_at = ?"
+            " WHERE id = ? AND runner_id = ?",
+            (time.time(), queue_id, self.runner_id),
+        )
+
+    def fail(self, queue_id, error, retry=True):
+        # Back to the queue with backoff, or failed for good; returns the new
+        # state, or None if the job is no longer leased to this runner
+        row = self.db.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ? AND runner_id = ?", (queue_id, self.runner_id)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if not retry or row["attempts"] >= row["max_attempts"]:
+            state, next_attempt_at = "failed", now
+        else:
+            state = "queued"
+            next_attempt_at = now + min(self.backoff_s * 2 ** (row["attempts"] - 1), MAX_BACKOFF_S)
+        cursor = self.db.execute(
+            "UPDATE jobs SET state = ?, next_attempt_at = ?, last_error = ?, runner_id = NULL, lease_until = NULL, updated_at = ?"
+            " WHERE id = ? AND runner_id = ?",
+            (state, next_attempt_at, error, now, queue_id, self.runner_id),
+        )
+        return state if cursor.rowcount == 1 else None
+
+    def retry_failed(self):
+        # Gives failed jobs a fresh set of attempts
+        cursor = self.db.execute(
+            "UPDATE jobs SET state = 'queued', attempts = 0, next_attempt_at = ?, updated_at = ? WHERE state = 'failed'",
+            (time.time(), time.time()),
+        )
+        return cursor.rowcount
+
+    def next_due(self):
+        # Seconds until the earliest queued job is due (0 if one is due now), or None if nothing is queued
+        row = self.db.execute("SELECT MIN(next_attempt_at) FROM jobs WHERE state = 'queued'").fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def status(self):
+        counts = {state: 0 for state in ("queued", "running", "done", "failed")}
+        by_lane = {}
+        names = {number: name for name, number in LANES.items()}
+        for row in self.db.execute("SELECT lane, state, COUNT(*) AS n FROM jobs GROUP BY lane, state"):
+            counts[row["state"]] = counts.get(row["state"], 0) + row["n"]
+            by_lane.setdefault(names.get(row["lane"], str(row["lane"])), {})[row["state"]] = row["n"]
+        failures = [
+            {"id": row["job_key"], "attempts": row["attempts"], "error": row["last_error"]}
+            for row in self.db.execute("SELECT job_key, attempts, last_error FROM jobs WHERE state = 'failed' ORDER BY id LIMIT 20")
+        ]
+        # Peak worker memory per doc_type over the finished jobs, for sizing hosts
+        peaks = {
+            row["doc_type"]: row["peak"]
+            for row in self.db.execute(
+                "SELECT doc_type, MAX(json_extract(result, '$.peak_rss_mb')) AS peak FROM jobs WHERE state = 'done' GROUP BY doc_type"
+            )
+            if row["peak"] is not None
+        }
+        return {"jobs": counts, "lanes": by_lane, "failed": failures, "peak_rss_mb": peaks}
+
+@contextlib.contextmanager
+def heartbeat(queue):
+    # Renews the runner's leases from a thread (with its own connection) while
+    # jobs render, at a third of the lease so one late beat doesn't lose it
+    stop = threading.Event()
+
+    def beat():
+        db = queue.connect()
+        try:
+            while not stop.wait(queue.lease_s / 3):
+                queue.renew_leases(db)
+        finally:
+            db.close()
+
+    thread = threading.Thread(target=beat, name="job-queue-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+def _record(queue, job, result, log):
+    if result.get("status") == "ok":
+        state = "done" if queue.complete(job["queue_id"], result) else None
+    else:
+        state = queue.fail(job["queue_id"], result.get("error") or "unknown error", retry=result.get("code") != OVER_BUDGET_CODE)
+    if state is None:
+        print(f"Job {job['id']} is no longer leased to this runner (its lease ran out); result not recorded.", file=log)
+        state = "lost"
+    log.write(json.dumps({"id": job["id"], "queue_id": job["queue_id"], "state": state, **{k: v for k, v in result.items() if k != "id"}}) + "\n")
+    log.flush()
+
+def run(queue, workers=1, wait_for_retries=True, log=sys.stderr):
+    # Drains the queue; returns the final status. With wait_for_retries=False the
+    # runner stops once nothing is due now instead of sleeping until backed-off jobs are.
+    recovered = queue.recover()
+    if recovered:
+        print(f"Re-queued {recovered} job(s) left running by a runner that stopped.", file=log)
+    with heartbeat(queue):
+        return _run(queue, workers, wait_for_retries, log)
+
+def _run(queue, workers, wait_for_retries, log):
+    if workers <= 1:
+        while True:
+            job = queue.claim()
+            if job is None:
+                delay = queue.next_due()
+                if delay is None or not wait_for_retries:
+                    break
+                time.sleep(min(delay, 5.0))
+                continue
+            _record(queue, job, handle_job(job), log)
+        return queue.status()
+
+    # A worker that asks to be recycled (see memory_budget.py) can't be replaced
+    # on its own: the pool takes no more jobs, and once the ones in flight are
+    # done the run continues on a fresh pool
+    while True:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            finished = _run_pool(queue, executor, workers, wait_for_retries, log)
+        if finished:
+            return queue.status()
+
+def _run_pool(queue, executor, workers, wait_for_retries, log):
+    # Returns False when the pool has to be replaced, True when the queue is drained
+    in_flight = {}
+    recycle = False
+    while True:
+        while len(in_flight) < workers and not recycle:
+            job = queue.claim()
+            if job is None:
+                break
+            try:
+                in_flight[executor.submit(handle_job, job)] = job
+            except BrokenProcessPool:
+                # A worker died; the jobs in flight fail below, this one never ran
+                queue.release(job["queue_id"])
+                recycle = True
+        if not in_flight:
+            if recycle:
+                return False
+            delay = queue.next_due()
+            if delay is None or not wait_for_retries:
+                return True
+            time.sleep(min(delay, 5.0))
+            continue
+        done, _ = wait(in_flight, timeout=5.0, return_when=FIRST_COMPLETED)
+        for future in done:
+            job = in_flight.pop(future)
+            try:
+                result = future.result()
+            except BrokenProcessPool as e:
+                result = {"id": job["id"], "status": "error", "error": f"{type(e).__name__}: {e}"}
+                recycle = True
+            except Exception as e:
+                result = {"id": job["id"], "status": "error", "error": f"{type(e).__name__}: {e}"}
+            recycle = recycle or bool(result.get("recycle"))
+            _record(queue, job, result, log)
+
+def read_jobs(lines):
+    for line_no, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {line_no}: invalid JSON: {e}") from e
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Durable SQLite-backed render job queue.")
+    parser.add_argument("db", help="SQLite queue file (created if missing)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    enqueue_parser = commands.add_parser("enqueue", help="Add the jobs of a JSONL manifest")
+    enqueue_parser.add_argument("manifest", help="JSONL manifest path, or - for stdin")
+    enqueue_parser.add_argument("--lane", choices=list(LANES), default="bulk", help="Priority lane (default: bulk)")
+    enqueue_parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS, help="Attempts before a job is marked failed")
+    run_parser = commands.add_parser("run", help="Render queued jobs until none are left")
+    run_parser.add_argument("--workers", type=int, default=1, help="Worker processes (default: 1, in-process)")
+    run_parser.add_argument("--backoff", type=float, default=DEFAULT_BACKOFF_S, help="Base retry delay in seconds, doubled per attempt")
+    run_parser.add_argument("--lease", type=float, default=DEFAULT_LEASE_S, help="Seconds a running job stays with this runner without a heartbeat")
+    run_parser.add_argument("--no-wait", action="store_true", help="Exit when no job is due instead of waiting for backed-off retries")
+    commands.add_parser("status", help="Print job counts per state and lane")
+    commands.add_parser("retry-failed", help="Re-queue failed jobs with fresh attempts")
+    args = parser.parse_args()
+
+    queue = JobQueue(args.db, backoff_s=getattr(args, "backoff", DEFAULT_BACKOFF_S), lease_s=getattr(args, "lease", DEFAULT_LEASE_S))
+    try:
+        if args.command == "enqueue":
+            manifest_file = sys.stdin if args.manifest == "-" else open(args.manifest, encoding="utf-8")
+            try:
+                added, skipped = queue.enqueue(read_jobs(manifest_file), args.lane, args.max_attempts)
+            except ValueError as e:
+                print(f"Error: {e}", file=sys.stderr)
+                sys.exit(1)
+            finally:
+                if manifest_file is not sys.stdin:
+                    manifest_file.close()
+            print(json.dumps({"added": added, "already_queued": skipped}))
+        elif args.command == "run":
+            summary = run(queue, args.workers, wait_for_retries=not args.no_wait)
+            print(json.dumps(summary))
+            if summary["jobs"]["failed"]:
+                sys.exit(1)
+        elif args.command == "status":
+            print(json.dumps(queue.status()))
+        else:
+            print(json.dumps({"requeued": queue.retry_failed()}))
+    finally:
+        queue.close()
@@ -0,0 +1,98 @@
+from fpdf.enums import Align, XPos, YPos, WrapMode
+from fpdf.line_break import MultiLineBreak, TextLine
+
+# Line-break cache for the static legal clauses of contracts and membership
+# agreements. multi_cell re-runs justified line breaking on every document even
+# though those paragraphs never change; here each paragraph is broken once per
+# (font, style, size, width, align) and later documents replay the cached line
+# runs. Paragraphs that interpolate per-client values keep using multi_cell.
+#
+# Each cached line keeps what fpdf needs to draw it again: its text, measured
+# width, number of spaces (for justification), effective alignment and
+# whether it ended on an explicit newline.
+#
+# cached_lines() is the same cache for other wrapped text that repeats across
+# rows or documents, such as statement descriptions (see table_layout.py).
+
+# Statement descriptions are open-ended, so the cache is emptied at this size
+MAX_CACHED_LINES = 20000
+
+_line_cache = {}
+stats = {"hits": 0, "misses": 0}
+
+def _break_lines(pdf, w, text, align):
+    text = pdf.normalize_text(text).replace("\r", "")
+    fragments = pdf._preload_font_styles(text, False)
+    multi_line_break = MultiLineBreak(
+        fragments,
+        w,
+        [pdf.c_margin, pdf.c_margin],
+        align=align,
+        wrapmode=WrapMode.WORD,
+    )
+    lines = []
+    text_line = multi_line_break.get_line()
+    while text_line is not None:
+        line_text = "".join(frag.string for frag in text_line.fragments)
+        lines.append((line_text, text_line.text_width, text_line.number_of_spaces, text_line.align, text_line.trailing_nl))
+        text_line = multi_line_break.get_line()
+    return tuple(lines)
+
+def cached_lines(pdf, w, text, align):
+    # The lines multi_cell(w, ..., text, align=align) would draw in the current font
+    key = (pdf.font_family, pdf.font_style, pdf.font_size_pt, round(w, 4), align, text)
+    lines = _line_cache.get(key)
+    if lines is None:
+        stats["misses"] += 1
+        lines = _break_lines(pdf, w, text, align)
+        if len(_line_cache) >= MAX_CACHED_LINES:
+            _line_cache.clear()
+        _line_cache[key] = lines
+    else:
+        stats["hits"] += 1
+    return lines
+
+def static_multi_cell(pdf, w, h, text, align="J"):
+    # Drop-in for pdf.multi_cell(w, h, text, align=align) with the default
+    # new_x=RIGHT / new_y=NEXT positioning, for text that is the same on every document.
+    if w == 0:
+        w = pdf.w - pdf.r_margin - pdf.x
+    align = Align.coerce(align)
+    lines = cached_lines(pdf, w, text, align)
+    if not lines:
+        pdf.multi_cell(w, h, text, align=align)
+        return
+
+    last_index = len(lines) - 1
+    for index, (line_text, text_width, number_of_spaces, line_align, trailing_nl) in enumerate(lines):
+        is_last_line = index == last_index
+        text_line = TextLine(
+            pdf._preload_font_styles(line_text, False),
+            text_width=text_width,
+            number_of_spaces=number_of_spaces,
+            align=line_align,
+            height=h,
+            max_width=w,
+            trailing_nl=trailing_nl,
+        )
+        pdf._render_styled_text_line(
+            text_line,
+            h=h,
+            new_x=XPos.RIGHT if is_last_line else XPos.LEFT,
+            new_y=YPos.NEXT,
+            link=None,
+        )
+    if lines[-1][4]:
+        pdf.ln()
+
+def entries():
+    # The cached lines, for preload() in another process (see parallel_statement.py)
+    return dict(_line_cache)
+
+def preload(entries):
+    _line_cache.update(entries)
+
+def clear():
+    _line_cache.clear()
+    stats["hits"] = 0
+    stats["misses"] = 0
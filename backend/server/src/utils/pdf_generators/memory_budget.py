@@ -0,0 +1,115 @@
+import os
+import random
+import resource
+import tracemalloc
+import contextlib
+
+# Per-job memory ceiling and worker recycling for render_worker.handle_job, so
+# a malformed or giant payload fails on its own instead of getting the host
+# OOM-killed. Everything built on handle_job gets it: render_worker.py,
+# render_batch.py, render_pool.py, render_service.py and job_queue.py.
+#
+#   FININVEST_PDF_JOB_MAX_MB=<n>          ceiling per job. RLIMIT_AS is lowered to the
+#                                         process's address space at the start of the job
+#                                         plus n MB until the job ends, so the allocation
+#                                         that crosses it (Python or C, memory-mapped files
+#                                         included) fails and the job ends with a
+#                                         MemoryBudgetExceeded error (code 413)
+#   FININVEST_PDF_RECYCLE_RSS_MB=<n>      a worker whose resident size is over n MB after
+#                                         a job asks to be replaced ("recycle": true in
+#                                         the result); so does one whose job hit the ceiling
+#   FININVEST_PDF_TRACEMALLOC_SAMPLE=<f>  fraction of jobs (0 to 1) run under tracemalloc,
+#                                         whose results add "traced_peak_mb", the peak of
+#                                         the Python allocations made by the job. Tracing
+#                                         makes a render several times slower, hence sampled.
+#
+# Every result carries "peak_rss_mb", the worker's peak resident size during
+# the job (the kernel's high-water mark is reset when the job starts; off Linux
+# it is the peak over the life of the process). The entry points report its
+# maximum per doc_type, which is what a host is sized by.
+
+MB = 1024 * 1024
+# Result code of a job stopped by the ceiling (as render_service.py's 429/504)
+OVER_BUDGET_CODE = 413
+
+class MemoryBudgetExceeded(MemoryError):
+    pass
+
+def _setting(name):
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+def _status_kb(field):
+    # A line of /proc/self/status in kB (VmSize, VmRSS, VmHWM), or None off Linux
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def _reset_peak_rss():
+    # Writing 5 to clear_refs resets VmHWM to the current resident size
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def _peak_rss_kb():
+    peak = _status_kb("VmHWM")
+    return peak if peak is not None else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def rss_mb():
+    rss = _status_kb("VmRSS")
+    return (rss if rss is not None else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss) / 1024
+
+@contextlib.contextmanager
+def job_budget():
+    # Runs one job under the ceiling; yields a dict that is filled with the
+    # job's memory figures when it ends
+    usage = {}
+    max_mb = _setting("FININVEST_PDF_JOB_MAX_MB")
+    previous_limit = None
+    size_kb = _status_kb("VmSize") if max_mb else None
+    if size_kb is not None:
+        soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+        limit = size_kb * 1024 + int(max_mb * MB)
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+        previous_limit = (soft, hard)
+    sample = _setting("FININVEST_PDF_TRACEMALLOC_SAMPLE") or 0
+    traced = sample > 0 and random.random() < sample and not tracemalloc.is_tracing()
+    if traced:
+        tracemalloc.start()
+    _reset_peak_rss()
+    try:
+        yield usage
+    except MemoryError:
+        if previous_limit is None:
+            raise
+        raise MemoryBudgetExceeded(f"Job went over its memory budget of {max_mb:g} MB.") from None
+    finally:
+        if previous_limit is not None:
+            resource.setrlimit(resource.RLIMIT_AS, previous_limit)
+        if traced:
+            usage["traced_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / MB, 1)
+            tracemalloc.stop()
+        usage["peak_rss_mb"] = round(_peak_rss_kb() / 1024, 1)
+
+def should_recycle():
+    threshold = _setting("FININVEST_PDF_RECYCLE_RSS_MB")
+    return threshold is not None and rss_mb() > threshold
+
+def record_peak(peaks, result):
+    # Keeps the largest "peak_rss_mb" seen per doc_type
+    doc_type = result.get("doc_type")
+    peak = result.get("peak_rss_mb")
+    if doc_type and peak is not None:
+        peaks[doc_type] = max(peaks.get(doc_type, 0.0), peak)
+
+def format_peaks(peaks):
+    return ", ".join(f"{doc_type} {peak:g} MB" for doc_type, peak in sorted(peaks.items()))
@@ -0,0 +1,87 @@
+import sys
+import os
+import json
+import time
+import argparse
+from datetime import datetime, timezone
+
+import registry
+import pdf_compact
+from pdf_base import shared_fonts
+from streaming_writer import StreamingPDFWriter
+
+# Renders many documents into one PDF for bulk printing and archiving. Each
+# manifest line is a document:
+#   {"doc_type": "receipt", "payload": {"receipt_data": {...}}, "title": "Recibo Q202505-001"}
+# ("title" is optional and defaults to the document's own title). Every
+# document starts on a new page and gets a top-level bookmark. Documents are
+# laid out one at a time and their pages written straight to the output, which
+# is one sequential write; fonts and the resources dictionary appear once for
+# the whole file instead of once per document.
+#
+#   python merge_documents.py receipts.jsonl receipts_2025_05.pdf --title "Recibos Maio 2025"
+
+BUFFER_SIZE = 1024 * 1024
+
+def merge_documents(documents, f, title=None, author="Fininvest Platform", issued_at=None, compression_level=None):
+    # documents: iterable of (doc_type, payload, outline_title or None); returns a summary dict
+    writer = StreamingPDFWriter(f, compression_level=compression_level)
+    count = 0
+    for doc_type, payload, doc_title in documents:
+        # "stream" and "workers" only apply to single statements rendered straight to a file
+        payload = {key: value for key, value in payload.items() if key not in ("stream", "workers")} if isinstance(payload, dict) else payload
+        with shared_fonts(writer.fonts):
+            pdf = registry.build_pdf(doc_type, payload)
+        count += 1
+        writer.write_document(pdf, doc_title or pdf.title or f"{doc_type} {count}")
+    if isinstance(issued_at, str):
+        issued_at = datetime.fromisoformat(issued_at)
+    size = writer.close(title, author, issued_at or datetime.now(timezone.utc))
+    return {"documents": count, "pages": len(writer.page_ids), "bytes": size}
+
+def read_manifest(lines):
+    for line_no, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            doc = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {line_no}: invalid JSON: {e}") from e
+        if not isinstance(doc, dict) or not doc.get("doc_type"):
+            raise ValueError(f"Line {line_no}: each document needs a 'doc_type'.")
+        yield doc["doc_type"], doc.get("payload", {}), doc.get("title")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge many Fininvest documents into one PDF.")
+    parser.add_argument("manifest", help="JSONL manifest of documents, or - for stdin")
+    parser.add_argument("output", help="Output PDF path, or - for stdout")
+    parser.add_argument("--title", default=None, help="Title of the merged PDF")
+    parser.add_argument("--compression-level", type=int, choices=range(10), default=None, metavar="0-9", help="zlib level for page content streams (default: FININVEST_PDF_COMPACT, else zlib's default)")
+    parser.add_argument("--issued-at", default=None, help="Creation date of the merged PDF (ISO 8601), for reproducible output")
+    args = parser.parse_args()
+    compression_level = args.compression_level if args.compression_level is not None else pdf_compact.level_from_env()
+
+    start = time.perf_counter()
+    manifest_file = sys.stdin if args.manifest == "-" else open(args.manifest, encoding="utf-8")
+    try:
+        if args.output == "-":
+            summary = merge_documents(read_manifest(manifest_file), sys.stdout.buffer, args.title, issued_at=args.issued_at, compression_level=compression_level)
+        else:
+            registry.ensure_output_dir(args.output)
+            # Written next to the target and renamed, so a failed merge never leaves a truncated PDF
+            tmp_path = f"{args.output}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, "wb", buffering=BUFFER_SIZE) as f:
+                    summary = merge_documents(read_manifest(manifest_file), f, args.title, issued_at=args.issued_at, compression_level=compression_level)
+                os.replace(tmp_path, args.output)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+    except Exception as e:
+        print(f"Error merging documents: {type(e).__name__}: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if manifest_file is not sys.stdin:
+            manifest_file.close()
+    summary["elapsed_s"] = round(time.perf_counter() - start, 3)
+    print(json.dumps(summary), file=sys.stderr)
@@ -0,0 +1,157 @@
+import sys
+import os
+import json
+import time
+import hashlib
+import tempfile
+
+import registry
+import pdf_compact
+import ttf_fonts
+
+# Content-addressed on-disk cache of rendered PDFs. The key is a hash of
+# (doc_type, payload, TEMPLATE_VERSION), so re-downloading the same receipt
+# or statement is a file read instead of a render. Entries are evicted least
+# recently used first once the cache grows past max_bytes.
+#
+# Only payloads with a pinned "issued_at" are cached: they render to
+# byte-identical output for identical input (see FininvestPDF.set_issued_at).
+# Any other payload prints the time of its own render in "Emitido em", so it
+# is rendered every time.
+#
+# Several processes may share one cache directory (render_service.py's
+# workers), so the size is recomputed from the directory before each eviction
+# decision. The hit/miss counters are per process: render_worker.py adds them
+# to its results as "cache_stats", and render_service.py's {"op": "stats"}
+# reply sums them over its workers.
+
+# Bump whenever a generator's layout changes so stale PDFs are not served
+TEMPLATE_VERSION = "3"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+def cache_key(doc_type, payload):
+    key_material = {"doc_type": doc_type, "payload": payload, "template_version": TEMPLATE_VERSION}
+    # Compacted and plain renders of the same input are different files
+    compact_level = pdf_compact.level_from_env()
+    if compact_level is not None:
+        key_material["compact_level"] = compact_level
+    # Likewise core-font and TTF renders
+    font_family = ttf_fonts.family_from_env()
+    if font_family is not None:
+        key_material["font"] = font_family
+    material = json.dumps(
+        key_material,
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+def cacheable(payload):
+    return isinstance(payload, dict) and bool(payload.get("issued_at"))
+
+class OutputCache:
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self.total_bytes = sum(size for _, _, size in self._entries())
+        # When total_bytes was last counted from the directory
+        self.counted_at = time.time()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pdf")
+
+    def _entries(self):
+        # (last_used, path, size) for every cached file
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".pdf"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield st.st_mtime, path, st.st_size
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        # mtime doubles as the LRU timestamp, so it survives restarts
+        os.utime(path)
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial PDF
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        # Recounts the directory, which other processes may have written to too
+        self.evict()
+
+    def evict(self):
+        # Once the directory is over max_bytes, drop least recently used entries
+        # until it is back under 90% of it
+        entries = sorted(self._entries())
+        self.total_bytes = sum(size for _, _, size in entries)
+        self.counted_at = time.time()
+        if self.total_bytes <= self.max_bytes:
+            return
+        target = self.max_bytes * 0.9
+        for _, path, size in entries:
+            if self.total_bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def render_bytes(self, doc_type, payload):
+        # Returns (pdf_bytes, hit), hit None when the payload isn't cacheable
+        if not cacheable(payload):
+            return registry.render_bytes(doc_type, payload), None
+        key = cache_key(doc_type, payload)
+        data = self.get(key)
+        if data is not None:
+            return data, True
+        data = registry.render_bytes(doc_type, payload)
+        self.put(key, data)
+        return data, False
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "bytes": self.total_bytes,
+            "counted_at": self.counted_at,
+            "max_bytes": self.max_bytes,
+        }
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "stats":
+        cache = OutputCache(sys.argv[2])
+        entries = sum(1 for _ in cache._entries())
+        # Hit/miss counters live in the processes that use the cache (render_worker
+        # results, render_service stats); on disk we only have size
+        print(json.dumps({"entries": entries, "bytes": cache.total_bytes}))
+    else:
+        print("Usage: python output_cache.py stats <cache_dir>", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,218 @@
+import os
+import re
+import sys
+import zlib
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import registry
+import instrumentation
+import layout_cache
+import ttf_fonts
+from statement_append import register_font
+from statement_summary import batched
+from streaming_writer import StreamingPDFWriter, deflate
+
+# Renders one very long statement on several cores (a fund-wide ledger drawn
+# as a member statement runs to thousands of pages):
+#
+#   1. This process runs every row through the statement's summary (running
+#      balance, totals) and fits the table to the first rows.
+#   2. The worker processes measure the row heights, a slice of rows each
+#      (wrapped descriptions go through fpdf's line breaking, the costly
+#      part), and TableLayout.paginate turns them into the first row of
+#      each page. The line breaks come back too, so they aren't redone.
+#   3. The pages are split into one run of consecutive pages per worker.
+#      Each worker lays out its rows from the first page of its run on (page
+#      header, table, footer numbered as in the whole statement); the worker
+#      with the last run also draws the summary block.
+#   4. The workers hand back their pages as deflated content streams, which
+#      are written here in page order through StreamingPDFWriter, with one
+#      set of fonts and page furniture forms for the whole file. A TrueType
+#      font's subset gets the characters every worker drew (the codes are the
+#      code points, see ttf_fonts.py, so the pages agree on them).
+#
+# Pages are laid out as in a streamed statement and come out the
+# same as a single-process render. The rows are held in memory here, since
+# the pages can't be planned without all of them. Appendable statements are
+# rendered in one process.
+#
+#   python generate_member_statement.py ledger.pdf "Fundo" 2020-01-01 2025-12-31 --rows ledger.csv --header --workers 8
+#   payload: {"member_name": ..., "statement_data": [...], "workers": 8}
+
+# Local /I<n> form names in a page content stream (see FininvestPDF.page_furniture)
+FORM_RE = re.compile(rb"^((?:q 1 0 0 1 \S+ \S+ cm )?)/I(\d+) Do", re.M)
+
+class PageCollector:
+    # Takes StreamingPDFWriter's place in a worker: keeps the finished pages,
+    # deflated here so compression runs in parallel too, and the forms
+    def __init__(self, compress, compression_level):
+        self.compress = compress
+        self.compression_level = compression_level
+        self.pages = []
+        self.forms = []
+
+    def write_page(self, page):
+        contents = bytes(page.contents)
+        if self.compress:
+            contents = deflate(contents, self.compression_level)
+        self.pages.append((contents, page.dimensions()))
+
+    def add_form(self, contents, dimensions):
+        self.forms.append((contents, dimensions))
+        return len(self.forms)
+
+def _new_pdf(doc_type, args, fontkeys=()):
+    pdf = registry.get_generator(doc_type).new_pdf(**args)
+    collector = PageCollector(pdf.compress, pdf.compact_level)
+    pdf.write_pages_to(collector)
+    for fontkey in fontkeys:
+        # Same registration order in every process, so every page uses the same /F names
+        register_font(pdf, fontkey)
+    return pdf, collector
+
+def _fontkeys(pdf):
+    return [font.fontkey for font in sorted(pdf.fonts.values(), key=lambda font: font.i)]
+
+def measure_rows(job):
+    # Worker: the table row heights of one slice of rows, and their line breaks
+    pdf, _ = _new_pdf(job["doc_type"], job["args"])
+    pdf.table.use_widths(job["widths"])
+    pdf.table.begin()
+    layout_cache.clear()
+    heights = pdf.table.row_heights(job["rows"])
+    return heights, layout_cache.entries()
+
+def render_pages(job):
+    # Worker: lays out one run of pages; returns its pages, forms, fonts and
+    # the characters drawn in each TrueType font
+    pdf, collector = _new_pdf(job["doc_type"], job["args"], job["fonts"])
+    layout_cache.preload(job["lines"])
+    pdf.issued_at = job["issued_at"]
+    pdf.page_number_offset = job["first_page"] - 1
+    pdf.table.use_widths(job["widths"])
+    pdf.add_page()
+    pdf.table.begin()
+    for row in job["rows"]:
+        pdf.add_table_row(row)
+    summary = job["summary"]
+    if summary is not None:
+        if summary.rows:
+            pdf.print_summary(summary)
+        else:
+            pdf.table.ensure_header()
+    pdf._render_footer()
+    collector.write_page(pdf.pages.pop(pdf.page))
+    ttf_codes = {font.fontkey: ttf_fonts.used_codes(font) for font in pdf.fonts.values() if ttf_fonts.is_ttf(font)}
+    return {"pages": collector.pages, "forms": collector.forms, "fonts": _fontkeys(pdf), "ttf_codes": ttf_codes}
+
+def _renumber_forms(contents, mapping, deflated):
+    # Rewrites a page's local form names to the file's
+    if deflated:
+        contents = zlib.decompress(contents)
+    contents = FORM_RE.sub(lambda m: m.group(1) + b"/I%d Do" % mapping[int(m.group(2))], contents)
+    return contents
+
+def _slices(count, parts):
+    bounds = [round(part * count / parts) for part in range(parts + 1)]
+    return list(zip(bounds, bounds[1:]))
+
+def plan(pdf, rows, heights, top, workers):
+    # One job per run of consecutive pages
+    starts = pdf.table.paginate(heights, top)
+    runs = max(1, min(workers, len(starts)))
+    jobs = []
+    for first, last in _slices(len(starts), runs):
+        end = starts[last] if last < len(starts) else len(rows)
+        jobs.append({
+            "first_page": first + 1,
+            "first_row": starts[first],
+            "pages": last - first,
+            "rows": rows[starts[first]:end],
+        })
+    return jobs
+
+def render_parallel(doc_type, f, args, statement_data, issued_at=None, workers=None):
+    # Writes the statement to the binary file f; returns {"pages", "rows", "workers", "bytes"}
+    workers = workers or os.cpu_count() or 1
+    pdf, _ = _new_pdf(doc_type, dict(args, issued_at=issued_at))
+    # Every process prints the same "Emitido em"
+    if pdf.issued_at is None:
+        pdf.issued_at = datetime.now()
+    summary = pdf.new_summary()
+    rows = []
+    for batch in batched(statement_data):
+        rows.extend(summary.process(batch))
+    if summary.rows:
+        summary.check()
+    pdf.add_page()
+    top = pdf.y
+    pdf.table.fit(rows)
+    widths = list(pdf.table.widths)
+
+    writer = StreamingPDFWriter(f, pdf.fonts, pdf.compress, pdf.default_page_dimensions, compression_level=pdf.compact_level)
+    metrics = pdf.metrics
+    if metrics:
+        metrics.layout_done()
+        metrics.start("serialise")
+    forms = {}
+    pages = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        slices = _slices(len(rows), workers)
+        measure_jobs = [{"doc_type": doc_type, "args": args, "widths": widths, "rows": rows[start:end]} for start, end in slices]
+        measured = list(executor.map(measure_rows, measure_jobs))
+        heights = [h for part, _ in measured for h in part]
+        jobs = plan(pdf, rows, heights, top, workers)
+        for job in jobs:
+            # The line breaks measured for the rows of this run
+            first_row, end_row = job["first_row"], job["first_row"] + len(job["rows"])
+            lines = {}
+            for (start, end), (_, entries) in zip(slices, measured):
+                if start < end_row and end > first_row:
+                    lines.update(entries)
+            job.update(doc_type=doc_type, args=args, issued_at=pdf.issued_at, fonts=_fontkeys(pdf), widths=widths, lines=lines, summary=None)
+        jobs[-1]["summary"] = summary
+        for job, result in zip(jobs, executor.map(render_pages, jobs)):
+            if len(result["pages"]) != job["pages"] and not (job["summary"] and len(result["pages"]) > job["pages"]):
+                raise RuntimeError(f"Pages from {job['first_page']} were laid out differently from the plan.")
+            fontkeys = _fontkeys(pdf)
+            if result["fonts"][:len(fontkeys)] != fontkeys[:len(result["fonts"])]:
+                raise RuntimeError("The worker processes registered fonts in different orders.")
+            for fontkey in result["fonts"][len(fontkeys):]:
+                # Fonts first used after page 1 (the footer's italic)
+                register_font(pdf, fontkey)
+            for fontkey, codes in result["ttf_codes"].items():
+                ttf_fonts.add_codes(pdf.fonts[fontkey], codes)
+            mapping = {}
+            for index, form in enumerate(result["forms"], start=1):
+                if form not in forms:
+                    forms[form] = writer.add_form(*form)
+                mapping[index] = forms[form]
+            renumber = any(index != form_index for index, form_index in mapping.items())
+            for contents, dimensions in result["pages"]:
+                if renumber:
+                    contents = _renumber_forms(contents, mapping, pdf.compress)
+                    writer.write_page_contents(contents, dimensions)
+                else:
+                    writer.write_page_contents(contents, dimensions, deflated=pdf.compress)
+            pages += len(result["pages"])
+    size = writer.close(pdf.title, getattr(pdf, "author", None), pdf.creation_date, pdf.xmp_metadata)
+    if metrics:
+        metrics.stop("serialise")
+        metrics.pages = pages
+        metrics.rows = summary.rows
+        metrics.bytes = size
+    return {"pages": pages, "rows": summary.rows, "workers": len(jobs), "bytes": size}
+
+def write_parallel(doc_type, output_path, args, statement_data, issued_at=None, workers=None, description="statement"):
+    # render_parallel to a path or "-" (stdout), reported like pdf_output.stream_pdf
+    if output_path == "-":
+        result = render_parallel(doc_type, sys.stdout.buffer, args, statement_data, issued_at, workers)
+        sys.stdout.buffer.flush()
+        message = f"PDF {description} written to stdout ({result['bytes']} bytes, {result['pages']} pages on {result['workers']} workers)"
+    else:
+        with open(output_path, "wb") as f:
+            result = render_parallel(doc_type, f, args, statement_data, issued_at, workers)
+        message = f"PDF {description} generated successfully at: {output_path} ({result['pages']} pages on {result['workers']} workers)"
+    instrumentation.finish()
+    print(message, file=sys.stderr if output_path == "-" else sys.stdout)
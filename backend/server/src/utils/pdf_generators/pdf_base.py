@@ -0,0 +1,437 @@
+import sys
+import contextlib
+from datetime import datetime, timezone
+from fpdf import FPDF
+from fpdf.enums import Align, PDFResourceType, XPos, YPos
+from fpdf.fonts import CORE_FONTS_CHARWIDTHS
+from fpdf.line_break import Fragment, TextLine
+from fpdf.syntax import Name, PDFArray, PDFContentStream
+
+import instrumentation
+import pdf_compact
+import ttf_fonts
+from streaming_writer import StreamingPDFWriter
+
+# Common base class for the Fininvest generators: the centred title header,
+# the page-number footer, add_key_value, table rows, and cheaper font/colour/
+# width calls.
+#
+# Subclasses set title_text (and optionally title_font_size, title_spacing,
+# key_width, line_height, body_font_size, footer_text) and override
+# header_details()/footer_details() for anything drawn below the title or
+# next to the page number.
+#
+# set_issued_at() pins the issue timestamp ("Emitido em" and the PDF creation
+# date, which also seeds the file /ID), so identical input renders to
+# byte-identical output.
+#
+# When instrumentation is enabled (see instrumentation.py) the document picks
+# up the active metrics: pages and rows are counted as they are drawn and
+# output_bytes() times serialisation.
+#
+# stream_to() switches a document to streaming mode: each finished page is
+# written out at the next page break instead of being held until output(),
+# for statements too large to keep in memory. Documents created inside
+# shared_fonts() use one fonts dict, so merge_documents.py can give a whole
+# merged file a single set of font objects.
+#
+# resume_page() and page_number_offset let a document continue a page that
+# already exists in another file (statement_append.py): no header is drawn,
+# the cursor starts where the old content ended, and page numbers carry on.
+#
+# compact_level (FININVEST_PDF_COMPACT when the document is created, unset = off) runs
+# output_bytes() through pdf_compact at that zlib level and reports the
+# before/after size on stderr; streamed output uses it as the Flate level.
+#
+# font_family_override (FININVEST_PDF_FONT when the document is created, unset = Helvetica) draws
+# every Helvetica call in that TTF family (see ttf_fonts.py), in every output
+# path: in memory, streamed, parallel, appendable and shared-font documents.
+#
+# reuse_furniture (the statements) draws the page furniture once per
+# document: page_furniture() records what the title header, the static part
+# of the footer or the table's column headers draw into a form XObject the
+# first time, and every later page only references it ("/I1 Do"), so a
+# many-page statement neither lays that text out nor stores it again per
+# page. Only the page number is drawn on each page. Appendable and
+# shared-font documents draw it inline: statement_append.py and
+# merge_documents.py only write fonts into their resources.
+
+# Glyph widths (1/1000 em) of the Helvetica core fonts, shared by every
+# document rendered in the process.
+WIDTH_TABLES = {
+    fontkey: CORE_FONTS_CHARWIDTHS[fontkey]
+    for fontkey in ("helvetica", "helveticaB", "helveticaI", "helveticaBI")
+}
+MAX_CACHED_WIDTHS = 20000
+
+ALIGNS = {"L": Align.L, "C": Align.C, "R": Align.R}
+
+# fonts dict handed to every FininvestPDF created inside shared_fonts()
+_shared_fonts = None
+
+class _PageResources:
+    # A form XObject's /Resources: those of the page it was recorded on, which
+    # fpdf only builds in output() (they include every font the form uses)
+    def __init__(self, page):
+        self.page = page
+
+    def serialize(self, _security_handler=None, _obj_id=None):
+        return self.page.resources.ref
+
+# (fontkey, size_pt, k) -> {text: width in user units}
+_string_widths = {}
+# (family, style) as passed to set_font -> (family, style) as fpdf stores them
+_normalized_fonts = {}
+
+@contextlib.contextmanager
+def shared_fonts(fonts):
+    global _shared_fonts
+    previous = _shared_fonts
+    _shared_fonts = fonts
+    try:
+        yield fonts
+    finally:
+        _shared_fonts = previous
+
+class FininvestPDF(FPDF):
+    title_text = ""
+    title_font_size = 15
+    title_spacing = 10
+    footer_text = "Fininvest - Gestão de Microcrédito"
+    key_width = 50
+    line_height = 7
+    body_font_size = 11
+
+    issued_at = None
+
+    _text_color_args = None
+    _text_color_value = None
+
+    _page_writer = None
+
+    # Added to page_no() in the footer; set when continuing an existing document
+    page_number_offset = 0
+    _resuming = False
+
+    # Set per document from the environment in __init__
+    compact_level = None
+    font_family_override = None
+    # TTF family used for "Helvetica" in this document, False for the core
+    # fonts; decided at the first set_font
+    _font_alias = None
+
+    reuse_furniture = False
+    # (name, graphics state) -> (xobject index, x, y, x and y after drawing)
+    _furniture = None
+
+    def __init__(self, *args, **kwargs):
+        self.compact_level = pdf_compact.level_from_env()
+        self.font_family_override = ttf_fonts.family_from_env()
+        super().__init__(*args, **kwargs)
+        if _shared_fonts is not None:
+            # fpdf's fonts property reads this registry
+            self._resource_catalog.font_registry = _shared_fonts
+            self.reuse_furniture = False
+        self.metrics = instrumentation.active()
+        if self.metrics:
+            self.metrics.stop("parse")
+            self.metrics.start("layout")
+
+    def add_page(self, *args, **kwargs):
+        if self.metrics:
+            self.metrics.page_started()
+        super().add_page(*args, **kwargs)
+        # The previous page's footer has been drawn, so it is complete
+        if self._page_writer and self.page > 1:
+            self._page_writer.write_page(self.pages.pop(self.page - 1))
+
+    def resume_page(self, y):
+        # Starts a page whose upper part is already drawn elsewhere: no header, cursor at y
+        self._resuming = True
+        try:
+            self.add_page()
+        finally:
+            self._resuming = False
+        self.set_y(y)
+
+    def stream_to(self, f):
+        self.write_pages_to(StreamingPDFWriter(f, self.fonts, self.compress, self.default_page_dimensions, compression_level=self.compact_level))
+
+    def write_pages_to(self, writer):
+        # Hands each finished page (and page furniture form) to writer: a
+        # StreamingPDFWriter, or parallel_statement's per-process page collector
+        self._page_writer = writer
+
+    def finish_stream(self):
+        # Writes the last page and the trailer; returns the number of bytes written
+        if self.page == 0:
+            self.add_page()
+        metrics = self.metrics
+        if metrics:
+            metrics.layout_done()
+            metrics.start("serialise")
+        self._render_footer()
+        self._page_writer.write_page(self.pages.pop(self.page))
+        size = self._page_writer.close(self.title, getattr(self, "author", None), self.creation_date, self.xmp_metadata)
+        self._page_writer = None
+        if metrics:
+            metrics.stop("serialise")
+            metrics.bytes = size
+        return size
+
+    def output_bytes(self):
+        metrics = self.metrics
+        if metrics:
+            metrics.layout_done()
+            metrics.start("serialise")
+        pdf_bytes = bytes(self.output())
+        if self.compact_level is not None:
+            # An appendable statement's pages stay one content stream each, for statement_append.py
+            pdf_bytes, stats = pdf_compact.compact(pdf_bytes, self.compact_level, split_pages=not getattr(self, "appendable", False))
+            print(f"Compacted PDF: {stats['before']} -> {stats['after']} bytes ({stats.get('saved_pct', 0.0)}% saved)", file=sys.stderr)
+            if metrics:
+                metrics.bytes_before = stats["before"]
+        if metrics:
+            metrics.stop("serialise")
+            metrics.bytes = len(pdf_bytes)
+        return pdf_bytes
+
+    def header(self):
+        if self._resuming:
+            return
+        self.set_font("Helvetica", "B", self.title_font_size)
+        self.page_furniture("header", self.draw_header)
+
+    def draw_header(self):
+        title_w = self.get_string_width(self.title_text) + 6
+        self.set_x((self.w - title_w) / 2)
+        self.cell(title_w, 10, self.title_text, border=0, align="C", fill=0, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        self.ln(self.title_spacing)
+        self.header_details()
+
+    def header_details(self):
+        pass
+
+    def footer(self):
+        self.set_y(-15)
+        self.set_font("Helvetica", "I", 8)
+        self.set_text_color(128)
+        self.cell(0, 10, f"Página {self.page_no() + self.page_number_offset}", align="C")
+        self.page_furniture("footer", self.draw_footer)
+
+    def draw_footer(self):
+        self.footer_details()
+        self.cell(0, 10, self.footer_text, align="R")
+
+    def footer_details(self):
+        pass
+
+    def page_furniture(self, name, draw):
+        # Calls draw(), which must draw the same thing on every page, once as a
+        # form XObject; later calls with the same name and graphics state only
+        # place the form and move the cursor the way draw() did. The graphics
+        # state is left as it was before the call.
+        if not self.reuse_furniture or getattr(self, "appendable", False):
+            draw()
+            return
+        if self._furniture is None:
+            self._furniture = {}
+        key = (name, self.font_family, self.font_style, self.font_size_pt, self.text_color, self.fill_color, self.draw_color, self.line_width)
+        form = self._furniture.get(key)
+        if form is None:
+            form = self._furniture[key] = self._record_furniture(draw)
+        index, x, y, x_after, y_after = form
+        if (self.x, self.y) == (x, y):
+            self._out(f"/I{index} Do")
+            # The exact cursor position drawing inline would leave
+            self.x, self.y = x_after, y_after
+        else:
+            self._out(f"q 1 0 0 1 {(self.x - x) * self.k:.2f} {(y - self.y) * self.k:.2f} cm /I{index} Do Q")
+            self.x += x_after - x
+            self.y += y_after - y
+        if self._page_writer is None:
+            self._resource_catalog.add(PDFResourceType.X_OBJECT, index, self.page)
+
+    def _record_furniture(self, draw):
+        x, y = self.x, self.y
+        contents = self.pages[self.page].contents
+        start = len(contents)
+        self._push_local_stack()
+        # The form selects its own font rather than relying on the page's
+        self.current_font_is_set_on_page = False
+        draw()
+        self._pop_local_stack()
+        form_contents = bytes(contents[start:])
+        del contents[start:]
+        x_after, y_after = self.x, self.y
+        self.x, self.y = x, y
+        width, height = self.pages[self.page].dimensions()
+        if self._page_writer is not None:
+            index = self._page_writer.add_form(form_contents, (width, height))
+            return index, x, y, x_after, y_after
+        # Registered like fpdf's own form XObjects (blend groups), named /I<index>
+        catalog = self._resource_catalog
+        index = catalog.next_xobject_index
+        catalog.next_xobject_index += 1
+        xobject = PDFContentStream(contents=form_contents, compress=self.compress)
+        xobject.type = Name("XObject")
+        xobject.subtype = Name("Form")
+        xobject.b_box = PDFArray([0, 0, round(width, 2), round(height, 2)])
+        xobject.resources = _PageResources(self.pages[self.page])
+        catalog.form_xobjects.append((index, xobject))
+        return index, x, y, x_after, y_after
+
+    def set_issued_at(self, issued_at):
+        # Accepts a datetime or an ISO 8601 string such as "2025-05-31T18:00:00"
+        if isinstance(issued_at, str):
+            issued_at = datetime.fromisoformat(issued_at)
+        self.issued_at = issued_at
+        # Naive timestamps are taken as UTC rather than the host's local zone
+        creation_date = issued_at if issued_at.tzinfo else issued_at.replace(tzinfo=timezone.utc)
+        self.set_creation_date(creation_date)
+
+    def issued_at_text(self, fmt="%Y-%m-%d %H:%M:%S"):
+        return (self.issued_at or datetime.now()).strftime(fmt)
+
+    def add_key_value(self, key, value):
+        self.set_font("Helvetica", "B", self.body_font_size)
+        self.cell(self.key_width, self.line_height, f"{key}:")
+        self.set_font("Helvetica", "", self.body_font_size)
+        self.multi_cell(0, self.line_height, str(value), new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+
+    def row_cells(self, widths, h, values, aligns, border=1):
+        # Draws one table row of single-line cells, like calling cell() per
+        # column, but with one graphics-state snapshot for the whole row and
+        # text widths taken from the width tables. The caller handles page
+        # breaks and the final ln().
+        if self.metrics:
+            self.metrics.rows += 1
+        graphics_state = self._get_current_graphics_state()
+        k = self.k
+        nb_alias = self.str_alias_nb_pages
+        for w, value, align in zip(widths, values, aligns):
+            text = self.normalize_text(str(value))
+            if nb_alias and nb_alias in text:
+                self.cell(w, h, text, border=border, align=align)
+                continue
+            text_line = TextLine(
+                (Fragment(text, graphics_state, k),) if text else (),
+                text_width=self.get_string_width(text, normalized=True) if text else 0,
+                number_of_spaces=0,
+                align=ALIGNS[align],
+                height=h,
+                max_width=w,
+                trailing_nl=False,
+            )
+            self._render_styled_text_line(text_line, h, border, new_x=XPos.RIGHT, new_y=YPos.TOP, link="")
+
+    def row_cell_lines(self, widths, h, cell_lines, aligns, line_h, wrap_line_h, border=1):
+        # row_cells() for a row of height h whose cells hold several lines:
+        # cell_lines has a tuple of normalised lines per cell. A single line
+        # sits in the first line_h of the cell, as in a one-line row; longer
+        # cells are drawn every wrap_line_h from the same first baseline.
+        if self.metrics:
+            self.metrics.rows += 1
+        graphics_state = self._get_current_graphics_state()
+        x, y = self.x, self.y
+        top = y + (line_h - wrap_line_h) / 2
+        for w, lines, align in zip(widths, cell_lines, aligns):
+            if border:
+                self.rect(x, y, w, h)
+            if len(lines) == 1:
+                self.set_xy(x, y)
+                self._cell_text(w, line_h, lines[0], align, 0, graphics_state)
+            else:
+                for index, line in enumerate(lines):
+                    self.set_xy(x, top + index * wrap_line_h)
+                    self._cell_text(w, wrap_line_h, line, align, 0, graphics_state)
+            x += w
+        self.set_xy(x, y)
+
+    def _cell_text(self, w, h, text, align, border, graphics_state):
+        # One cell of normalised text at the cursor, as in row_cells; the cursor moves right
+        nb_alias = self.str_alias_nb_pages
+        if nb_alias and nb_alias in text:
+            self.cell(w, h, text, border=border, align=align)
+            return
+        text_line = TextLine(
+            (Fragment(text, graphics_state, self.k),) if text else (),
+            text_width=self.get_string_width(text, normalized=True) if text else 0,
+            number_of_spaces=0,
+            align=ALIGNS[align],
+            height=h,
+            max_width=w,
+            trailing_nl=False,
+        )
+        self._render_styled_text_line(text_line, h, border, new_x=XPos.RIGHT, new_y=YPos.TOP, link="")
+
+    def set_font(self, family=None, style="", size=0):
+        # Statements call set_font once per row; skip fpdf's argument
+        # normalisation when the requested font is already selected.
+        normalized = _normalized_fonts.get((family, style))
+        if normalized is None:
+            if not family or not isinstance(style, str) or "U" in style.upper() or "S" in style.upper():
+                return super().set_font(family, style, size)
+            normalized = (family.lower(), "".join(sorted(style.upper())))
+            _normalized_fonts[(family, style)] = normalized
+        if normalized[0] == "helvetica" and self._font_alias is not False:
+            alias = self._ttf_family()
+            if alias:
+                family = alias
+                normalized = (alias, normalized[1])
+                if alias + normalized[1] not in self.fonts:
+                    ttf_fonts.add_font(self, alias, normalized[1])
+        if (
+            normalized[0] == self.font_family
+            and normalized[1] == self.font_style
+            and (not size or size == self.font_size_pt)
+            and self.current_font is not None
+            and not self.underline
+            and not self.strikethrough
+        ):
+            return
+        super().set_font(family, style, size)
+
+    def _ttf_family(self):
+        if self._font_alias is None:
+            self._font_alias = self.font_family_override or False
+        return self._font_alias
+
+    def set_text_color(self, r, g=-1, b=-1):
+        args = (r, g, b)
+        if args == self._text_color_args and self.text_color is self._text_color_value:
+            return
+        super().set_text_color(r, g, b)
+        self._text_color_args = args
+        self._text_color_value = self.text_color
+
+    def get_string_width(self, s, normalized=False, markdown=False):
+        font = self.current_font
+        table = WIDTH_TABLES.get(font.fontkey) if font is not None else None
+        if (
+            markdown
+            or (table is None and (font is None or font.type != "TTF"))
+            or self.char_spacing
+            or self.font_stretching != 100
+            or (table is not None and s and max(s) > "\xff")
+        ):
+            return super().get_string_width(s, normalized, markdown)
+        cache_key = (font.fontkey, self.font_size_pt, self.k)
+        widths = _string_widths.get(cache_key)
+        if widths is None:
+            widths = _string_widths[cache_key] = {}
+        width = widths.get(s)
+        if width is None:
+            if table is None:
+                # TTF widths are keyed by code point, with a default for missing glyphs
+                cw = font.cw
+                width = sum(cw[ord(c)] for c in s) * self.font_size_pt * 0.001 / self.k
+            else:
+                try:
+                    width = sum(table[c] for c in s) * self.font_size_pt * 0.001 / self.k
+                except KeyError:
+                    return super().get_string_width(s, normalized, markdown)
+            if len(widths) >= MAX_CACHED_WIDTHS:
+                widths.clear()
+            widths[s] = width
+        return width
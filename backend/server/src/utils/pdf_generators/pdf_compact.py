@@ -0,0 +1,328 @@
+import os
+import re
+import sys
+import json
+import zlib
+
+# Output compaction for the generated PDFs, which are archived for years.
+# Works on the finished file (fpdf output or anything already in uploads/):
+#   - every stream is (re)compressed with Flate at the requested zlib level
+#   - page content streams are split where consecutive pages start with the
+#     same drawing sequence (title, header details, table header), so that
+#     prefix is stored once and each page's /Contents lists [prefix, rest].
+#     Not for appendable statements: statement_append.py needs the last page
+#     as one content stream (split_pages=False; the CLI checks the file)
+#   - byte-identical objects are merged and references rewritten
+#   - objects are renumbered densely and the xref rebuilt
+# Returns the new bytes plus before/after sizes.
+#
+# Handles the plain structure fpdf writes ("N 0 obj" objects, stream
+# dictionaries without strings, no object streams, xref streams or
+# incremental updates); anything else is returned unchanged. Object and
+# stream boundaries and "N 0 R" references are only looked for outside
+# (literal) and <hex> strings, so a title or text that reads like PDF syntax
+# is kept as is.
+#
+#   python pdf_compact.py in.pdf out.pdf [--level 0-9]
+
+DEFAULT_LEVEL = 9
+# Shorter shared prefixes are not worth an extra stream object
+MIN_SHARED_PREFIX = 128
+
+OBJ_RE = re.compile(rb"(\d+) 0 obj\n")
+LENGTH_RE = re.compile(rb"/Length (\d+)")
+REF_RE = re.compile(rb"\b(\d+) 0 R\b")
+CONTENTS_RE = re.compile(rb"/Contents (\d+) 0 R")
+TRAILER_RE = re.compile(rb"trailer\n(<<.*?>>)\nstartxref", re.S)
+# Where a string starts, or the dictionary of an object ends
+TOKEN_RE = re.compile(rb"<<|\(|<|\nstream\n|\nendobj\n")
+LITERAL_RE = re.compile(rb"[()\\]")
+
+class UnsupportedPDF(ValueError):
+    pass
+
+def _string_end(data, pos, token):
+    # End of the (literal) or <hex> string that starts with token at pos
+    if token == b"<":
+        end = data.find(b">", pos)
+        if end == -1:
+            raise UnsupportedPDF("Unterminated hex string.")
+        return end + 1
+    depth = 1
+    pos += 1
+    while depth:
+        m = LITERAL_RE.search(data, pos)
+        if m is None:
+            raise UnsupportedPDF("Unterminated string.")
+        pos = m.end()
+        if m.group() == b"\\":
+            pos += 1
+        else:
+            depth += 1 if m.group() == b"(" else -1
+    return pos
+
+def _scan(data, pos):
+    # -> (position of the next "\nstream\n"/"\nendobj\n" outside strings or -1,
+    #     [(start, end) of the strings before it])
+    strings = []
+    while True:
+        m = TOKEN_RE.search(data, pos)
+        if m is None:
+            return -1, strings
+        token = m.group()
+        if token == b"<<":
+            pos = m.end()
+        elif token in (b"(", b"<"):
+            pos = _string_end(data, m.start(), token)
+            strings.append((m.start(), pos))
+        else:
+            return m.start(), strings
+
+def _masked(data):
+    # data with the inside of its strings blanked, same length, for the regexes
+    strings = _scan(data, 0)[1]
+    if not strings:
+        return data
+    out = bytearray(data)
+    for start, end in strings:
+        out[start + 1:end - 1] = b" " * (end - start - 2)
+    return bytes(out)
+
+def _parse(pdf_bytes):
+    # -> (header, {id: [dict_bytes, stream_data or None]}, trailer_dict)
+    if pdf_bytes.count(b"%%EOF") != 1 or b"/ObjStm" in pdf_bytes or b"/XRef" in pdf_bytes:
+        raise UnsupportedPDF("Only single-revision PDFs with a classic xref table are supported.")
+    first = OBJ_RE.search(pdf_bytes)
+    if first is None:
+        raise UnsupportedPDF("No objects found.")
+    header = pdf_bytes[:first.start()]
+    objects = {}
+    pos = first.start()
+    while True:
+        m = OBJ_RE.match(pdf_bytes, pos)
+        if m is None:
+            break
+        obj_id = int(m.group(1))
+        start = m.end()
+        end, strings = _scan(pdf_bytes, start)
+        if end == -1:
+            raise UnsupportedPDF(f"Object {obj_id} is not terminated.")
+        if pdf_bytes.startswith(b"\nstream\n", end):
+            if strings:
+                raise UnsupportedPDF(f"Stream object {obj_id} has strings in its dictionary.")
+            stream_at = end
+            dictionary = pdf_bytes[start:stream_at]
+            length = LENGTH_RE.search(dictionary)
+            if length is None:
+                raise UnsupportedPDF(f"Stream object {obj_id} has no direct /Length.")
+            data_start = stream_at + len(b"\nstream\n")
+            data = pdf_bytes[data_start:data_start + int(length.group(1))]
+            pos = data_start + len(data)
+            if not pdf_bytes.startswith(b"\nendstream\nendobj\n", pos):
+                raise UnsupportedPDF(f"Stream object {obj_id} does not end where /Length says.")
+            pos += len(b"\nendstream\nendobj\n")
+            objects[obj_id] = [dictionary, data]
+        else:
+            objects[obj_id] = [pdf_bytes[start:end], None]
+            pos = end + len(b"\nendobj\n")
+    trailer = TRAILER_RE.search(pdf_bytes, pos)
+    if trailer is None:
+        raise UnsupportedPDF("No trailer found.")
+    return header, objects, trailer.group(1)
+
+def _decoded(dictionary, data):
+    # Raw stream bytes if the stream is plain or Flate-only, else None (left as is)
+    if b"/Filter" not in dictionary:
+        return data
+    if re.search(rb"/Filter\s*/FlateDecode\b", dictionary) and b"/DecodeParms" not in dictionary:
+        return zlib.decompress(data)
+    return None
+
+def _stream_dict(dictionary, length):
+    # Keeps the stream's other keys, replacing /Filter and /Length
+    body = dictionary.strip()[2:-2]
+    body = re.sub(rb"/Filter\s*/FlateDecode\b\n?", b"", body)
+    body = LENGTH_RE.sub(b"", body)
+    other = b"\n".join(line for line in body.split(b"\n") if line.strip())
+    return b"<<\n/Filter /FlateDecode\n/Length %d\n" % length + (other + b"\n" if other else b"") + b">>"
+
+def _line_prefix(a, b):
+    # Length of the common prefix of a and b, cut back to a line boundary
+    n = len(os.path.commonprefix([a, b]))
+    if n == len(a) == len(b):
+        return n
+    return a.rfind(b"\n", 0, n) + 1
+
+def _split_shared_prefixes(objects):
+    # Page content streams whose start matches the previous or next page are split in two
+    pages = []
+    for obj_id, (dictionary, data) in objects.items():
+        if data is not None:
+            continue
+        masked = _masked(dictionary)
+        m = CONTENTS_RE.search(masked) if b"/Type /Page\n" in masked else None
+        if m and objects.get(int(m.group(1)), [None, None])[1] is not None:
+            pages.append((obj_id, int(m.group(1)), m.span()))
+    contents = []
+    for _, stream_id, _ in pages:
+        dictionary, data = objects[stream_id]
+        contents.append(_decoded(dictionary, data))
+    next_id = max(objects) + 1
+    shared = 0
+    for index, (page_id, stream_id, (start, end)) in enumerate(pages):
+        data = contents[index]
+        if data is None:
+            continue
+        prefix = 0
+        for other in (index - 1, index + 1):
+            if 0 <= other < len(pages) and contents[other] is not None:
+                prefix = max(prefix, _line_prefix(data, contents[other]))
+        if prefix < MIN_SHARED_PREFIX or prefix >= len(data):
+            continue
+        head_id, tail_id = next_id, next_id + 1
+        next_id += 2
+        objects[head_id] = [b"<<\n/Length 0\n>>", data[:prefix]]
+        objects[tail_id] = [b"<<\n/Length 0\n>>", data[prefix:]]
+        page_dict = objects[page_id][0]
+        objects[page_id][0] = page_dict[:start] + b"/Contents [%d 0 R %d 0 R]" % (head_id, tail_id) + page_dict[end:]
+        shared += 1
+    return shared
+
+def _refs(data):
+    return [int(ref) for ref in REF_RE.findall(_masked(data))]
+
+def _rewrite_refs(data, mapping):
+    # References outside strings renumbered through mapping
+    out = []
+    pos = 0
+    for m in REF_RE.finditer(_masked(data)):
+        obj_id = int(m.group(1))
+        if obj_id in mapping:
+            out += [data[pos:m.start()], b"%d 0 R" % mapping[obj_id]]
+            pos = m.end()
+    if not pos:
+        return data
+    out.append(data[pos:])
+    return b"".join(out)
+
+def compact(pdf_bytes, level=DEFAULT_LEVEL, split_pages=True):
+    # Returns (compacted_bytes, stats); the input comes back unchanged if it cannot be handled
+    before = len(pdf_bytes)
+    try:
+        header, objects, trailer = _parse(pdf_bytes)
+    except (UnsupportedPDF, zlib.error) as e:
+        return pdf_bytes, {"before": before, "after": before, "skipped": str(e)}
+
+    shared_prefixes = _split_shared_prefixes(objects) if split_pages else 0
+
+    # Recompress every stream we can decode
+    for obj in objects.values():
+        dictionary, data = obj
+        if data is None:
+            continue
+        raw = _decoded(dictionary, data)
+        if raw is None:
+            continue
+        data = zlib.compress(raw, level)
+        obj[0] = _stream_dict(dictionary, len(data))
+        obj[1] = data
+
+    # Merge identical objects; repeat while merging makes more objects identical
+    # (two pages pointing at streams that just became one)
+    duplicates = {}
+    while True:
+        seen = {}
+        merged = 0
+        for obj_id in sorted(objects):
+            if obj_id in duplicates:
+                continue
+            dictionary, data = objects[obj_id]
+            key = (_rewrite_refs(dictionary, duplicates), data)
+            if key in seen:
+                duplicates[obj_id] = seen[key]
+                merged += 1
+            else:
+                seen[key] = obj_id
+        if not merged:
+            break
+        # Point mappings at the final survivor
+        for obj_id, target in duplicates.items():
+            while target in duplicates:
+                target = duplicates[target]
+            duplicates[obj_id] = target
+
+    # Drop objects nothing refers to any more (the original unsplit content streams)
+    kept = {obj_id: obj for obj_id, obj in objects.items() if obj_id not in duplicates}
+    referenced = set()
+    for dictionary, _ in kept.values():
+        referenced.update(_refs(_rewrite_refs(dictionary, duplicates)))
+    referenced.update(_refs(_rewrite_refs(trailer, duplicates)))
+    kept = {obj_id: obj for obj_id, obj in kept.items() if obj_id in referenced}
+
+    # Dense renumbering in original order
+    renumber = {obj_id: new_id for new_id, obj_id in enumerate(sorted(kept), start=1)}
+    mapping = {obj_id: renumber[duplicates.get(obj_id, obj_id)] for obj_id in list(objects) if duplicates.get(obj_id, obj_id) in renumber}
+
+    out = bytearray(header)
+    offsets = []
+    for obj_id in sorted(kept):
+        dictionary, data = kept[obj_id]
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % renumber[obj_id] + _rewrite_refs(dictionary, mapping)
+        if data is not None:
+            out += b"\nstream\n" + data + b"\nendstream"
+        out += b"\nendobj\n"
+    size = len(offsets) + 1
+    trailer = re.sub(rb"/Size \d+", b"/Size %d" % size, _rewrite_refs(trailer, mapping))
+    xref_pos = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % size
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n" + trailer + b"\nstartxref\n%d\n%%%%EOF\n" % xref_pos
+
+    after = len(out)
+    return bytes(out), {
+        "before": before,
+        "after": after,
+        "saved_pct": round((1 - after / before) * 100, 1) if before else 0.0,
+        "level": level,
+        "shared_prefixes": shared_prefixes,
+        "deduplicated_objects": len(duplicates),
+    }
+
+def _appendable(pdf_bytes):
+    # Whether the file carries statement_append.py's state
+    import io
+    import statement_append
+    try:
+        statement_append.read_state(statement_append.PDFFile(io.BytesIO(pdf_bytes)))
+    except (ValueError, zlib.error):
+        return False
+    return True
+
+def level_from_env():
+    # FININVEST_PDF_COMPACT=<0-9> turns compaction on for every generator at that zlib level
+    value = os.environ.get("FININVEST_PDF_COMPACT")
+    if not value:
+        return None
+    level = int(value)
+    if not 0 <= level <= 9:
+        raise ValueError("FININVEST_PDF_COMPACT must be a zlib level between 0 and 9.")
+    return level
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    level = DEFAULT_LEVEL
+    if "--level" in args:
+        i = args.index("--level")
+        level = int(args[i + 1])
+        del args[i:i + 2]
+    if len(args) == 2:
+        with open(args[0], "rb") as f:
+            pdf_bytes = f.read()
+        compacted, stats = compact(pdf_bytes, level, split_pages=not _appendable(pdf_bytes))
+        with open(args[1], "wb") as f:
+            f.write(compacted)
+        print(json.dumps(stats))
+    else:
+        print("Usage: python pdf_compact.py <input.pdf> <output.pdf> [--level 0-9]", file=sys.stderr)
+        sys.exit(1)
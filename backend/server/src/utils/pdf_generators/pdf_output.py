@@ -0,0 +1,42 @@
+import sys
+
+import instrumentation
+
+# Shared output step for the generators. An output path of "-" streams the PDF
+# to stdout so callers can pipe it straight into an HTTP response; the status
+# line then goes to stderr to keep stdout pure PDF bytes. Writing is the last
+# instrumented phase, so the document's metrics are emitted here.
+
+def write_pdf(pdf_bytes, output_path, description):
+    metrics = instrumentation.active()
+    if metrics:
+        metrics.start("write")
+    if output_path == "-":
+        sys.stdout.buffer.write(pdf_bytes)
+        sys.stdout.buffer.flush()
+        message = f"PDF {description} written to stdout ({len(pdf_bytes)} bytes)"
+    else:
+        with open(output_path, "wb") as f:
+            f.write(pdf_bytes)
+        message = f"PDF {description} generated successfully at: {output_path}"
+    if metrics:
+        metrics.stop("write")
+        instrumentation.finish()
+    print(message, file=sys.stderr if output_path == "-" else sys.stdout)
+
+def stream_pdf(pdf, layout, output_path, description):
+    # Streaming counterpart of write_pdf: pages go to output_path while layout()
+    # draws them (see FininvestPDF.stream_to)
+    if output_path == "-":
+        pdf.stream_to(sys.stdout.buffer)
+        layout()
+        size = pdf.finish_stream()
+        message = f"PDF {description} written to stdout ({size} bytes)"
+    else:
+        with open(output_path, "wb") as f:
+            pdf.stream_to(f)
+            layout()
+            pdf.finish_stream()
+        message = f"PDF {description} generated successfully at: {output_path}"
+    instrumentation.finish()
+    print(message, file=sys.stderr if output_path == "-" else sys.stdout)
@@ -0,0 +1,71 @@
+import os
+import importlib
+
+# Maps the doc_type used by the worker/batch entry points to the generator
+# module that renders it. Every module exposes generate_pdf(output_path, ...),
+# render_bytes(...) and build_pdf(...), and a job payload is passed to them as
+# keyword arguments, e.g.
+#   receipt          -> {"receipt_data": {...}}
+#   member_statement -> {"member_name": ..., "period_start": ..., "period_end": ..., "statement_data": [...]}
+GENERATORS = {
+    "receipt": "generate_receipt",
+    "loan_payment_receipt": "generate_loan_payment_receipt",
+    "transfer_proof": "generate_transfer_proof",
+    "loan_contract": "generate_loan_contract",
+    "membership_agreement": "generate_membership_agreement",
+    "credit_approval_proof": "generate_credit_approval_proof",
+    "member_statement": "generate_member_statement",
+    "loan_statement": "generate_loan_statement",
+}
+
+_loaded = {}
+
+def get_generator(doc_type):
+    if doc_type not in GENERATORS:
+        raise ValueError(f"Unknown doc_type '{doc_type}'. Expected one of: {', '.join(sorted(GENERATORS))}")
+    module = _loaded.get(doc_type)
+    if module is None:
+        # Imported once per process, so a long-lived worker pays for fpdf only on the first job
+        module = importlib.import_module(GENERATORS[doc_type])
+        _loaded[doc_type] = module
+    return module
+
+def ensure_output_dir(output_path):
+    output_dir = os.path.dirname(output_path)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+
+def render(doc_type, output_path, payload):
+    if not isinstance(payload, dict):
+        raise ValueError("Job payload must be a JSON object.")
+    # Imported here, so the dispatcher's usage and error paths don't load it
+    import instrumentation
+    module = get_generator(doc_type)
+    ensure_output_dir(output_path)
+    # Metrics (when enabled) are emitted by write_pdf once the file is written
+    instrumentation.begin(doc_type)
+    try:
+        module.generate_pdf(output_path, **payload)
+    except Exception:
+        instrumentation.discard()
+        raise
+
+def build_pdf(doc_type, payload):
+    # The laid-out document object, before serialisation (used to merge documents)
+    if not isinstance(payload, dict):
+        raise ValueError("Job payload must be a JSON object.")
+    return get_generator(doc_type).build_pdf(**payload)
+
+def render_bytes(doc_type, payload):
+    if not isinstance(payload, dict):
+        raise ValueError("Job payload must be a JSON object.")
+    import instrumentation
+    module = get_generator(doc_type)
+    instrumentation.begin(doc_type)
+    try:
+        pdf_bytes = module.render_bytes(**payload)
+    except Exception:
+        instrumentation.discard()
+        raise
+    instrumentation.finish()
+    return pdf_bytes
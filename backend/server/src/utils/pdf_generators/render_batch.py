@@ -0,0 +1,53 @@
+import sys
+import json
+import time
+
+from render_worker import handle_line
+from memory_budget import record_peak, format_peaks
+
+# Renders a whole JSONL manifest in one process. Each manifest line is a job:
+#   {"output_path": "uploads/receipts/q_2025_05_17.pdf", "doc_type": "receipt", "payload": {"receipt_data": {...}}}
+# and produces one report line with status, bytes written and elapsed ms.
+# A failing line is reported and the batch carries on with the next one.
+# The summary gives the peak memory seen per doc_type (see memory_budget.py).
+
+def run_manifest(manifest_file, report_file):
+    ok = failed = 0
+    peaks = {}
+    start = time.perf_counter()
+    for line_no, line in enumerate(manifest_file, start=1):
+        if not line.strip():
+            continue
+        result = handle_line(line)
+        result["line"] = line_no
+        record_peak(peaks, result)
+        if result["status"] == "ok":
+            ok += 1
+        else:
+            failed += 1
+        report_file.write(json.dumps(result) + "\n")
+        report_file.flush()
+    elapsed_s = time.perf_counter() - start
+    return {"ok": ok, "failed": failed, "elapsed_s": round(elapsed_s, 3), "peak_rss_mb": peaks}
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        manifest_path = sys.argv[1]
+        report_path = sys.argv[2] if len(sys.argv) > 2 else "-"
+        manifest_file = sys.stdin if manifest_path == "-" else open(manifest_path, encoding="utf-8")
+        report_file = sys.stdout if report_path == "-" else open(report_path, "w", encoding="utf-8")
+        try:
+            summary = run_manifest(manifest_file, report_file)
+        finally:
+            if manifest_file is not sys.stdin:
+                manifest_file.close()
+            if report_file is not sys.stdout:
+                report_file.close()
+        print(f"Batch finished: {summary['ok']} ok, {summary['failed']} failed in {summary['elapsed_s']}s", file=sys.stderr)
+        if summary["peak_rss_mb"]:
+            print(f"Peak memory: {format_peaks(summary['peak_rss_mb'])}", file=sys.stderr)
+        sys.exit(1 if summary["failed"] else 0)
+    else:
+        print("Usage: python render_batch.py <manifest.jsonl|-> [report.jsonl|-]", file=sys.stderr)
+        print("Manifest line: {\"output_path\": \"...\", \"doc_type\": \"receipt\", \"payload\": {...}}", file=sys.stderr)
+        sys.exit(1)
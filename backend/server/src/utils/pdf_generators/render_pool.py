@@ -0,0 +1,107 @@
+import sys
+import os
+import json
+import time
+import argparse
+import collections
+from concurrent.futures import ProcessPoolExecutor
+
+from render_worker import handle_line
+from memory_budget import record_peak, format_peaks
+
+# Parallel version of render_batch.py for month-end runs. Manifest lines are
+# spread across a ProcessPoolExecutor and the report comes back in manifest
+# order. Each worker process imports the generators once and is replaced after
+# --max-jobs-per-worker jobs so long runs don't accumulate fpdf state. Workers
+# take whole chunks, so that rounds down to a multiple of --chunksize (which is
+# lowered to the limit if it is larger).
+#
+# A worker whose memory grew past FININVEST_PDF_RECYCLE_RSS_MB (see
+# memory_budget.py) can't be replaced on its own, so no more chunks go to that
+# pool: once the chunks already handed out are back, the rest of the manifest
+# continues on a fresh one.
+
+def _render_chunk(lines):
+    return [handle_line(line) for line in lines]
+
+def render_manifest(lines, report_file, workers=None, chunksize=8, max_jobs_per_worker=None):
+    workers = workers or os.cpu_count() or 1
+    max_chunks_per_worker = None
+    if max_jobs_per_worker:
+        chunksize = min(chunksize, max_jobs_per_worker)
+        max_chunks_per_worker = max_jobs_per_worker // chunksize
+    jobs = [(line_no, line) for line_no, line in enumerate(lines, start=1) if line.strip()]
+    chunks = collections.deque(jobs[i:i + chunksize] for i in range(0, len(jobs), chunksize))
+    ok = failed = 0
+    busy_ms = 0.0
+    peaks = {}
+    pools = 0
+    start = time.perf_counter()
+    while chunks:
+        pools += 1
+        recycle = False
+        with ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=max_chunks_per_worker) as executor:
+            # Chunks in manifest order, a couple per worker in flight
+            submitted = collections.deque()
+            while chunks or submitted:
+                while chunks and not recycle and len(submitted) < 2 * workers:
+                    chunk = chunks.popleft()
+                    submitted.append((chunk, executor.submit(_render_chunk, [line for _, line in chunk])))
+                if not submitted:
+                    break
+                chunk, future = submitted.popleft()
+                for (line_no, _), result in zip(chunk, future.result()):
+                    result["line"] = line_no
+                    busy_ms += result.get("elapsed_ms", 0)
+                    record_peak(peaks, result)
+                    recycle = recycle or bool(result.get("recycle"))
+                    if result["status"] == "ok":
+                        ok += 1
+                    else:
+                        failed += 1
+                    report_file.write(json.dumps(result) + "\n")
+    wall_ms = (time.perf_counter() - start) * 1000
+    # Speedup is the summed per-job render time over the wall time; efficiency
+    # is how much of the ideal N-times speedup the pool actually achieved.
+    speedup = busy_ms / wall_ms if wall_ms else 0.0
+    return {
+        "ok": ok,
+        "failed": failed,
+        "workers": workers,
+        "wall_ms": round(wall_ms, 2),
+        "busy_ms": round(busy_ms, 2),
+        "speedup": round(speedup, 2),
+        "efficiency": round(speedup / workers, 3),
+        "pools": pools,
+        "peak_rss_mb": peaks,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render a JSONL manifest across a pool of processes.")
+    parser.add_argument("manifest", help="JSONL manifest path, or - for stdin")
+    parser.add_argument("report", nargs="?", default="-", help="JSONL report path, or - for stdout (default)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunksize", type=int, default=8, help="Jobs handed to a worker at a time")
+    parser.add_argument("--max-jobs-per-worker", type=int, default=None, help="Recycle a worker after this many jobs (rounded down to whole chunks)")
+    args = parser.parse_args()
+
+    if args.manifest == "-":
+        lines = sys.stdin.readlines()
+    else:
+        with open(args.manifest, encoding="utf-8") as f:
+            lines = f.readlines()
+
+    report_file = sys.stdout if args.report == "-" else open(args.report, "w", encoding="utf-8")
+    try:
+        summary = render_manifest(lines, report_file, args.workers, args.chunksize, args.max_jobs_per_worker)
+    finally:
+        if report_file is not sys.stdout:
+            report_file.close()
+    print(
+        f"Pool finished: {summary['ok']} ok, {summary['failed']} failed in {summary['wall_ms'] / 1000:.2f}s "
+        f"on {summary['workers']} workers (speedup {summary['speedup']}x, efficiency {summary['efficiency'] * 100:.0f}%)",
+        file=sys.stderr,
+    )
+    if summary["peak_rss_mb"]:
+        print(f"Peak memory: {format_peaks(summary['peak_rss_mb'])} (pools started: {summary['pools']})", file=sys.stderr)
+    sys.exit(1 if summary["failed"] else 0)
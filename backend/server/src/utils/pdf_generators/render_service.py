@@ -0,0 +1,306 @@
+import sys
+import os
+import json
+import time
+import signal
+import asyncio
+import argparse
+import collections
+
+from memory_budget import record_peak
+
+# Local render service for the Node backend. Listens on a Unix socket and
+# speaks the render_worker.py protocol (one JSON job per line in, one JSON
+# result per line out), but puts a bounded queue and a fixed number of worker
+# processes between the callers and the renderer:
+#
+#   - jobs wait in a queue of at most --queue-size; when it is full the job is
+#     answered at once with {"status": "rejected", "code": 429}, so a burst of
+#     downloads gets pushed back instead of spawning more Python processes
+#   - --workers render_worker.py processes take jobs off the queue, each
+#     rendering one job at a time
+#   - every job has a deadline (--timeout, or "timeout_s" in the job, capped at
+#     --max-timeout) covering queue wait and rendering; a job still queued at
+#     its deadline is dropped, and a worker still rendering is killed and
+#     replaced. Either way the caller gets {"status": "timeout", "code": 504}
+#   - a worker that reports "recycle": true (over FININVEST_PDF_RECYCLE_RSS_MB,
+#     or its job hit FININVEST_PDF_JOB_MAX_MB, see memory_budget.py) exits
+#     after that result and a fresh one takes its place
+#   - {"op": "stats"} returns queue depth, busy workers, counters,
+#     queue-wait / total latency percentiles over the last --stats-window jobs,
+#     the peak worker memory seen per doc_type and, with FININVEST_PDF_CACHE_DIR
+#     set, the output cache counters summed over every worker the service ran
+#
+# A connection may send several jobs without waiting; results are written as
+# they finish, so match them by "id".
+#
+#   python render_service.py --socket /run/fininvest/pdf.sock --workers 4 --queue-size 64 --timeout 30
+
+# Workers run as python -m render_worker with this module's directory on their
+# path; inside a zipapp that directory is the .pyz, which zipimport reads
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+WORKER_COMMAND = [sys.executable, "-m", "render_worker"]
+# Longest JSON line accepted from a client or a worker
+LINE_LIMIT = 64 * 1024 * 1024
+# Output cache counters a worker reports in "cache_stats", summed across workers
+CACHE_COUNTERS = ("hits", "misses", "evictions")
+
+class WorkerProcess:
+    # One render_worker.py child on stdin/stdout pipes
+    def __init__(self):
+        self.proc = None
+        # Output cache counters of the current child (its last "cache_stats")
+        # and of the children it replaced
+        self.cache_stats = None
+        self.retired_cache = collections.Counter()
+
+    def _retire_cache_stats(self):
+        if self.cache_stats:
+            self.retired_cache.update({name: self.cache_stats.get(name, 0) for name in CACHE_COUNTERS})
+        self.cache_stats = None
+
+    async def start(self):
+        self._retire_cache_stats()
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [MODULE_DIR, os.environ.get("PYTHONPATH")])))
+        self.proc = await asyncio.create_subprocess_exec(
+            *WORKER_COMMAND,
+            env=env,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            limit=LINE_LIMIT,
+        )
+
+    async def render(self, job, timeout):
+        if self.proc is None or self.proc.returncode is not None:
+            await self.start()
+        self.proc.stdin.write((json.dumps(job) + "\n").encode("utf-8"))
+        await self.proc.stdin.drain()
+        line = await asyncio.wait_for(self.proc.stdout.readline(), timeout)
+        if not line:
+            raise RuntimeError(f"Render worker exited with code {await self.proc.wait()}.")
+        result = json.loads(line)
+        if isinstance(result.get("cache_stats"), dict):
+            self.cache_stats = result["cache_stats"]
+        return result
+
+    async def stop(self):
+        if self.proc is not None and self.proc.returncode is None:
+            self.proc.kill()
+            await self.proc.wait()
+        self.proc = None
+        self._retire_cache_stats()
+
+class RenderService:
+    def __init__(self, workers=None, queue_size=64, timeout=60.0, max_timeout=300.0, stats_window=1000):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.timeout = timeout
+        self.max_timeout = max_timeout
+        self.busy = 0
+        self.counts = collections.Counter()
+        self.queue_wait_ms = collections.deque(maxlen=stats_window)
+        self.total_ms = collections.deque(maxlen=stats_window)
+        self.peak_rss_mb = {}
+        self.started = time.time()
+        self._tasks = []
+        self._processes = []
+
+    async def start(self):
+        for _ in range(self.workers):
+            process = WorkerProcess()
+            await process.start()
+            self._processes.append(process)
+            self._tasks.append(asyncio.create_task(self._run_worker(process)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for process in self._processes:
+            await process.stop()
+
+    def _job_timeout(self, job):
+        timeout = job.get("timeout_s") if isinstance(job, dict) else None
+        try:
+            timeout = float(timeout) if timeout is not None else self.timeout
+        except (TypeError, ValueError):
+            timeout = self.timeout
+        return max(0.0, min(timeout, self.max_timeout))
+
+    async def submit(self, job):
+        # Queues one job and waits for its result (or rejects it straight away when the queue is full)
+        job_id = job.get("id") if isinstance(job, dict) else None
+        accepted = time.perf_counter()
+        deadline = accepted + self._job_timeout(job)
+        result = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((job, accepted, deadline, result))
+        except asyncio.QueueFull:
+            self.counts["rejected"] += 1
+            return {"id": job_id, "status": "rejected", "code": 429, "error": "Render queue is full, retry later.", "queue_depth": self.queue.qsize()}
+        self.counts["accepted"] += 1
+        return await result
+
+    async def _run_worker(self, process):
+        while True:
+            job, accepted, deadline, result = await self.queue.get()
+            job_id = job.get("id") if isinstance(job, dict) else None
+            dequeued = time.perf_counter()
+            self.queue_wait_ms.append((dequeued - accepted) * 1000)
+            try:
+                if result.cancelled():
+                    # The client went away while the job was queued
+                    continue
+                remaining = deadline - dequeued
+                if remaining <= 0:
+                    self.counts["timeout"] += 1
+                    result.set_result({"id": job_id, "status": "timeout", "code": 504, "error": "Timed out waiting in the render queue."})
+                    continue
+                self.busy += 1
+                try:
+                    outcome = await process.render(job, remaining)
+                except asyncio.TimeoutError:
+                    self.counts["timeout"] += 1
+                    await process.stop()
+                    outcome = {"id": job_id, "status": "timeout", "code": 504, "error": f"Render did not finish within {self._job_timeout(job):g}s; worker restarted."}
+                except (RuntimeError, ValueError, OSError) as e:
+                    await process.stop()
+                    outcome = {"id": job_id, "status": "error", "error": f"{type(e).__name__}: {e}"}
+                finally:
+                    self.busy -= 1
+                if outcome.get("status") == "ok":
+                    self.counts["ok"] += 1
+                elif outcome.get("status") == "error":
+                    self.counts["error"] += 1
+                record_peak(self.peak_rss_mb, outcome)
+                self.total_ms.append((time.perf_counter() - accepted) * 1000)
+                if not result.done():
+                    result.set_result(outcome)
+                if outcome.get("recycle"):
+                    self.counts["recycled"] += 1
+                    await process.stop()
+            finally:
+                self.queue.task_done()
+
+    def stats(self):
+        return {
+            "status": "ok",
+            "uptime_s": round(time.time() - self.started, 1),
+            "workers": self.workers,
+            "busy_workers": self.busy,
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "jobs": dict(self.counts),
+            "queue_wait_ms": _percentiles(self.queue_wait_ms),
+            "total_ms": _percentiles(self.total_ms),
+            "peak_rss_mb": dict(self.peak_rss_mb),
+            "cache": self.cache_stats(),
+        }
+
+    def cache_stats(self):
+        # None until a worker has used the output cache
+        totals = collections.Counter()
+        latest = None
+        for process in self._processes:
+            totals.update(process.retired_cache)
+            if process.cache_stats:
+                totals.update({name: process.cache_stats.get(name, 0) for name in CACHE_COUNTERS})
+                if latest is None or process.cache_stats.get("counted_at", 0) > latest.get("counted_at", 0):
+                    latest = process.cache_stats
+        if not totals and latest is None:
+            return None
+        lookups = totals["hits"] + totals["misses"]
+        cache = {name: totals[name] for name in CACHE_COUNTERS}
+        cache["hit_ratio"] = round(totals["hits"] / lookups, 4) if lookups else 0.0
+        if latest is not None:
+            # The directory's size, as last counted by a worker (after its last write)
+            cache["bytes"] = latest.get("bytes")
+            cache["max_bytes"] = latest.get("max_bytes")
+        return cache
+
+    async def handle_line(self, line):
+        try:
+            job = json.loads(line)
+        except json.JSONDecodeError as e:
+            return {"id": None, "status": "error", "error": f"Invalid JSON: {e}"}
+        if isinstance(job, dict) and job.get("op") == "stats":
+            return self.stats()
+        return await self.submit(job)
+
+    async def handle_connection(self, reader, writer):
+        pending = set()
+
+        async def answer(line):
+            result = await self.handle_line(line)
+            writer.write((json.dumps(result) + "\n").encode("utf-8"))
+            await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.create_task(answer(line.decode("utf-8")))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            # Client closed its side; finish what it already sent
+            await asyncio.gather(*pending, return_exceptions=True)
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError) as e:
+            print(f"Render service connection dropped: {type(e).__name__}: {e}", file=sys.stderr)
+            for task in pending:
+                task.cancel()
+        finally:
+            writer.close()
+
+def _percentiles(values):
+    ordered = sorted(values)
+    if not ordered:
+        return {"count": 0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+    return {
+        "count": len(ordered),
+        "p50": round(ordered[len(ordered) // 2], 2),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+        "max": round(ordered[-1], 2),
+    }
+
+async def serve(socket_path, **options):
+    service = RenderService(**options)
+    await service.start()
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = await asyncio.start_unix_server(service.handle_connection, path=socket_path, limit=LINE_LIMIT)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    print(f"PDF render service listening on {socket_path} ({service.workers} workers, queue {service.queue.maxsize})", file=sys.stderr)
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        await service.stop()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Unix-socket PDF render service with a bounded queue.")
+    parser.add_argument("--socket", required=True, help="Unix socket path to listen on")
+    parser.add_argument("--workers", type=int, default=None, help="Render worker processes (default: CPU count)")
+    parser.add_argument("--queue-size", type=int, default=64, help="Jobs allowed to wait; further jobs are rejected with code 429")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Default per-job deadline in seconds, queue wait included")
+    parser.add_argument("--max-timeout", type=float, default=300.0, help="Upper bound for a job's own timeout_s")
+    parser.add_argument("--stats-window", type=int, default=1000, help="Recent jobs the latency percentiles are computed over")
+    args = parser.parse_args()
+    if args.queue_size < 1:
+        print("Error: --queue-size must be at least 1.", file=sys.stderr)
+        sys.exit(1)
+    asyncio.run(serve(
+        args.socket,
+        workers=args.workers,
+        queue_size=args.queue_size,
+        timeout=args.timeout,
+        max_timeout=args.max_timeout,
+        stats_window=args.stats_window,
+    ))
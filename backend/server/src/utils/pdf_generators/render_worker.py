@@ -0,0 +1,191 @@
+import sys
+import os
+import json
+import time
+import socket
+import contextlib
+import socketserver
+
+import registry
+import memory_budget
+
+# Long-lived render worker. Reads newline-delimited JSON jobs and writes one
+# JSON result line per job, so fpdf and the generator classes are imported once
+# per worker instead of once per document.
+#
+# Job:    {"id": "r-1", "doc_type": "receipt", "output_path": "uploads/receipts/r1.pdf", "payload": {"receipt_data": {...}}}
+# Result: {"id": "r-1", "status": "ok", "doc_type": "receipt", "output_path": "...", "bytes": 1432, "elapsed_ms": 12.3, "peak_rss_mb": 61.2}
+#         {"id": "r-1", "status": "error", "error": "...", ...}
+#
+# Set FININVEST_PDF_CACHE_DIR (and optionally FININVEST_PDF_CACHE_MAX_MB) to
+# serve repeated jobs from the output cache; results then carry "cache": "hit"/"miss"
+# ("bypass" for payloads without a pinned "issued_at", see output_cache.py),
+# and "cache_stats", this worker's cache counters so far (OutputCache.stats).
+# Statement payloads may set "stream": true to render in bounded memory.
+#
+# Set FININVEST_PDF_JOB_MAX_MB to fail jobs that go over that much memory
+# ("code": 413), and FININVEST_PDF_RECYCLE_RSS_MB to have a worker that grew
+# past it replaced (see memory_budget.py). The ceiling covers decoding the job
+# line too, and lines over LINE_LIMIT are not read into memory at all ("code":
+# 413). A result with "recycle": true is the last one a stdin worker writes: it
+# exits with status RECYCLE_EXIT_CODE, and jobs still waiting on its stdin have
+# to be sent to a new worker. A socket worker finishes the connection and
+# restarts itself.
+
+# Longest job line accepted, in characters (as render_service.LINE_LIMIT)
+LINE_LIMIT = 64 * 1024 * 1024
+# Exit status of a stdin worker that stopped to be replaced (EX_TEMPFAIL)
+RECYCLE_EXIT_CODE = 75
+
+_output_cache = None
+
+def get_output_cache():
+    global _output_cache
+    cache_dir = os.environ.get("FININVEST_PDF_CACHE_DIR")
+    if not cache_dir:
+        return None
+    if _output_cache is None:
+        from output_cache import OutputCache, DEFAULT_MAX_BYTES
+        max_mb = os.environ.get("FININVEST_PDF_CACHE_MAX_MB")
+        _output_cache = OutputCache(cache_dir, int(max_mb) * 1024 * 1024 if max_mb else DEFAULT_MAX_BYTES)
+    return _output_cache
+
+def handle_job(job):
+    job_id = job.get("id") if isinstance(job, dict) else None
+    doc_type = job.get("doc_type") if isinstance(job, dict) else None
+    start = time.perf_counter()
+    usage = {}
+    try:
+        if not isinstance(job, dict):
+            raise ValueError("Job must be a JSON object.")
+        doc_type = job.get("doc_type")
+        output_path = job.get("output_path")
+        if not doc_type or not output_path:
+            raise ValueError("Job requires 'doc_type' and 'output_path'.")
+        if output_path == "-":
+            raise ValueError("Output path '-' is not supported here, stdout carries the job results.")
+        payload = job.get("payload", {})
+        cache = get_output_cache()
+        cache_status = None
+        # Imported before the budget applies: the modules (numpy's thread buffers
+        # among them) are the worker's baseline, not the job's
+        registry.get_generator(doc_type)
+        # Generators print a success line to stdout, which is our result channel
+        with memory_budget.job_budget() as usage, contextlib.redirect_stdout(sys.stderr):
+            # Streamed statements are written page by page, so they bypass the cache
+            if cache is None or (isinstance(payload, dict) and payload.get("stream")):
+                registry.render(doc_type, output_path, payload)
+            else:
+                pdf_bytes, hit = cache.render_bytes(doc_type, payload)
+                cache_status = "bypass" if hit is None else "hit" if hit else "miss"
+                registry.ensure_output_dir(output_path)
+                with open(output_path, "wb") as f:
+                    f.write(pdf_bytes)
+    except Exception as e:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        result = {"id": job_id, "status": "error", "doc_type": doc_type, "error": f"{type(e).__name__}: {e}", "elapsed_ms": round(elapsed_ms, 2), **usage}
+        if isinstance(e, memory_budget.MemoryBudgetExceeded):
+            result["code"] = memory_budget.OVER_BUDGET_CODE
+            result["recycle"] = True
+        elif memory_budget.should_recycle():
+            result["recycle"] = True
+        return result
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    result = {"id": job_id, "status": "ok", "doc_type": doc_type, "output_path": output_path, "bytes": os.path.getsize(output_path), "elapsed_ms": round(elapsed_ms, 2), **usage}
+    if cache_status:
+        result["cache"] = cache_status
+        result["cache_stats"] = cache.stats()
+    if memory_budget.should_recycle():
+        result["recycle"] = True
+    return result
+
+def read_lines(f, limit=LINE_LIMIT):
+    # Lines of f (text or binary); a line longer than limit is skipped over a
+    # piece at a time and yielded as None
+    while True:
+        line = f.readline(limit + 1)
+        if not line:
+            return
+        if len(line) > limit and line[-1:] not in ("\n", b"\n"):
+            while line and line[-1:] not in ("\n", b"\n"):
+                line = f.readline(limit)
+            yield None
+        else:
+            yield line
+
+def handle_line(line):
+    # line: a str or UTF-8 bytes, or None for one read_lines() skipped
+    if line is None or len(line) > LINE_LIMIT:
+        return {"id": None, "status": "error", "error": f"Job line is over the {LINE_LIMIT // memory_budget.MB} MB limit.", "code": memory_budget.OVER_BUDGET_CODE}
+    try:
+        with memory_budget.job_budget():
+            job = json.loads(line)
+    except memory_budget.MemoryBudgetExceeded as e:
+        return {"id": None, "status": "error", "error": f"{type(e).__name__}: {e}", "code": memory_budget.OVER_BUDGET_CODE, "recycle": True}
+    except ValueError as e:
+        return {"id": None, "status": "error", "error": f"Invalid JSON: {e}"}
+    return handle_job(job)
+
+def serve_stream(infile, outfile):
+    # Returns True when the worker stopped to be recycled
+    for line in read_lines(infile):
+        if line is not None and not line.strip():
+            continue
+        result = handle_line(line)
+        outfile.write(json.dumps(result) + "\n")
+        outfile.flush()
+        if result.get("recycle"):
+            return True
+    return False
+
+class JobHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for raw in read_lines(self.rfile):
+            if raw is not None and not raw.strip():
+                continue
+            result = handle_line(raw)
+            self.wfile.write((json.dumps(result) + "\n").encode("utf-8"))
+            self.wfile.flush()
+            if result.get("recycle"):
+                self.server.recycle = True
+
+# Listening socket handed to the process a recycled socket worker restarts as
+LISTEN_FD_ENV = "FININVEST_PDF_WORKER_LISTEN_FD"
+
+def serve_socket(socket_path):
+    listen_fd = os.environ.pop(LISTEN_FD_ENV, None)
+    if listen_fd is None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = socketserver.UnixStreamServer(socket_path, JobHandler)
+    else:
+        # Restarted: same socket, so connections waiting in its backlog are kept
+        server = socketserver.UnixStreamServer(socket_path, JobHandler, bind_and_activate=False)
+        server.socket.close()
+        server.socket = socket.socket(fileno=int(listen_fd))
+    server.recycle = False
+    print(f"PDF render worker listening on {socket_path}", file=sys.stderr)
+    try:
+        # One connection at a time, so a worker due for recycling finishes the current one first
+        while not server.recycle:
+            server.handle_request()
+    except BaseException:
+        server.server_close()
+        os.remove(socket_path)
+        raise
+    print(f"PDF render worker at {memory_budget.rss_mb():.0f} MB, restarting", file=sys.stderr)
+    os.set_inheritable(server.fileno(), True)
+    os.environ[LISTEN_FD_ENV] = str(server.fileno())
+    # orig_argv: the same command line, also when started through python -m pdf_generators or the zipapp
+    os.execv(sys.executable, [sys.executable] + sys.orig_argv[1:])
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--socket":
+        serve_socket(sys.argv[2])
+    elif len(sys.argv) == 1:
+        if serve_stream(sys.stdin, sys.stdout):
+            sys.exit(RECYCLE_EXIT_CODE)
+    else:
+        print("Usage: python render_worker.py [--socket <socket_path>]", file=sys.stderr)
+        print("Reads one JSON job per line from stdin (or the Unix socket) and writes one JSON result per line.", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,299 @@
+import sys
+import csv
+import io
+import json
+import mmap
+import itertools
+
+# Incremental row readers for the statement generators. Rows are yielded one
+# at a time from stdin or a file so a statement with years of history never
+# has to fit in argv or be parsed into one big list before drawing starts.
+#   jsonl: one JSON array per line, e.g. ["2025-05-01", "Quota Maio", "100.00", "", "900.00"]
+#   csv:   one row per line, same column order as the statement table
+#   arrow: Arrow IPC file or stream (needs pyarrow)
+#
+# Ledger exports don't have to be converted first: columns maps the
+# statement's columns onto the export's (header names, or 0-based indexes
+# without --header; an empty entry is a blank column), and rows can be
+# filtered while scanning:
+#   matches:       [(column, value)], e.g. member_id=M001 or loan_id=L005
+#   period_column: keep rows whose date (first 10 characters) is within period
+#
+#   --rows ledger.csv --header --columns booked_on,memo,debit,credit, --match member_id=M001 --period-column booked_on
+#
+# CSV files (not stdin) are memory-mapped and read a chunk at a time. With a
+# --match filter, only the lines containing the first match value as it is
+# written in the file (found with bytes.find on the mapped buffer) are decoded
+# and parsed, so the rows of one
+# member in a ledger of millions are picked out without building the others;
+# the filters are then applied exactly on the parsed rows. Arrow files are
+# memory-mapped too, filtered per record batch with pyarrow.compute, and
+# turned into rows one batch at a time.
+#
+# iter_rows() reads the first row before returning, so a bad format, an
+# unknown column or a missing pyarrow is raised by the call itself, where the
+# CLIs report it, rather than once drawing has started.
+
+ROW_FORMATS = ("jsonl", "csv", "arrow")
+# Bytes of a memory-mapped CSV scanned at a time
+MMAP_CHUNK = 1 << 20
+ARROW_EXTENSIONS = (".arrow", ".feather", ".ipc", ".arrows")
+
+def guess_format(source):
+    if source.lower().endswith(".csv"):
+        return "csv"
+    if source.lower().endswith(ARROW_EXTENSIONS):
+        return "arrow"
+    return "jsonl"
+
+def _iter_jsonl(f):
+    for line_no, line in enumerate(f, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON on row line {line_no}: {e}")
+        if not isinstance(row, list):
+            raise ValueError(f"Row line {line_no} must be a JSON array.")
+        yield row
+
+def _iter_csv(f, skip_header):
+    reader = csv.reader(f)
+    if skip_header:
+        next(reader, None)
+    for row in reader:
+        if row:
+            yield row
+
+def _column_index(column, names):
+    # A header name, or a 0-based index when the file has no header (or the name is numeric)
+    if names is not None and column in names:
+        return names.index(column)
+    if column.isdigit():
+        return int(column)
+    if names is None:
+        raise ValueError(f"Column '{column}' needs --header (or use a 0-based column index).")
+    raise ValueError(f"Unknown column '{column}'. Columns: {', '.join(names)}")
+
+def _resolve(names, columns, matches, period_column):
+    # Column specs -> indexes; None in the column list is a blank column
+    indexes = None
+    if columns is not None:
+        indexes = [_column_index(column, names) if column else None for column in columns]
+    match_indexes = [(_column_index(column, names), value) for column, value in matches]
+    period_index = _column_index(period_column, names) if period_column else None
+    return indexes, match_indexes, period_index
+
+def _filter_rows(rows, names, columns, matches, period_column, period):
+    # Exact match/period filters and the column mapping, on parsed rows
+    indexes, match_indexes, period_index = _resolve(names, columns, matches, period_column)
+    start, end = period
+    for row in rows:
+        if not row:
+            continue
+        try:
+            if any(row[index] != value for index, value in match_indexes):
+                continue
+            if period_index is not None:
+                date = row[period_index][:10]
+                if (start and date < start) or (end and date > end):
+                    continue
+            yield row if indexes is None else [row[index] if index is not None else "" for index in indexes]
+        except IndexError:
+            # Too few fields: not a match when filtering, otherwise passed on
+            # as is so the table warns about it
+            if not match_indexes and period_index is None:
+                yield row
+
+def _iter_mapped_csv(f, skip_header, columns, matches, period_column, period):
+    # Column mapping and filters for CSV on stdin, which can't be memory-mapped
+    reader = csv.reader(f)
+    names = next(reader, None) if skip_header else None
+    yield from _filter_rows(reader, names, columns, matches, period_column, period)
+
+def _hit_lines(chunk, needle):
+    # The lines of chunk that contain needle, found with bytes.find, or None
+    # when one of them is part of a record spanning lines (a quoted newline)
+    lines = []
+    counted = 0
+    inside = 0
+    pos = chunk.find(needle)
+    while pos != -1:
+        start = chunk.rfind(b"\n", 0, pos) + 1
+        end = chunk.find(b"\n", pos)
+        if end == -1:
+            end = len(chunk)
+        # Quote parity before the line says whether it starts inside a quoted field
+        inside ^= chunk.count(b'"', counted, start) & 1
+        counted = end
+        if inside or chunk.count(b'"', start, end) & 1:
+            return None
+        lines.append(chunk[start:end + 1])
+        pos = chunk.find(needle, end)
+    return lines
+
+def _csv_needle(value):
+    # The match value as it appears in a CSV line (quotes doubled inside a
+    # quoted field), or None when it can't be found line by line
+    if not value or "\n" in value or "\r" in value:
+        return None
+    return value.replace('"', '""').encode("utf-8")
+
+def _iter_mmap_lines(buf, pos, needle=None):
+    # Text lines of a memory-mapped CSV from byte offset pos, a chunk of whole
+    # lines at a time. With a needle, a chunk only contributes its lines that
+    # contain it (the records a match filter could keep); chunks where that
+    # can't be decided line by line are passed on whole.
+    size = len(buf)
+    inside = False
+    while pos < size:
+        stop = min(pos + MMAP_CHUNK, size)
+        if stop < size:
+            newline = buf.rfind(b"\n", pos, stop)
+            if newline == -1:
+                newline = buf.find(b"\n", stop)
+            stop = size if newline == -1 else newline + 1
+        chunk = buf[pos:stop]
+        pos = stop
+        quotes = chunk.count(b'"')
+        # Lines can only be picked out of a chunk whose records all end inside it
+        lines = _hit_lines(chunk, needle) if needle and not inside and quotes % 2 == 0 else None
+        # An odd number of quotes leaves a field open into the next chunk
+        inside = (inside + quotes) % 2 == 1
+        if lines is not None:
+            if not lines:
+                continue
+            chunk = b"".join(lines)
+        yield from io.StringIO(chunk.decode("utf-8"), newline="\n")
+
+def _iter_mmap_csv(path, skip_header, columns, matches, period_column, period):
+    with open(path, "rb") as f:
+        if f.seek(0, 2) == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            pos = 3 if buf[:3] == b"\xef\xbb\xbf" else 0
+            names = None
+            if skip_header:
+                end = buf.find(b"\n", pos)
+                end = len(buf) if end == -1 else end
+                names = next(csv.reader([buf[pos:end].decode("utf-8").rstrip("\r")]), [])
+                pos = end + 1
+            needle = _csv_needle(matches[0][1]) if matches else None
+            rows = csv.reader(_iter_mmap_lines(buf, pos, needle))
+            if columns is None and not matches and not period_column:
+                yield from (row for row in rows if row)
+            else:
+                yield from _filter_rows(rows, names, columns, matches, period_column, period)
+
+def _arrow_text(value):
+    return "" if value is None else str(value)
+
+def _iter_arrow(path, columns, matches, period_column, period):
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.ipc
+    except ImportError:
+        raise ValueError("Arrow input needs pyarrow (pip install pyarrow).")
+    with pa.memory_map(path) as source:
+        try:
+            reader = pa.ipc.open_file(source)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        except pa.ArrowInvalid:
+            source.seek(0)
+            batches = pa.ipc.open_stream(source)
+        names = None
+        indexes = match_indexes = period_index = None
+        start, end = period
+        for batch in batches:
+            if names is None:
+                names = batch.schema.names
+                indexes, match_indexes, period_index = _resolve(names, columns, matches, period_column)
+                if indexes is None:
+                    indexes = list(range(len(names)))
+            mask = None
+            for index, value in match_indexes:
+                keep = pc.equal(pc.cast(batch.column(index), pa.string()), value)
+                mask = keep if mask is None else pc.and_(mask, keep)
+            if period_index is not None:
+                dates = pc.utf8_slice_codeunits(pc.cast(batch.column(period_index), pa.string()), 0, 10)
+                for bound, compare in ((start, pc.greater_equal), (end, pc.less_equal)):
+                    if bound:
+                        keep = compare(dates, bound)
+                        mask = keep if mask is None else pc.and_(mask, keep)
+            if mask is not None:
+                batch = batch.filter(pc.fill_null(mask, False))
+            if batch.num_rows == 0:
+                continue
+            blank = [""] * batch.num_rows
+            values = [batch.column(index).to_pylist() if index is not None else blank for index in indexes]
+            for row in zip(*values):
+                yield [_arrow_text(value) for value in row]
+
+def iter_rows(source, fmt=None, skip_header=False, columns=None, matches=(), period_column=None, period=(None, None)):
+    # source is a path or "-" for stdin. Returns an iterator over the rows.
+    rows = _iter_rows(source, fmt, skip_header, columns, matches, period_column, period)
+    first = next(rows, None)
+    return iter(()) if first is None else itertools.chain([first], rows)
+
+def _iter_rows(source, fmt, skip_header, columns, matches, period_column, period):
+    fmt = fmt or guess_format(source)
+    if fmt not in ROW_FORMATS:
+        raise ValueError(f"Unknown row format '{fmt}'. Expected one of: {', '.join(ROW_FORMATS)}")
+    mapped = columns is not None or matches or period_column
+    if fmt == "arrow":
+        if source == "-":
+            raise ValueError("Arrow input must be a file path, not stdin.")
+        yield from _iter_arrow(source, columns, matches, period_column, period)
+        return
+    if fmt == "csv" and source != "-":
+        yield from _iter_mmap_csv(source, skip_header, columns, matches, period_column, period)
+        return
+    if mapped and fmt != "csv":
+        raise ValueError("--columns, --match and --period-column need csv or arrow rows.")
+    f = sys.stdin if source == "-" else open(source, encoding="utf-8", newline="")
+    try:
+        if fmt == "csv":
+            if mapped:
+                yield from _iter_mapped_csv(f, skip_header, columns, matches, period_column, period)
+            else:
+                yield from _iter_csv(f, skip_header)
+        else:
+            yield from _iter_jsonl(f)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def parse_rows_args(args):
+    # Parses the trailing "--rows <path|-> [--format jsonl|csv|arrow] [--header] [--columns a,b,...]
+    # [--match column=value ...] [--period-column column]" CLI options into iter_rows() keyword arguments
+    options = {"source": None, "fmt": None, "skip_header": False, "columns": None, "matches": [], "period_column": None}
+    i = 0
+    while i < len(args):
+        if args[i] == "--rows" and i + 1 < len(args):
+            options["source"] = args[i + 1]
+            i += 2
+        elif args[i] == "--format" and i + 1 < len(args):
+            options["fmt"] = args[i + 1]
+            i += 2
+        elif args[i] == "--header":
+            options["skip_header"] = True
+            i += 1
+        elif args[i] == "--columns" and i + 1 < len(args):
+            options["columns"] = args[i + 1].split(",")
+            i += 2
+        elif args[i] == "--match" and i + 1 < len(args):
+            column, sep, value = args[i + 1].partition("=")
+            if not sep or not column:
+                raise ValueError(f"--match expects column=value, got '{args[i + 1]}'")
+            options["matches"].append((column, value))
+            i += 2
+        elif args[i] == "--period-column" and i + 1 < len(args):
+            options["period_column"] = args[i + 1]
+            i += 2
+        else:
+            raise ValueError(f"Unexpected argument '{args[i]}'")
+    if options["source"] is None:
+        raise ValueError("Missing --rows <path|->")
+    return options
@@ -0,0 +1,98 @@
+import sys
+import os
+import re
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+from benchmark import build_cases, ISSUED_AT
+
+# Start-up cost of the command line, for the Node backend's one process per
+# document path. Each run is a fresh interpreter:
+#   ttfb_ms  - spawn to first byte of a receipt rendered to stdout by
+#              python -m pdf_generators receipt - <payload>
+#   usage_ms - spawn to exit on the usage path (no generator, no fpdf)
+# plus one -X importtime run of the receipt, summarised as the modules with
+# the largest cumulative import time.
+#
+#   python startup_benchmark.py --runs 10 --target-ms 600
+#   python startup_benchmark.py --zipapp dist/pdf_generators.pyz
+#
+# Exit status 1 when the median time to first byte misses --target-ms.
+
+DEFAULT_TARGET_MS = 600
+PACKAGE_PARENT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+def command(zipapp_path, args):
+    base = [sys.executable, zipapp_path] if zipapp_path else [sys.executable, "-m", "pdf_generators"]
+    return base + args
+
+def time_to_first_byte(cmd):
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=PACKAGE_PARENT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    first = proc.stdout.read(1)
+    elapsed = time.perf_counter() - start
+    proc.stdout.read()
+    if proc.wait() != 0 or not first:
+        raise RuntimeError(f"{' '.join(cmd[:4])} ... failed with exit status {proc.returncode}")
+    return elapsed * 1000
+
+def time_to_exit(cmd):
+    start = time.perf_counter()
+    subprocess.run(cmd, cwd=PACKAGE_PARENT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return (time.perf_counter() - start) * 1000
+
+def import_summary(cmd, top=10):
+    # Top-level imports (direct imports of the entry point) by cumulative time
+    proc = subprocess.run([cmd[0], "-X", "importtime", *cmd[1:]], cwd=PACKAGE_PARENT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    entries = []
+    for line in proc.stderr.splitlines():
+        m = IMPORTTIME_RE.match(line)
+        if m:
+            entries.append((int(m.group(2)), len(m.group(3)), m.group(4)))
+    shallowest = min((depth for _, depth, _ in entries), default=0)
+    roots = sorted(((us, name) for us, depth, name in entries if depth == shallowest), reverse=True)
+    return {
+        "total_ms": round(sum(us for us, _ in roots) / 1000, 1),
+        "modules": len(entries),
+        "top": [{"module": name, "cumulative_ms": round(us / 1000, 1)} for us, name in roots[:top]],
+    }
+
+def summarise(values):
+    return {"median": round(statistics.median(values), 1), "min": round(min(values), 1), "max": round(max(values), 1)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure CLI start-up time and time to first byte.")
+    parser.add_argument("--runs", type=int, default=10, help="Fresh processes per measurement")
+    parser.add_argument("--target-ms", type=float, default=DEFAULT_TARGET_MS, help="Median time to first byte to stay under")
+    parser.add_argument("--zipapp", default=None, help="Measure this .pyz instead of python -m pdf_generators")
+    parser.add_argument("--output", default=None, help="Also write the JSON results to this path")
+    args = parser.parse_args()
+
+    payload = dict(build_cases([])["receipt"][1], issued_at=ISSUED_AT)
+    render_cmd = command(args.zipapp, ["receipt", "-", json.dumps(payload, ensure_ascii=False)])
+    usage_cmd = command(args.zipapp, [])
+    # One unmeasured run so bytecode caches exist
+    time_to_first_byte(render_cmd)
+    ttfb = [time_to_first_byte(render_cmd) for _ in range(args.runs)]
+    usage = [time_to_exit(usage_cmd) for _ in range(args.runs)]
+    results = {
+        "python": sys.version.split()[0],
+        "entry": args.zipapp or "python -m pdf_generators",
+        "runs": args.runs,
+        "ttfb_ms": summarise(ttfb),
+        "usage_ms": summarise(usage),
+        "target_ms": args.target_ms,
+        "imports": import_summary(render_cmd),
+    }
+    results["within_target"] = results["ttfb_ms"]["median"] <= args.target_ms
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if not results["within_target"]:
+        print(f"Median time to first byte {results['ttfb_ms']['median']} ms is over the {args.target_ms:g} ms target", file=sys.stderr)
+        sys.exit(1)
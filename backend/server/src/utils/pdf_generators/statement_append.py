@@ -0,0 +1,410 @@
+import sys
+import os
+import re
+import json
+import zlib
+import html
+import hashlib
+from datetime import date, datetime, timedelta, timezone
+
+from fpdf.syntax import PDFDate, PDFString
+
+import ttf_fonts
+
+# Adds rows to an existing member or loan statement with a PDF incremental
+# update, instead of re-rendering the whole history every month.
+#
+# A statement rendered with appendable=True (--appendable on the CLI) carries
+# its continuation state in its XMP metadata: the summary totals, the fonts in
+# use (for TrueType fonts, with the characters drawn so far), the fitted table
+# column widths, and where the last table row ended (page, cursor y, and the
+# length and hash of that page's content stream up to the summary block).
+#
+# append_rows() reads only the trailer, xref, catalog, page tree, metadata and
+# that last page from the file, then lays out just the new rows from that
+# point on with the statement's own generator class:
+#   - the last page gets a new content stream: the old one cut before the
+#     summary block and footer, followed by the new rows
+#   - further pages are new objects
+#   - the summary block (totals, final balance) is drawn after the last new row
+#   - the page tree, resources, metadata and info are replaced; a TrueType
+#     font gets new objects whose subset covers the old and new characters
+#     (ttf_fonts.font_objects), for the body page and the new ones
+# and appends those objects, an xref section for them and a trailer pointing
+# back at the previous one. The bytes already in the file are never rewritten,
+# so the cost is the new rows plus one page, whatever the length of the history.
+#
+# Earlier pages keep what they showed when they were drawn (the header period,
+# loan row statuses); only the rows given here are added.
+#
+#   python statement_append.py uploads/statements/M001.pdf '[["2025-06-01", "Quota Jun", "100.00", "", ""]]' --period-end 2025-06-30
+
+STATE_FORMAT = 1
+STATE_NS = "https://fininvest.local/ns/statement-append/1.0/"
+STATE_RE = re.compile(r"<fininvest:appendState>(.*?)</fininvest:appendState>", re.S)
+# Bytes read at a time while looking for the end of an object or the trailer
+CHUNK = 16 * 1024
+
+class AppendError(ValueError):
+    pass
+
+def record_state(pdf, summary):
+    # Called by continue_statement() after the last row, before the summary block
+    body = bytes(pdf.pages[pdf.page].contents)
+    state = {
+        "format": STATE_FORMAT,
+        "doc_type": pdf.doc_type,
+        "args": pdf.statement_args(),
+        "summary": summary.to_state(),
+        "fonts": [font.fontkey for font in sorted(pdf.fonts.values(), key=lambda font: font.i)],
+        "font_family": pdf._font_alias or None,
+        "ttf_codes": {font.fontkey: ttf_fonts.used_codes(font) for font in pdf.fonts.values() if ttf_fonts.is_ttf(font)},
+        "col_widths": pdf.table.widths,
+        "body_page": pdf.page + pdf.page_number_offset,
+        "body_length": len(body),
+        "body_sha1": hashlib.sha1(body, usedforsecurity=False).hexdigest(),
+        "y": pdf.y,
+    }
+    pdf.append_state = state
+    pdf.set_xmp_metadata(_xmp(state))
+
+def _xmp(state):
+    return (
+        '<x:xmpmeta xmlns:x="adobe:ns:meta/">\n'
+        ' <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">\n'
+        f'  <rdf:Description rdf:about="" xmlns:fininvest="{STATE_NS}">\n'
+        f"   <fininvest:appendState>{html.escape(json.dumps(state, ensure_ascii=False), quote=False)}</fininvest:appendState>\n"
+        "  </rdf:Description>\n"
+        " </rdf:RDF>\n"
+        "</x:xmpmeta>"
+    )
+
+def _ref(dictionary, key):
+    m = re.search(rb"/" + key + rb"\s+(\d+)\s+0\s+R", dictionary)
+    return int(m.group(1)) if m else None
+
+class PDFFile:
+    # Random access to the objects of a PDF with classic xref tables, following /Prev
+    def __init__(self, f):
+        self.f = f
+        f.seek(0, os.SEEK_END)
+        self.size = f.tell()
+        f.seek(max(0, self.size - 1024))
+        tail = f.read()
+        m = re.search(rb"startxref\s+(\d+)\s+%%EOF\s*$", tail)
+        if m is None:
+            raise AppendError("No startxref at the end of the file.")
+        self.startxref = int(m.group(1))
+        self.offsets = {}
+        self.trailer = None
+        pos = self.startxref
+        while pos is not None:
+            trailer = self._read_xref(pos)
+            if self.trailer is None:
+                self.trailer = trailer
+            m = re.search(rb"/Prev\s+(\d+)", trailer)
+            pos = int(m.group(1)) if m else None
+
+    def _read_xref(self, pos):
+        self.f.seek(pos)
+        if self.f.readline().strip() != b"xref":
+            raise AppendError("Only classic xref tables are supported (no xref streams).")
+        while True:
+            line = self.f.readline().strip()
+            if line.startswith(b"trailer"):
+                break
+            start, count = map(int, line.split())
+            block = self.f.read(count * 20)
+            for k in range(count):
+                entry = block[k * 20:k * 20 + 20]
+                # The newest section is read first and wins
+                if entry[17:18] == b"n" and start + k not in self.offsets:
+                    self.offsets[start + k] = int(entry[:10])
+        data = line[len(b"trailer"):]
+        while b"startxref" not in data:
+            more = self.f.read(CHUNK)
+            if not more:
+                raise AppendError("Unterminated trailer.")
+            data += more
+        return data[:data.index(b"startxref")].strip()
+
+    def read(self, obj_id):
+        # -> (dictionary bytes, decoded stream bytes or None)
+        if obj_id not in self.offsets:
+            raise AppendError(f"Object {obj_id} is not in the xref.")
+        self.f.seek(self.offsets[obj_id])
+        data = self.f.read(CHUNK)
+        m = re.match(rb"\s*%d\s+0\s+obj\s*" % obj_id, data)
+        if m is None:
+            raise AppendError(f"Object {obj_id} is not where the xref says.")
+        start = m.end()
+        while True:
+            end = data.find(b"endobj", start)
+            stream_at = data.find(b"stream", start)
+            if stream_at != -1 and (end == -1 or stream_at < end):
+                dictionary = data[start:stream_at].strip()
+                length = re.search(rb"/Length\s+(\d+)(?!\s+0\s+R)", dictionary)
+                if length is None:
+                    raise AppendError(f"Stream object {obj_id} has no direct /Length.")
+                data_start = stream_at + len(b"stream")
+                data_start += 2 if data[data_start:data_start + 2] == b"\r\n" else 1
+                needed = data_start + int(length.group(1)) - len(data)
+                if needed > 0:
+                    data += self.f.read(needed)
+                raw = data[data_start:data_start + int(length.group(1))]
+                if re.search(rb"/Filter\s*/FlateDecode", dictionary):
+                    raw = zlib.decompress(raw)
+                elif b"/Filter" in dictionary:
+                    raise AppendError(f"Stream object {obj_id} uses an unsupported filter.")
+                return dictionary, raw
+            if end != -1:
+                return data[start:end].strip(), None
+            more = self.f.read(CHUNK)
+            if not more:
+                raise AppendError(f"Object {obj_id} is not terminated.")
+            data += more
+
+def read_state(pdf_file):
+    catalog, _ = pdf_file.read(_ref(pdf_file.trailer, b"Root"))
+    metadata_id = _ref(catalog, b"Metadata")
+    if metadata_id is None:
+        raise AppendError("The statement has no append state; render it with appendable=True (--appendable) first.")
+    _, xmp = pdf_file.read(metadata_id)
+    m = STATE_RE.search(xmp.decode("utf-8"))
+    if m is None:
+        raise AppendError("The statement has no append state; render it with appendable=True (--appendable) first.")
+    state = json.loads(html.unescape(m.group(1)))
+    if state.get("format") != STATE_FORMAT:
+        raise AppendError(f"Unsupported append state format {state.get('format')!r}.")
+    return catalog, metadata_id, state
+
+def font_key_style(fontkey):
+    # "helveticaBI" -> ("helvetica", "BI"), as fpdf builds the key from family + style
+    m = re.match(r"^(.*?)(BI|B|I)?$", fontkey)
+    return m.group(1), m.group(2) or ""
+
+def register_font(pdf, fontkey):
+    # Adds the font fontkey names to pdf, as set_font or ttf_fonts.add_font did
+    family, style = font_key_style(fontkey)
+    if family in ttf_fonts.FAMILIES:
+        ttf_fonts.add_font(pdf, family, style)
+    else:
+        pdf.set_font(family, style)
+
+def _pdf_date(dt):
+    return PDFDate((dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)).astimezone(timezone.utc), with_tz=True).serialize()
+
+def append_rows(f, rows, issued_at=None, period_end=None):
+    # f: statement PDF opened "r+b"; rows: iterable of statement rows. Returns a summary dict.
+    import registry
+    from streaming_writer import xmp_stream, _media_box
+
+    pdf_file = PDFFile(f)
+    catalog, metadata_id, state = read_state(pdf_file)
+    pages_id = _ref(catalog, b"Pages")
+    pages_dict, _ = pdf_file.read(pages_id)
+    kids = [int(ref) for ref in re.findall(rb"(\d+)\s+0\s+R", re.search(rb"/Kids\s*\[(.*?)\]", pages_dict, re.S).group(1))]
+    body_page = state["body_page"]
+    if not 1 <= body_page <= len(kids):
+        raise AppendError("The append state does not match the page tree.")
+    page_id = kids[body_page - 1]
+    page_dict, _ = pdf_file.read(page_id)
+    contents_id = _ref(page_dict, b"Contents")
+    if contents_id is None:
+        raise AppendError("The last statement page has several content streams (was the file compacted?); re-render it in full.")
+    _, contents = pdf_file.read(contents_id)
+    prefix = contents[:state["body_length"]]
+    if hashlib.sha1(prefix, usedforsecurity=False).hexdigest() != state["body_sha1"]:
+        raise AppendError("The last statement page does not match its append state; re-render it in full.")
+
+    # Lay out the new rows as a continuation of the body page
+    module = registry.get_generator(state["doc_type"])
+    args = dict(state["args"])
+    if period_end:
+        args["period_end"] = period_end
+    pdf = module.new_pdf(**args, issued_at=issued_at, appendable=True)
+    # The statement's own font, whatever FININVEST_PDF_FONT says now
+    pdf.font_family_override = state.get("font_family")
+    for fontkey in state["fonts"]:
+        # Same registration order, so the new content uses the same /F names as the old
+        register_font(pdf, fontkey)
+    for fontkey, codes in state.get("ttf_codes", {}).items():
+        # The old pages' characters, so the new font objects cover them too
+        ttf_fonts.add_codes(pdf.fonts[fontkey], codes)
+    pdf.page_number_offset = body_page - 1
+    pdf.resume_page(state["y"])
+    # Files from before table fitting have no col_widths and keep the default widths
+    pdf.table.resume(state.get("col_widths"))
+    summary = _summary_class(state["doc_type"]).from_state(state["summary"])
+    pdf.continue_statement(rows, summary)
+    pdf._render_footer()
+
+    # Old body (its graphics state isolated) + the new rows on the same page
+    head = b"q\n" + prefix + b"\nQ\n"
+    new_state = pdf.append_state
+    if new_state["body_page"] == body_page:
+        combined = head + bytes(pdf.pages[1].contents)[:new_state["body_length"]]
+        new_state["body_length"] = len(combined)
+        new_state["body_sha1"] = hashlib.sha1(combined, usedforsecurity=False).hexdigest()
+
+    # Resources: the old page's fonts plus any the new rows introduced
+    resources_ref = _ref(page_dict, b"Resources")
+    resources = pdf_file.read(resources_ref)[0] if resources_ref else re.search(rb"/Resources\s*(<<.*>>)", page_dict, re.S).group(1)
+    font_ids = {int(name): int(ref) for name, ref in re.findall(rb"/F(\d+)\s+(\d+)\s+0\s+R", resources)}
+
+    out = bytearray()
+    offsets = {}
+    next_id = int(re.search(rb"/Size\s+(\d+)", pdf_file.trailer).group(1))
+    base = pdf_file.size
+    f.seek(base - 1)
+    if f.read(1) != b"\n":
+        out += b"\n"
+
+    def new_id():
+        nonlocal next_id
+        next_id += 1
+        return next_id - 1
+
+    def put(obj_id, body):
+        offsets[obj_id] = base + len(out)
+        out.extend(b"%d 0 obj\n" % obj_id + body + b"\nendobj\n")
+
+    def put_stream(obj_id, data, entries=""):
+        data = zlib.compress(data)
+        put(obj_id, f"<<\n{entries}/Filter /FlateDecode\n/Length {len(data)}\n>>\nstream\n".encode("latin-1") + data + b"\nendstream")
+
+    for font in sorted(pdf.fonts.values(), key=lambda font: font.i):
+        if ttf_fonts.is_ttf(font):
+            # Earlier pages keep the old objects, whose subset is enough for them
+            font_ids[font.i] = new_id()
+            objects = ttf_fonts.font_objects(font, font_ids[font.i])
+            next_id = objects[-1][0] + 1
+            for obj_id, entries, data in objects:
+                if data is None:
+                    put(obj_id, f"<<\n{entries}>>".encode("latin-1"))
+                else:
+                    put_stream(obj_id, data, entries)
+        elif font.i not in font_ids:
+            font_ids[font.i] = new_id()
+            put(font_ids[font.i], f"<<\n{ttf_fonts.core_font_object(font)}>>".encode("latin-1"))
+    font_refs = "\n".join(f"/F{i} {obj_id} 0 R" for i, obj_id in sorted(font_ids.items()))
+    resources_id = new_id()
+    put(resources_id, f"<<\n/Font <<{font_refs}>>\n/ProcSet [/PDF /Text /ImageB /ImageC /ImageI]\n>>".encode("latin-1"))
+
+    page_ids = []
+    for page_no in sorted(pdf.pages):
+        page = pdf.pages[page_no]
+        stream_id = new_id()
+        if page_no == 1:
+            put_stream(stream_id, head + bytes(page.contents))
+            target_id = page_id
+        else:
+            put_stream(stream_id, bytes(page.contents))
+            target_id = new_id()
+        put(target_id, (
+            f"<<\n/Contents {stream_id} 0 R\n/MediaBox {_media_box(page.dimensions())}\n"
+            f"/Parent {pages_id} 0 R\n/Resources {resources_id} 0 R\n/Type /Page\n>>"
+        ).encode("latin-1"))
+        page_ids.append(target_id)
+
+    # Pages after the old body page only held the old summary block; they drop out of the tree
+    kids = kids[:body_page - 1] + page_ids
+    kids_text = "\n".join(f"{kid} 0 R" for kid in kids)
+    media_box = re.search(rb"/MediaBox\s*\[[^\]]*\]", pages_dict)
+    put(pages_id, (
+        f"<<\n/Count {len(kids)}\n/Kids [{kids_text}]\n".encode("latin-1")
+        + (media_box.group(0) + b"\n" if media_box else b"")
+        + b"/Type /Pages\n>>"
+    ))
+    put(metadata_id, xmp_stream(_xmp(new_state)))
+
+    info_id = _ref(pdf_file.trailer, b"Info")
+    info = []
+    if info_id is not None:
+        old_info, _ = pdf_file.read(info_id)
+        info = [line for line in old_info.strip()[2:-2].split(b"\n") if line.strip() and not line.startswith((b"/Title", b"/ModDate"))]
+    else:
+        info_id = new_id()
+    info.append(f"/ModDate {_pdf_date(pdf.issued_at or datetime.now(timezone.utc))}".encode("latin-1"))
+    info.append(f"/Title {PDFString(pdf.title).serialize()}".encode("latin-1"))
+    put(info_id, b"<<\n" + b"\n".join(sorted(info)) + b"\n>>")
+
+    # xref section for the objects written here, one subsection per run of ids
+    xref_pos = base + len(out)
+    ids = sorted(offsets)
+    runs = []
+    for obj_id in ids:
+        if runs and obj_id == runs[-1][-1] + 1:
+            runs[-1].append(obj_id)
+        else:
+            runs.append([obj_id])
+    # Object 0's free entry heads every xref section, as readers expect
+    out += b"xref\n0 1\n0000000000 65535 f \n"
+    for run in runs:
+        out += b"%d %d\n" % (run[0], len(run))
+        out += b"".join(b"%010d 00000 n \n" % offsets[obj_id] for obj_id in run)
+    old_id = re.search(rb"/ID\s*\[\s*<([0-9A-Fa-f]*)>", pdf_file.trailer)
+    file_id = hashlib.md5(bytes(out), usedforsecurity=False).hexdigest().upper()
+    trailer = f"<<\n/Size {next_id}\n/Root {_ref(pdf_file.trailer, b'Root')} 0 R\n/Info {info_id} 0 R\n"
+    if old_id:
+        trailer += f"/ID [<{old_id.group(1).decode('latin-1')}><{file_id}>]\n"
+    trailer += f"/Prev {pdf_file.startxref}\n>>"
+    out += b"trailer\n" + trailer.encode("latin-1") + b"\nstartxref\n%d\n%%%%EOF\n" % xref_pos
+
+    # Append-only: on any failure the file is cut back to its previous revision
+    f.seek(base)
+    try:
+        f.write(out)
+        f.flush()
+        os.fsync(f.fileno())
+    except BaseException:
+        f.truncate(base)
+        raise
+    return {"rows": summary.rows, "pages": len(kids), "new_pages": len(page_ids) - 1, "bytes_appended": len(out), "bytes": base + len(out)}
+
+def next_period_start(f):
+    # The day after the statement's period end: rows already in the file are
+    # dated up to it, so --period-column starts from here
+    _, _, state = read_state(PDFFile(f))
+    period_end = state["args"].get("period_end")
+    try:
+        return (date.fromisoformat(period_end[:10]) + timedelta(days=1)).isoformat()
+    except (TypeError, ValueError):
+        raise AppendError(f"--period-column needs the statement's period end as YYYY-MM-DD, not {period_end!r}.")
+
+def _summary_class(doc_type):
+    from statement_summary import MemberStatementSummary, LoanStatementSummary
+    classes = {"member_statement": MemberStatementSummary, "loan_statement": LoanStatementSummary}
+    if doc_type not in classes:
+        raise AppendError(f"Cannot append rows to a '{doc_type}' document.")
+    return classes[doc_type]
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    options = {}
+    for flag in ("--issued-at", "--period-end"):
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = args[i + 1] if i + 1 < len(args) else None
+            del args[i:i + 2]
+    if len(args) >= 2:
+        try:
+            with open(args[0], "r+b") as f:
+                if args[1] == "--rows":
+                    from row_sources import iter_rows, parse_rows_args
+                    rows_options = parse_rows_args(args[1:])
+                    # --period-column keeps the rows dated after the statement's period end, up to --period-end
+                    start = next_period_start(f) if rows_options["period_column"] else None
+                    rows = iter_rows(**rows_options, period=(start, options.get("--period-end")))
+                else:
+                    rows = json.loads(args[1])
+                    if not isinstance(rows, list):
+                        raise ValueError("Rows must be a JSON array of arrays.")
+                result = append_rows(f, rows, issued_at=options.get("--issued-at"), period_end=options.get("--period-end"))
+        except (OSError, ValueError, zlib.error) as e:
+            print(f"Error appending to statement: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(json.dumps(result))
+    else:
+        print("Usage: python statement_append.py <statement.pdf> <json_rows | --rows <path|-> [--format jsonl|csv|arrow] [--header] [--columns a,b,...] [--match column=value] [--period-column column]> [--period-end YYYY-MM-DD] [--issued-at ISO]", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,196 @@
+import sys
+from array import array
+from itertools import accumulate, islice
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional; the array-based fallback gives the same results, just slower
+    np = None
+
+# Summary stage for the statements. Rows are consumed in batches of BATCH_ROWS
+# (so streamed statements stay in bounded memory); each batch's amount columns
+# are parsed once into integer cents and reduced together: running balance,
+# debit/credit totals, paid principal/interest. Cents keep the totals exact
+# where summing floats would drift on long statements. An amount that isn't a
+# number ("100.00 EUR", "1.234,50") is shown as given and left out of the
+# totals, with a warning.
+
+BATCH_ROWS = 4096
+
+def _valid_rows(batch, columns):
+    # Rows of the wrong length are left for add_table_row to warn about
+    if set(map(len, batch)) == {columns}:
+        return batch
+    return [row for row in batch if len(row) == columns]
+
+def batched(rows, size=BATCH_ROWS):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+def to_cents(value):
+    if value in (None, ""):
+        return 0
+    return round(float(value) * 100)
+
+def format_cents(cents):
+    sign = "-" if cents < 0 else ""
+    cents = abs(int(cents))
+    return f"{sign}{cents // 100}.{cents % 100:02d}"
+
+def _amount(value):
+    # float, or None for text that isn't a number
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+def column_cents(rows, index):
+    # One amount column of a batch ("1234.56", "" for none) -> (integer cents,
+    # number of values that aren't numbers, counted as 0). Parsing is the only
+    # per-row step; everything after it works on whole arrays.
+    unparsed = 0
+    try:
+        amounts = [float(v) if (v := row[index]) else 0.0 for row in rows]
+    except ValueError:
+        amounts = [_amount(v) if (v := row[index]) else 0.0 for row in rows]
+        unparsed = amounts.count(None)
+        amounts = [0.0 if amount is None else amount for amount in amounts]
+    if np is not None:
+        return np.rint(np.array(amounts) * 100).astype(np.int64), unparsed
+    return array("q", [round(amount * 100) for amount in amounts]), unparsed
+
+def _running(start, credit, debit):
+    # start + cumulative (credit - debit)
+    if np is not None:
+        return start + np.cumsum(credit - debit)
+    return array("q", accumulate((c - d for c, d in zip(credit, debit)), initial=start))[1:]
+
+def _total(values, mask=None):
+    if np is not None:
+        return int(values[mask].sum()) if mask is not None else int(values.sum())
+    if mask is None:
+        return sum(values)
+    return sum(v for v, m in zip(values, mask) if m)
+
+def _column_equals(rows, index, expected):
+    flags = [row[index] == expected for row in rows]
+    return np.array(flags, dtype=bool) if np is not None else flags
+
+class StatementSummary:
+    # Running totals can be saved and restored, so rows appended to an existing
+    # statement continue them (statement_append.py)
+    state_fields = ()
+    # Amounts left out of the totals because they aren't numbers
+    unparsed = 0
+
+    def to_state(self):
+        return {name: getattr(self, name) for name in self.state_fields}
+
+    @classmethod
+    def from_state(cls, state):
+        summary = cls()
+        for name in cls.state_fields:
+            setattr(summary, name, state[name])
+        return summary
+
+    def _column(self, rows, index):
+        cents, unparsed = column_cents(rows, index)
+        self.unparsed += unparsed
+        return cents
+
+    def check(self):
+        # Warnings about the input, once every row is processed
+        if self.unparsed:
+            print(f"Warning: {self.unparsed} amount(s) are not numbers; shown as given and left out of the totals", file=sys.stderr)
+
+class MemberStatementSummary(StatementSummary):
+    # Rows: [date, description, debit, credit, balance]
+    columns = 5
+    state_fields = ("rows", "total_debit", "total_credit", "balance", "stated_balance")
+
+    def __init__(self):
+        self.rows = 0
+        self.total_debit = 0
+        self.total_credit = 0
+        self.balance = None
+        self.stated_balance = None
+
+    def process(self, batch):
+        # Returns the batch with blank balances filled in from the running balance
+        valid = _valid_rows(batch, self.columns)
+        if not valid:
+            return batch
+        debit = self._column(valid, 2)
+        credit = self._column(valid, 3)
+        if self.balance is None:
+            # The opening balance is implied by the first row's stated balance
+            first_balance = _amount(valid[0][4]) if valid[0][4] not in (None, "") else None
+            self.balance = round(first_balance * 100) - (int(credit[0]) - int(debit[0])) if first_balance is not None else 0
+        running = _running(self.balance, credit, debit)
+        self.rows += len(valid)
+        self.total_debit += _total(debit)
+        self.total_credit += _total(credit)
+        self.balance = int(running[-1])
+        balances = [row[4] for row in valid]
+        last_stated = balances[-1]
+        self.stated_balance = last_stated if last_stated not in (None, "") else None
+        if "" not in balances and None not in balances:
+            return batch
+
+        out = []
+        index = 0
+        for row in batch:
+            if len(row) == self.columns:
+                if row[4] in (None, ""):
+                    row = [*row[:4], format_cents(running[index])]
+                index += 1
+            out.append(row)
+        return out
+
+    def check(self):
+        super().check()
+        # The stated final balance should match the one computed from the movements
+        stated = _amount(self.stated_balance) if self.stated_balance is not None else None
+        if stated is not None and round(stated * 100) != self.balance:
+            print(
+                f"Warning: stated final balance {self.stated_balance} differs from computed {format_cents(self.balance)}",
+                file=sys.stderr,
+            )
+
+class LoanStatementSummary(StatementSummary):
+    # Rows: [due_date, payment_date, description, principal, interest, status]
+    columns = 6
+    state_fields = ("rows", "amount_approved", "principal_paid", "interest_paid")
+
+    def __init__(self, amount_approved=0):
+        self.rows = 0
+        try:
+            self.amount_approved = to_cents(amount_approved)
+        except (TypeError, ValueError):
+            # Non-numeric loan details ("N/A") leave the remaining principal unknown
+            self.amount_approved = None
+        self.principal_paid = 0
+        self.interest_paid = 0
+
+    @property
+    def remaining_principal(self):
+        if self.amount_approved is None:
+            return None
+        return self.amount_approved - self.principal_paid
+
+    def process(self, batch):
+        valid = _valid_rows(batch, self.columns)
+        if not valid:
+            return batch
+        principal = self._column(valid, 3)
+        interest = self._column(valid, 4)
+        paid = _column_equals(valid, 5, "paid")
+        self.rows += len(valid)
+        self.principal_paid += _total(principal, paid)
+        self.interest_paid += _total(interest, paid)
+        return batch
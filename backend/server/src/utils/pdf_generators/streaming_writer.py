@@ -0,0 +1,213 @@
+import zlib
+import hashlib
+from datetime import timezone
+
+from fpdf.syntax import PDFDate, PDFString
+
+import ttf_fonts
+
+# Incremental PDF writer. fpdf keeps every page in memory until output(); here
+# each page's content stream is written out as soon as it is finished, and only
+# what the trailer needs is kept: one byte offset per object, the page object
+# ids and the outline entries.
+#
+# Used by FininvestPDF.stream_to() for statements too large to hold in memory,
+# and by merge_documents.py to put many documents in one file. Documents written
+# through the same writer share its `fonts` dict (see pdf_base.shared_fonts), so
+# font objects and the resources dictionary are emitted once for the whole file.
+#
+# Object layout: 1 is the page tree and 2 the shared resources dictionary
+# (both written last, once every page and font is known), then a content
+# stream + page object pair per page, then fonts, outline, XMP metadata, info
+# and catalog.
+#
+# Supports what the generators draw: core and TrueType fonts (ttf_fonts.py),
+# vector drawing, text and the form XObjects of FininvestPDF.page_furniture
+# (add_form). No images, links, annotations or the {nb} page-count alias.
+
+PAGES_ID = 1
+RESOURCES_ID = 2
+
+class StreamingPDFWriter:
+    def __init__(self, f, fonts=None, compress=True, default_page_dimensions=None, compression_level=None):
+        self.f = f
+        self.fonts = fonts if fonts is not None else {}
+        self.compress = compress
+        # zlib level for content streams (None = zlib's default)
+        self.compression_level = compression_level
+        self.default_page_dimensions = default_page_dimensions
+        self.pos = 0
+        self.offsets = {}
+        self.page_ids = []
+        self.outline = []
+        # Form XObject ids, /I1 first
+        self.form_ids = []
+        self.next_id = 3
+        self.id_hash = hashlib.md5(usedforsecurity=False)
+        self._write(b"%PDF-1.3\n%\xe9\xeb\xf1\xbf\n")
+
+    def _write(self, data):
+        self.f.write(data)
+        self.id_hash.update(data)
+        self.pos += len(data)
+
+    def _object(self, obj_id, body):
+        self.offsets[obj_id] = self.pos
+        self._write(f"{obj_id} 0 obj\n".encode("latin-1") + body + b"\nendobj\n")
+
+    def _new_id(self):
+        obj_id = self.next_id
+        self.next_id += 1
+        return obj_id
+
+    def _stream(self, obj_id, stream_dict, contents, deflated=False):
+        # stream_dict: the dictionary's entries, without /Filter and /Length
+        if self.compress:
+            if not deflated:
+                contents = deflate(contents, self.compression_level)
+            stream_dict = f"<<\n{stream_dict}/Filter /FlateDecode\n/Length {len(contents)}\n>>"
+        else:
+            stream_dict = f"<<\n{stream_dict}/Length {len(contents)}\n>>"
+        self._object(obj_id, stream_dict.encode("latin-1") + b"\nstream\n" + contents + b"\nendstream")
+
+    def add_form(self, contents, dimensions):
+        # Writes a form XObject drawn in page coordinates; returns its index (/I<index>)
+        form_id = self._new_id()
+        self._stream(form_id, f"/BBox {_media_box(dimensions)}\n/Resources {RESOURCES_ID} 0 R\n/Subtype /Form\n/Type /XObject\n", contents)
+        self.form_ids.append(form_id)
+        return len(self.form_ids)
+
+    def write_page(self, page):
+        self.write_page_contents(bytes(page.contents), page.dimensions())
+
+    def write_page_contents(self, contents, dimensions, deflated=False):
+        # deflated: contents already went through deflate() at this writer's
+        # compression level (pages laid out in another process, see parallel_statement.py)
+        if self.default_page_dimensions is None:
+            self.default_page_dimensions = dimensions
+        stream_id = self._new_id()
+        page_id = self._new_id()
+        self._stream(stream_id, "", contents, deflated)
+        page_dict = f"<<\n/Contents {stream_id} 0 R\n"
+        if dimensions != self.default_page_dimensions:
+            page_dict += f"/MediaBox {_media_box(dimensions)}\n"
+        page_dict += f"/Parent {PAGES_ID} 0 R\n/Resources {RESOURCES_ID} 0 R\n/Type /Page\n>>"
+        self._object(page_id, page_dict.encode("latin-1"))
+        self.page_ids.append(page_id)
+
+    def write_document(self, pdf, title=None):
+        # Appends a fully laid-out document, starting on a new page, with an outline entry
+        if pdf.page == 0:
+            pdf.add_page()
+        pdf._render_footer()
+        first_page = len(self.page_ids)
+        for page_no in sorted(pdf.pages):
+            self.write_page(pdf.pages.pop(page_no))
+        if title:
+            self.outline.append((title, self.page_ids[first_page]))
+
+    def _write_outline(self):
+        # Flat outline: one top-level entry per document, pointing at its first page
+        root_id = self._new_id()
+        item_ids = [self._new_id() for _ in self.outline]
+        for index, (title, page_id) in enumerate(self.outline):
+            links = f"/Parent {root_id} 0 R\n"
+            if index > 0:
+                links += f"/Prev {item_ids[index - 1]} 0 R\n"
+            if index < len(item_ids) - 1:
+                links += f"/Next {item_ids[index + 1]} 0 R\n"
+            self._object(item_ids[index], (
+                f"<<\n/Dest [{page_id} 0 R /XYZ null null null]\n{links}/Title {PDFString(title).serialize()}\n>>"
+            ).encode("latin-1"))
+        self._object(root_id, (
+            f"<<\n/Count {len(item_ids)}\n/First {item_ids[0]} 0 R\n/Last {item_ids[-1]} 0 R\n/Type /Outlines\n>>"
+        ).encode("latin-1"))
+        return root_id
+
+    def _write_metadata(self, xmp_metadata):
+        # Uncompressed XMP packet, wrapped the way fpdf wraps FPDF.xmp_metadata
+        metadata_id = self._new_id()
+        self._object(metadata_id, xmp_stream(xmp_metadata))
+        return metadata_id
+
+    def close(self, title=None, author=None, creation_date=None, xmp_metadata=None):
+        # Writes fonts, page tree, resources, outline, metadata, info, catalog, xref and trailer; returns the file size
+        font_refs = []
+        for font in sorted(self.fonts.values(), key=lambda font: font.i):
+            font_id = self._new_id()
+            if ttf_fonts.is_ttf(font):
+                objects = ttf_fonts.font_objects(font, font_id)
+                self.next_id = objects[-1][0] + 1
+                for obj_id, entries, data in objects:
+                    if data is None:
+                        self._object(obj_id, f"<<\n{entries}>>".encode("latin-1"))
+                    else:
+                        self._stream(obj_id, entries, data)
+            else:
+                self._object(font_id, f"<<\n{ttf_fonts.core_font_object(font)}>>".encode("latin-1"))
+            font_refs.append(f"/F{font.i} {font_id} 0 R")
+        form_refs = ""
+        if self.form_ids:
+            form_refs = "\n".join(f"/I{index} {form_id} 0 R" for index, form_id in enumerate(self.form_ids, start=1))
+            form_refs = f"/XObject <<{form_refs}>>\n"
+        self._object(RESOURCES_ID, (
+            f"<<\n/Font <<{chr(10).join(font_refs)}>>\n"
+            f"/ProcSet [/PDF /Text /ImageB /ImageC /ImageI]\n{form_refs}>>"
+        ).encode("latin-1"))
+        kids = " ".join(f"{page_id} 0 R" for page_id in self.page_ids)
+        self._object(PAGES_ID, (
+            f"<<\n/Count {len(self.page_ids)}\n/Kids [{kids}]\n"
+            f"/MediaBox {_media_box(self.default_page_dimensions or (595.28, 841.89))}\n/Type /Pages\n>>"
+        ).encode("latin-1"))
+        outline_id = self._write_outline() if self.outline else None
+        metadata_id = self._write_metadata(xmp_metadata) if xmp_metadata else None
+
+        info_id = self._new_id()
+        info = []
+        if author:
+            info.append(f"/Author {PDFString(author).serialize()}")
+        if creation_date:
+            creation_date_utc = (creation_date if creation_date.tzinfo else creation_date.astimezone()).astimezone(timezone.utc)
+            info.append(f"/CreationDate {PDFDate(creation_date_utc, with_tz=True).serialize()}")
+        if title:
+            info.append(f"/Title {PDFString(title).serialize()}")
+        self._object(info_id, ("<<\n" + "\n".join(info) + "\n>>").encode("latin-1"))
+
+        catalog_id = self._new_id()
+        catalog = "<<\n"
+        if self.page_ids:
+            catalog += f"/OpenAction [{self.page_ids[0]} 0 R /FitH null]\n"
+        if metadata_id:
+            catalog += f"/Metadata {metadata_id} 0 R\n"
+        if outline_id:
+            catalog += f"/Outlines {outline_id} 0 R\n/PageMode /UseOutlines\n"
+        catalog += f"/PageLayout /OneColumn\n/Pages {PAGES_ID} 0 R\n/Type /Catalog\n>>"
+        self._object(catalog_id, catalog.encode("latin-1"))
+
+        # Same /ID scheme as fpdf: md5 of the file body plus the creation date
+        if creation_date:
+            self.id_hash.update(creation_date.strftime("%Y%m%d%H%M%S").encode("utf8"))
+        file_id = self.id_hash.hexdigest().upper()
+        xref_pos = self.pos
+        xref = [f"xref\n0 {self.next_id}\n", "0000000000 65535 f \n"]
+        xref.extend(f"{self.offsets[obj_id]:010} 00000 n \n" for obj_id in range(1, self.next_id))
+        xref.append(
+            f"trailer\n<<\n/Size {self.next_id}\n/Root {catalog_id} 0 R\n/Info {info_id} 0 R\n"
+            f"/ID [<{file_id}><{file_id}>]\n>>\nstartxref\n{xref_pos}\n%%EOF\n"
+        )
+        self._write("".join(xref).encode("latin-1"))
+        self.f.flush()
+        return self.pos
+
+def deflate(contents, compression_level=None):
+    # Flate-encodes a content stream the way StreamingPDFWriter does at that level
+    return zlib.compress(contents, -1 if compression_level is None else compression_level)
+
+def xmp_stream(xmp_metadata):
+    # Body of a /Type /Metadata stream object for an <x:xmpmeta> document
+    packet = f'<?xpacket begin="{chr(0xFEFF)}" id="W5M0MpCehiHzreSzNTczkc9d"?>\n{xmp_metadata}\n<?xpacket end="w"?>\n'.encode("utf-8")
+    return f"<<\n/Length {len(packet)}\n/Subtype /XML\n/Type /Metadata\n>>".encode("latin-1") + b"\nstream\n" + packet + b"\nendstream"
+
+def _media_box(dimensions):
+    width, height = dimensions
+    return f"[0 0 {width:.2f} {height:.2f}]"
@@ -0,0 +1,167 @@
+import sys
+
+from fpdf.enums import Align
+
+import layout_cache
+
+# Table engine for the statements. Column widths are fitted once, from a
+# sample of the first rows: every column gets the width of its widest sampled
+# value (or header) and the wrap column takes what is left of the table
+# width, so long descriptions wrap onto extra lines instead of being clipped.
+# Wrapped text is broken with fpdf's own line breaking through layout_cache,
+# so a description that repeats across rows is measured once.
+#
+# Each row's height is known before it is drawn, so the page-break check
+# covers the whole row, and the column header row is drawn above the first
+# row of every page. The body font is selected once per page (after the
+# header row), not per row or per cell; one-line rows go through
+# FininvestPDF.row_cells and taller ones through row_cell_lines. The header row
+# is page furniture (FininvestPDF.page_furniture): documents that reuse it
+# draw it once and place it on the other pages.
+#
+# Values wider than anything in the sample are clipped, as before.
+
+SAMPLE_ROWS = 512
+# The wrap column never gets less than this share of the table width
+MIN_WRAP_SHARE = 0.2
+HEADER_FILL = (230, 230, 230)
+
+class TableLayout:
+    def __init__(self, pdf, headers, aligns, widths, wrap_column=None, font_size=9, header_font_size=10, wrap_line_height=None):
+        self.pdf = pdf
+        self.headers = headers
+        self.aligns = aligns
+        # Default widths until fit() or resume(); their sum is the table width
+        self.widths = list(widths)
+        self.table_width = sum(widths)
+        self.wrap_column = wrap_column
+        self.font_size = font_size
+        self.header_font_size = header_font_size
+        self.line_height = pdf.line_height
+        self.wrap_line_height = wrap_line_height or font_size * 0.5
+        self.fitted = False
+        self._header_page = None
+
+    def fit(self, rows):
+        # Widths from the first SAMPLE_ROWS rows; later rows keep them
+        pdf = self.pdf
+        columns = len(self.headers)
+        sample = [row for row in rows[:SAMPLE_ROWS] if len(row) == columns]
+        padding = 2 * pdf.c_margin
+        pdf.set_font("Helvetica", "B", self.header_font_size)
+        natural = [pdf.get_string_width(header) + padding for header in self.headers]
+        pdf.set_font("Helvetica", "", self.font_size)
+        # Room for two more digits than the widest sampled amount
+        slack = pdf.get_string_width("00")
+        for index, values in enumerate(zip(*sample)):
+            if index == self.wrap_column:
+                continue
+            widest = max(pdf.get_string_width(pdf.normalize_text(str(value))) for value in set(values))
+            natural[index] = max(natural[index], widest + padding + slack)
+
+        if self.wrap_column is None:
+            scale = self.table_width / sum(natural)
+            widths = [w * scale for w in natural]
+        else:
+            fixed = sum(w for index, w in enumerate(natural) if index != self.wrap_column)
+            wrap_min = max(natural[self.wrap_column], self.table_width * MIN_WRAP_SHARE)
+            scale = min(1, (self.table_width - wrap_min) / fixed)
+            widths = [round(w * scale, 2) for w in natural]
+            widths[self.wrap_column] = 0
+            widths[self.wrap_column] = round(self.table_width - sum(widths), 2)
+        self.widths[:] = widths
+        self.fitted = True
+
+    def use_widths(self, widths):
+        # Widths fitted elsewhere (an earlier render of the same statement)
+        self.widths[:] = widths
+        self.fitted = True
+
+    def resume(self, widths=None):
+        # Continuing a page that already shows this table (statement_append.py)
+        if widths:
+            self.use_widths(widths)
+        self.fitted = True
+        self._header_page = self.pdf.page
+        self.begin()
+
+    def begin(self):
+        self.pdf.set_font("Helvetica", "", self.font_size)
+
+    def draw_header(self):
+        pdf = self.pdf
+        pdf.set_font("Helvetica", "B", self.header_font_size)
+        pdf.page_furniture("table_header", self._header_cells)
+        self._header_page = pdf.page
+        self.begin()
+
+    def _header_cells(self):
+        pdf = self.pdf
+        pdf.set_fill_color(*HEADER_FILL)
+        for w, header in zip(self.widths, self.headers):
+            pdf.cell(w, self.line_height, header, border=1, align="C", fill=1)
+        pdf.ln()
+
+    def ensure_header(self):
+        if self._header_page != self.pdf.page:
+            self.draw_header()
+
+    def layout_row(self, row):
+        # (row height, lines per cell or None when every cell fits on one line)
+        if self.wrap_column is None:
+            return self.line_height, None
+        pdf = self.pdf
+        w = self.widths[self.wrap_column]
+        text = str(row[self.wrap_column])
+        if pdf.get_string_width(text) <= w - 2 * pdf.c_margin:
+            return self.line_height, None
+        text = pdf.normalize_text(text)
+        lines = tuple(line[0] for line in layout_cache.cached_lines(pdf, w, text, Align.L)) or ("",)
+        if len(lines) == 1:
+            return self.line_height, None
+        cell_lines = [(pdf.normalize_text(str(value)),) for value in row]
+        cell_lines[self.wrap_column] = lines
+        return len(lines) * self.wrap_line_height + self.line_height - self.wrap_line_height, cell_lines
+
+    def row_heights(self, rows):
+        # layout_row's heights, None for rows of the wrong length (add_row skips them)
+        columns = len(self.widths)
+        return [self.layout_row(row)[0] if len(row) == columns else None for row in rows]
+
+    def paginate(self, heights, top):
+        # Index of the first row of each page when rows of these heights are
+        # added from y=top on a fresh page (below the page header), breaking
+        # where add_row would
+        starts = [0]
+        y = top
+        header = False
+        trigger = self.pdf.page_break_trigger
+        for index, h in enumerate(heights):
+            if h is None:
+                continue
+            if y + (h if header else h + self.line_height) > trigger:
+                starts.append(index)
+                y = top
+                header = False
+            if not header:
+                y += self.line_height
+                header = True
+            y += h
+        return starts
+
+    def add_row(self, row):
+        pdf = self.pdf
+        if len(row) != len(self.widths):
+            print(f"Warning: Row data length mismatch. Expected {len(self.widths)}, got {len(row)}", file=sys.stderr)
+            return
+        h, cell_lines = self.layout_row(row)
+        needed = h if self._header_page == pdf.page else h + self.line_height
+        if pdf.get_y() + needed > pdf.page_break_trigger:
+            pdf.add_page(pdf.cur_orientation)
+        self.ensure_header()
+        if cell_lines is None:
+            pdf.row_cells(self.widths, h, row, self.aligns)
+            pdf.ln()
+        else:
+            pdf.row_cell_lines(self.widths, h, cell_lines, self.aligns, self.line_height, self.wrap_line_height)
+            pdf.ln(h)
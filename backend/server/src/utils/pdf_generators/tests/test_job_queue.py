@@ -0,0 +1,80 @@
+import io
+import os
+import time
+
+from job_queue import JobQueue, run
+
+def receipt_job(output_path, **extra):
+    return {"doc_type": "receipt", "output_path": str(output_path), "payload": {"receipt_data": {"receipt_number": "R-1"}}, **extra}
+
+def test_jobs_without_id_are_not_duplicated(tmp_path):
+    queue = JobQueue(str(tmp_path / "q.db"))
+    assert queue.enqueue([receipt_job(tmp_path / "a.pdf")]) == (1, 0)
+    assert queue.enqueue([receipt_job(tmp_path / "a.pdf"), receipt_job(tmp_path / "b.pdf")]) == (1, 1)
+    assert queue.status()["jobs"]["queued"] == 2
+
+def test_recover_leaves_live_runners_jobs(tmp_path):
+    path = str(tmp_path / "q.db")
+    live = JobQueue(path, lease_s=60)
+    live.enqueue([receipt_job(tmp_path / "a.pdf", id="a")])
+    assert live.claim()["id"] == "a"
+    other = JobQueue(path)
+    assert other.recover() == 0
+    assert other.claim() is None
+
+def test_expired_lease_is_claimed_again(tmp_path):
+    path = str(tmp_path / "q.db")
+    dead = JobQueue(path, lease_s=0.01)
+    dead.enqueue([receipt_job(tmp_path / "a.pdf", id="a")])
+    dead.claim()
+    time.sleep(0.05)
+    other = JobQueue(path)
+    job = other.claim()
+    assert job["id"] == "a"
+    other.complete(job["queue_id"], {"status": "ok"})
+    assert other.status()["jobs"]["done"] == 1
+
+def test_heartbeat_keeps_a_long_job_leased(tmp_path, monkeypatch):
+    import job_queue
+    path = str(tmp_path / "q.db")
+    runner = JobQueue(path, lease_s=0.3)
+    runner.enqueue([receipt_job(tmp_path / "a.pdf", id="a")])
+    stolen = []
+
+    def slow_job(job):
+        time.sleep(0.6)
+        stolen.append(JobQueue(path).claim())
+        return {"id": job["id"], "status": "ok"}
+
+    monkeypatch.setattr(job_queue, "handle_job", slow_job)
+    summary = run(runner, wait_for_retries=False, log=io.StringIO())
+    assert stolen == [None]
+    assert summary["jobs"]["done"] == 1
+
+def test_runner_whose_lease_ran_out_does_not_record(tmp_path):
+    path = str(tmp_path / "q.db")
+    late = JobQueue(path, lease_s=0.01)
+    late.enqueue([receipt_job(tmp_path / "a.pdf", id="a")])
+    job = late.claim()
+    time.sleep(0.05)
+    owner = JobQueue(path)
+    assert owner.claim()["id"] == "a"
+    assert late.complete(job["queue_id"], {"status": "ok"}) is False
+    assert late.fail(job["queue_id"], "boom") is None
+    assert owner.status()["jobs"]["running"] == 1
+    assert owner.complete(job["queue_id"], {"status": "ok"}) is True
+
+def exit_on_boom(job):
+    # A worker killed mid-job (the OOM killer) breaks the whole pool
+    if job["id"] == "boom":
+        os._exit(1)
+    return {"id": job["id"], "status": "ok"}
+
+def test_killed_worker_does_not_stop_the_run(tmp_path, monkeypatch):
+    import job_queue
+    queue = JobQueue(str(tmp_path / "q.db"), backoff_s=0)
+    queue.enqueue([receipt_job(tmp_path / f"{name}.pdf", id=name) for name in ("boom", "a", "b", "c", "d")])
+    monkeypatch.setattr(job_queue, "handle_job", exit_on_boom)
+    summary = run(queue, workers=2, wait_for_retries=False, log=io.StringIO())
+    assert summary["jobs"] == {"queued": 0, "running": 0, "done": 4, "failed": 1}
+    assert [failure["id"] for failure in summary["failed"]] == ["boom"]
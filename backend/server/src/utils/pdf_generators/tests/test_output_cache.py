@@ -0,0 +1,40 @@
+import os
+import asyncio
+
+import render_service
+from output_cache import OutputCache
+
+def disk_bytes(cache_dir):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(cache_dir) for name in files)
+
+def test_size_limit_holds_across_processes_sharing_the_directory(tmp_path):
+    # One OutputCache per render worker, all on the same directory
+    caches = [OutputCache(str(tmp_path), max_bytes=100_000) for _ in range(4)]
+    for i in range(40):
+        caches[i % 4].put(f"{i:064x}", b"x" * 10_000)
+    assert disk_bytes(tmp_path) <= 100_000
+    for cache in caches:
+        assert cache.total_bytes <= 100_000
+    assert sum(cache.evictions for cache in caches) == 40 - disk_bytes(tmp_path) // 10_000
+
+def test_service_stats_sum_the_workers_cache_counters(tmp_path, monkeypatch):
+    monkeypatch.setenv("FININVEST_PDF_CACHE_DIR", str(tmp_path / "cache"))
+    job = {"doc_type": "receipt", "output_path": str(tmp_path / "r.pdf"), "payload": {"receipt_data": {"Recibo Nº": "R-1"}, "issued_at": "2025-06-30T18:00:00"}}
+
+    async def run():
+        service = render_service.RenderService(workers=2, queue_size=8, timeout=60)
+        await service.start()
+        try:
+            assert service.stats()["cache"] is None
+            results = await asyncio.gather(*(service.submit(dict(job, id=str(i))) for i in range(4)))
+            # A recycled worker's counters are kept
+            await service._processes[0].stop()
+            return results, service.stats()["cache"]
+        finally:
+            await service.stop()
+
+    results, cache = asyncio.run(run())
+    assert [result["status"] for result in results] == ["ok"] * 4
+    assert cache["hits"] + cache["misses"] == 4
+    assert cache["misses"] >= 1
+    assert cache["bytes"] > 0
@@ -0,0 +1,49 @@
+import io
+
+import pytest
+
+import benchmark
+import parallel_statement
+
+ISSUED_AT = "2025-06-30T18:00:00"
+
+def member_rows(n):
+    # Some descriptions wrap, so rows differ in height
+    rows = benchmark.member_statement_rows(n)
+    for i in range(0, n, 7):
+        rows[i][1] += " com uma descrição comprida que quebra em duas ou mais linhas na coluna do extrato"
+    for i in range(3, n, 5):
+        rows[i][4] = ""
+    return rows
+
+def loan_rows(n):
+    rows = benchmark.loan_statement_rows(n)
+    for i in range(0, n, 9):
+        rows[i][2] += " com texto que é muito comprido para caber numa linha da coluna"
+    return rows
+
+STATEMENTS = {
+    "member_statement": ({"member_name": "Fundo", "period_start": "2020-01-01", "period_end": "2025-12-31"}, member_rows),
+    "loan_statement": ({"client_name": "Cliente", "loan_id": "L-001", "period_start": "2020-01-01", "period_end": "2025-12-31"}, loan_rows),
+}
+
+def streamed(doc_type, args, rows):
+    module = parallel_statement.registry.get_generator(doc_type)
+    f = io.BytesIO()
+    pdf = module.new_pdf(**args, issued_at=ISSUED_AT)
+    pdf.stream_to(f)
+    pdf.print_statement(rows)
+    pdf.finish_stream()
+    return f.getvalue()
+
+@pytest.mark.parametrize("doc_type", STATEMENTS)
+@pytest.mark.parametrize("rows_count, workers", [(400, 2), (400, 3), (25, 4)])
+def test_parallel_output_matches_streamed(doc_type, rows_count, workers):
+    args, make_rows = STATEMENTS[doc_type]
+    if doc_type == "loan_statement":
+        args = dict(args, loan_details=benchmark.loan_details(rows_count))
+    rows = make_rows(rows_count)
+    f = io.BytesIO()
+    result = parallel_statement.render_parallel(doc_type, f, args, rows, ISSUED_AT, workers)
+    assert result["rows"] == rows_count
+    assert f.getvalue() == streamed(doc_type, args, rows)
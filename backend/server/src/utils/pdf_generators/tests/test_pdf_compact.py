@@ -0,0 +1,49 @@
+import io
+
+from pypdf import PdfReader
+
+import pdf_compact
+from generate_member_statement import build_pdf
+
+def statement_rows(n):
+    rows = []
+    for i in range(n):
+        rows.append([f"2025-{i % 12 + 1:02d}-01", f"Quota {i} (Devida)", "100.00", "", ""])
+        rows.append([f"2025-{i % 12 + 1:02d}-15", f"Pagamento Quota {i}", "", "100.00", ""])
+    return rows
+
+def render(title=None):
+    pdf = build_pdf("Nome Exemplo Sócio", "2025-01-01", "2025-12-31", statement_rows(150), issued_at="2025-01-01T12:00:00")
+    if title:
+        pdf.set_title(title)
+    return pdf.output_bytes()
+
+def pages_text(pdf_bytes):
+    reader = PdfReader(io.BytesIO(pdf_bytes), strict=True)
+    return reader, [page.extract_text() for page in reader.pages]
+
+def test_round_trip_keeps_every_page():
+    original = render()
+    compacted, stats = pdf_compact.compact(original, 9)
+    assert "skipped" not in stats
+    assert len(compacted) < len(original)
+    _, before = pages_text(original)
+    _, after = pages_text(compacted)
+    assert len(before) > 3
+    assert after == before
+
+def test_strings_that_read_like_syntax_are_kept():
+    title = "Extrato 3 0 R (1 0 obj) endobj \\ <4 0 R>"
+    compacted, stats = pdf_compact.compact(render(title), 9)
+    assert "skipped" not in stats
+    reader, _ = pages_text(compacted)
+    assert reader.metadata.title == title
+
+def test_references_inside_strings_are_not_rewritten():
+    data = b"<<\n/T (a\\) 7 0 R (7 0 R)) /H <3720302052> /P 7 0 R\n>>"
+    assert pdf_compact._rewrite_refs(data, {7: 2}) == b"<<\n/T (a\\) 7 0 R (7 0 R)) /H <3720302052> /P 2 0 R\n>>"
+    assert pdf_compact._refs(data) == [7]
+
+def test_unsupported_input_is_returned_unchanged():
+    data = b"%PDF-1.4\n1 0 obj\n<< /T (unterminated >>\nendobj\n"
+    assert pdf_compact.compact(data)[0] == data
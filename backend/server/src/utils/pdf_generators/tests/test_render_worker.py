@@ -0,0 +1,50 @@
+import io
+import os
+import sys
+import json
+import subprocess
+
+import render_worker
+
+WORKER = os.path.join(os.path.dirname(render_worker.__file__), "render_worker.py")
+
+def run_worker(lines, **env):
+    done = subprocess.run(
+        [sys.executable, WORKER], input="".join(line + "\n" for line in lines),
+        capture_output=True, text=True, env={**os.environ, **env},
+    )
+    return done.returncode, [json.loads(line) for line in done.stdout.splitlines()]
+
+def test_long_lines_are_refused_without_reading_them_whole(monkeypatch):
+    monkeypatch.setattr(render_worker, "LINE_LIMIT", 32)
+    infile = io.StringIO('{"id": "' + "x" * 100 + '"}\n' + "not json\n")
+    outfile = io.StringIO()
+    assert render_worker.serve_stream(infile, outfile) is False
+    results = [json.loads(line) for line in outfile.getvalue().splitlines()]
+    assert [result.get("code") for result in results] == [413, None]
+    assert results[1]["error"].startswith("Invalid JSON")
+
+def test_read_lines_binary():
+    lines = list(render_worker.read_lines(io.BytesIO(b"a\n" + b"b" * 10 + b"\nc"), limit=4))
+    assert lines == [b"a\n", None, b"c"]
+
+def test_decoding_runs_under_the_memory_budget():
+    # ~20 MB of JSON that decodes to a few hundred MB of lists
+    code, results = run_worker(["[" + "[]," * 6_000_000 + "[]]"], FININVEST_PDF_JOB_MAX_MB="64")
+    assert code == render_worker.RECYCLE_EXIT_CODE
+    assert results[0]["code"] == 413
+    assert results[0]["error"].startswith("MemoryBudgetExceeded")
+    assert results[0]["recycle"] is True
+
+def test_recycled_worker_exits_with_its_own_status(tmp_path):
+    job = {"doc_type": "receipt", "output_path": str(tmp_path / "r.pdf"), "payload": {"receipt_data": {"Recibo Nº": "R-1"}}}
+    code, results = run_worker([json.dumps(dict(job, id="a")), json.dumps(dict(job, id="b"))], FININVEST_PDF_RECYCLE_RSS_MB="1")
+    assert code == render_worker.RECYCLE_EXIT_CODE
+    assert [result["id"] for result in results] == ["a"]
+    assert results[0]["status"] == "ok"
+
+def test_worker_exits_cleanly_at_the_end_of_its_input(tmp_path):
+    job = {"id": "a", "doc_type": "receipt", "output_path": str(tmp_path / "r.pdf"), "payload": {"receipt_data": {"Recibo Nº": "R-1"}}}
+    code, results = run_worker([json.dumps(job)])
+    assert code == 0
+    assert results[0]["status"] == "ok"
@@ -0,0 +1,66 @@
+import csv
+import io
+import mmap
+
+import pytest
+
+import row_sources
+from row_sources import iter_rows
+
+HEADER = ["booked_on", "member_id", "memo", "debit", "credit"]
+LEDGER = [
+    ["2025-05-01", "M001", 'Quota "Maio"', "100.00", ""],
+    ["2025-05-02", "M002", "Quota, Maio", "100.00", ""],
+    ["2025-05-03", "M001", "Pagamento\nQuota Maio", "", "100.00"],
+    ["2025-05-04", "M003", "Ação €", "", "50.00"],
+    ["2025-05-05", "M001", "Quota Maio", "", "100.00"],
+    ["2025-06-01", "M002", '"', "", ""],
+]
+
+def write_ledger(path, rows, lineterminator="\r\n"):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, lineterminator=lineterminator)
+        writer.writerow(HEADER)
+        writer.writerows(rows)
+
+@pytest.mark.parametrize("memo", ['Quota "Maio"', "Quota, Maio", "Pagamento\nQuota Maio", "Ação €", '"', "Quota Maio"])
+def test_match_finds_values_csv_escapes(tmp_path, memo):
+    path = tmp_path / "ledger.csv"
+    write_ledger(path, LEDGER * 3)
+    rows = list(iter_rows(str(path), skip_header=True, columns=["booked_on", "memo"], matches=[("memo", memo)]))
+    assert rows == [[row[0], row[2]] for row in LEDGER * 3 if row[2] == memo]
+
+@pytest.mark.parametrize("chunk", [1, 7, 64, 1 << 20])
+@pytest.mark.parametrize("needle", [None, b"M001", b"Quota", b"nowhere"])
+def test_mmap_lines_parse_as_csv_reader(tmp_path, monkeypatch, chunk, needle):
+    monkeypatch.setattr(row_sources, "MMAP_CHUNK", chunk)
+    path = tmp_path / "ledger.csv"
+    write_ledger(path, LEDGER * 20, lineterminator="\n")
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        parsed = list(csv.reader(row_sources._iter_mmap_lines(buf, 0, needle)))
+        expected = list(csv.reader(io.StringIO(buf[:].decode("utf-8"), newline="")))
+    if needle is None:
+        assert parsed == expected
+    else:
+        # Lines without the needle may be dropped, never a record that contains it
+        text = needle.decode("utf-8")
+        assert [row for row in parsed if any(text in field for field in row)] == [row for row in expected if any(text in field for field in row)]
+        assert all(row in expected for row in parsed)
+
+def test_period_filter(tmp_path):
+    path = tmp_path / "ledger.csv"
+    write_ledger(path, LEDGER)
+    rows = list(iter_rows(str(path), skip_header=True, columns=["booked_on"], period_column="booked_on", period=("2025-05-03", "2025-05-31")))
+    assert rows == [["2025-05-03"], ["2025-05-04"], ["2025-05-05"]]
+
+@pytest.mark.parametrize("kwargs", [
+    {"fmt": "xml"},
+    {"skip_header": True, "columns": ["booked_on", "nope"]},
+    {"columns": ["booked_on"]},
+    {"fmt": "jsonl", "matches": [("member_id", "M001")]},
+])
+def test_bad_arguments_raise_on_the_call(tmp_path, kwargs):
+    path = tmp_path / "ledger.csv"
+    write_ledger(path, LEDGER)
+    with pytest.raises(ValueError):
+        iter_rows(str(path), **kwargs)
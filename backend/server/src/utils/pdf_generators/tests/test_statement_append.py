@@ -0,0 +1,117 @@
+import io
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+from pypdf import PdfReader
+
+import generate_member_statement
+import statement_append
+from statement_append import AppendError, append_rows
+
+ISSUED_AT = "2025-07-01T09:00:00"
+
+def rows(months, start=0):
+    out = []
+    for i in range(start, start + months):
+        month = f"2025-{i % 12 + 1:02d}"
+        out.append([f"{month}-01", f"Quota {i} (Devida)", "100.00", "", ""])
+        out.append([f"{month}-15", f"Pagamento Quota {i}", "", "150.00", ""])
+    return out
+
+def render(statement_rows, appendable=True):
+    return generate_member_statement.render_bytes("Sócio Teste", "2025-01-01", "2025-06-30", statement_rows, issued_at=ISSUED_AT, appendable=appendable)
+
+def text(pdf_bytes):
+    reader = PdfReader(io.BytesIO(pdf_bytes), strict=True)
+    return len(reader.pages), "\n".join(page.extract_text() for page in reader.pages)
+
+def append(path, new_rows, **kwargs):
+    with open(path, "r+b") as f:
+        return append_rows(f, new_rows, issued_at=ISSUED_AT, **kwargs)
+
+@pytest.mark.parametrize("first, added", [(3, 2), (30, 45)])
+def test_append_matches_a_full_render(tmp_path, first, added):
+    path = tmp_path / "statement.pdf"
+    original = render(rows(first))
+    path.write_bytes(original)
+    result = append(path, rows(added, start=first))
+    appended = path.read_bytes()
+    assert appended.startswith(original)
+    assert result["rows"] == 2 * (first + added)
+
+    pages, appended_text = text(appended)
+    full_pages, full_text = text(render(rows(first + added)))
+    assert pages == full_pages == result["pages"]
+    assert appended_text.split("Totais:")[1] == full_text.split("Totais:")[1]
+    assert f"Pagamento Quota {first + added - 1}" in appended_text
+
+def test_append_twice(tmp_path):
+    path = tmp_path / "statement.pdf"
+    path.write_bytes(render(rows(5)))
+    append(path, rows(5, start=5))
+    result = append(path, rows(5, start=10))
+    _, appended_text = text(path.read_bytes())
+    _, full_text = text(render(rows(15)))
+    assert result["rows"] == 30
+    assert appended_text.split("Totais:")[1] == full_text.split("Totais:")[1]
+
+def test_append_to_a_compacted_statement(tmp_path, monkeypatch):
+    path = tmp_path / "statement.pdf"
+    monkeypatch.setenv("FININVEST_PDF_COMPACT", "9")
+    path.write_bytes(render(rows(60)))
+    monkeypatch.delenv("FININVEST_PDF_COMPACT")
+    append(path, rows(5, start=60))
+    _, appended_text = text(path.read_bytes())
+    _, full_text = text(render(rows(65)))
+    assert appended_text.split("Totais:")[1] == full_text.split("Totais:")[1]
+
+def test_compacting_a_statement_file_keeps_it_appendable(tmp_path):
+    source = tmp_path / "rendered.pdf"
+    source.write_bytes(render(rows(60)))
+    path = tmp_path / "statement.pdf"
+    command = [sys.executable, "pdf_compact.py", str(source), str(path)]
+    done = subprocess.run(command, cwd=os.path.dirname(statement_append.__file__), capture_output=True, text=True)
+    assert done.returncode == 0, done.stderr
+    assert len(path.read_bytes()) < len(source.read_bytes())
+    append(path, rows(5, start=60))
+    assert "Pagamento Quota 64" in text(path.read_bytes())[1]
+
+def test_period_end_updates_the_title(tmp_path):
+    path = tmp_path / "statement.pdf"
+    path.write_bytes(render(rows(2)))
+    append(path, rows(1, start=2), period_end="2025-07-31")
+    reader = PdfReader(io.BytesIO(path.read_bytes()), strict=True)
+    assert reader.metadata.title.endswith("2025-07-31")
+
+def test_statement_without_state_is_refused(tmp_path):
+    path = tmp_path / "statement.pdf"
+    original = render(rows(2), appendable=False)
+    path.write_bytes(original)
+    with pytest.raises(AppendError):
+        append(path, rows(1, start=2))
+    assert path.read_bytes() == original
+
+def test_period_column_starts_after_the_statement(tmp_path):
+    # The ledger export holds the rows already in the statement too
+    path = tmp_path / "statement.pdf"
+    path.write_bytes(render(rows(6)))
+    ledger = tmp_path / "ledger.csv"
+    ledger.write_text(
+        "booked_on,memo,debit,credit\n"
+        "2025-06-15,Pagamento Quota 5,,150.00\n"
+        "2025-06-30,Quota Jul (Devida),100.00,\n"
+        "2025-07-01,Pagamento Quota Jul,,150.00\n"
+        "2025-07-31,Quota Ago (Devida),100.00,\n"
+        "2025-08-01,Pagamento Quota Ago,,150.00\n",
+        encoding="utf-8",
+    )
+    command = [
+        sys.executable, "statement_append.py", str(path), "--rows", str(ledger), "--header",
+        "--columns", "booked_on,memo,debit,credit,", "--period-column", "booked_on", "--period-end", "2025-07-31",
+    ]
+    done = subprocess.run(command, cwd=os.path.dirname(statement_append.__file__), capture_output=True, text=True)
+    assert done.returncode == 0, done.stderr
+    assert json.loads(done.stdout)["rows"] == 12 + 2
@@ -0,0 +1,97 @@
+import io
+
+import pytest
+from pypdf import PdfReader
+
+import benchmark
+import generate_loan_statement
+import generate_member_statement
+import pdf_base
+from merge_documents import merge_documents
+
+ISSUED_AT = "2025-06-30T18:00:00"
+# Rows enough for several pages
+ROWS = 180
+
+def member_pdf():
+    return generate_member_statement.new_pdf("Sócio Teste", "2025-01-01", "2025-06-30", issued_at=ISSUED_AT)
+
+def member_rows():
+    return benchmark.member_statement_rows(ROWS)
+
+def loan_pdf():
+    return generate_loan_statement.new_pdf("Cliente Teste", "L-001", "2025-01-01", "2025-06-30", benchmark.loan_details(ROWS), issued_at=ISSUED_AT)
+
+def loan_rows():
+    return benchmark.loan_statement_rows(ROWS)
+
+STATEMENTS = {
+    # new_pdf, rows, title, start of the summary block
+    "member_statement": (member_pdf, member_rows, "Extrato de Conta Corrente - Sócio", "Saldo Final:"),
+    "loan_statement": (loan_pdf, loan_rows, "Extrato de Empréstimo", "Saldo Capital Devedor:"),
+}
+
+def in_memory(new_pdf, rows):
+    pdf = new_pdf()
+    pdf.print_statement(rows())
+    return pdf.output_bytes()
+
+def streamed(new_pdf, rows):
+    f = io.BytesIO()
+    pdf = new_pdf()
+    pdf.stream_to(f)
+    pdf.print_statement(rows())
+    pdf.finish_stream()
+    return f.getvalue()
+
+def parse(pdf_bytes):
+    reader = PdfReader(io.BytesIO(pdf_bytes), strict=True)
+    return reader, [page.extract_text() for page in reader.pages]
+
+@pytest.mark.parametrize("doc_type", STATEMENTS)
+@pytest.mark.parametrize("render", [in_memory, streamed])
+def test_every_page_has_its_furniture(doc_type, render):
+    new_pdf, rows, title, summary = STATEMENTS[doc_type]
+    reader, pages = parse(render(new_pdf, rows))
+    assert len(pages) > 3
+    for number, text in enumerate(pages, start=1):
+        assert title in text
+        assert f"Página {number}" in text
+        assert "Emitido em:" in text
+    assert summary in pages[-1]
+
+@pytest.mark.parametrize("doc_type", STATEMENTS)
+def test_furniture_is_drawn_once(doc_type):
+    new_pdf, rows, _, _ = STATEMENTS[doc_type]
+    reader, _ = parse(in_memory(new_pdf, rows))
+    xobjects = set()
+    for page in reader.pages:
+        resources = page["/Resources"]
+        assert "/XObject" in resources
+        xobjects.update(ref.idnum for ref in resources["/XObject"].values())
+    # Title header, footer and table header, shared by every page
+    assert 0 < len(xobjects) <= 4
+
+@pytest.mark.parametrize("doc_type", STATEMENTS)
+def test_streamed_matches_in_memory(doc_type):
+    new_pdf, rows, _, _ = STATEMENTS[doc_type]
+    assert parse(streamed(new_pdf, rows))[1] == parse(in_memory(new_pdf, rows))[1]
+
+def test_merged_statements():
+    f = io.BytesIO()
+    documents = [
+        ("member_statement", {"member_name": "Sócio Teste", "period_start": "2025-01-01", "period_end": "2025-06-30", "statement_data": member_rows(), "issued_at": ISSUED_AT}, None),
+        ("loan_statement", {"client_name": "Cliente Teste", "loan_id": "L-001", "period_start": "2025-01-01", "period_end": "2025-06-30", "loan_details": benchmark.loan_details(ROWS), "statement_data": loan_rows(), "issued_at": ISSUED_AT}, None),
+    ]
+    summary = merge_documents(documents, f, issued_at=ISSUED_AT)
+    reader, pages = parse(f.getvalue())
+    assert len(pages) == summary["pages"]
+    assert len(reader.outline) == 2
+    assert sum("Saldo Final:" in text for text in pages) == 1
+    assert "Saldo Capital Devedor:" in pages[-1]
+
+def test_fpdf_version_is_the_pinned_one():
+    import fpdf
+    with open(pdf_base.__file__.replace("pdf_base.py", "requirements.txt"), encoding="utf-8") as f:
+        pins = [line.strip() for line in f if line.startswith("fpdf2==")]
+    assert pins == [f"fpdf2=={fpdf.FPDF_VERSION}"]
@@ -0,0 +1,132 @@
+import io
+import os
+import pickle
+
+import fpdf
+import pytest
+from pypdf import PdfReader
+
+import benchmark
+import generate_member_statement
+import parallel_statement
+import ttf_fonts
+from merge_documents import merge_documents
+from statement_append import append_rows
+
+ISSUED_AT = "2025-06-30T18:00:00"
+ARGS = {"member_name": "Sócio Łódź", "period_start": "2025-01-01", "period_end": "2025-06-30"}
+
+@pytest.fixture
+def roboto(monkeypatch, tmp_path):
+    monkeypatch.setenv(ttf_fonts.FONT_ENV, "roboto")
+    monkeypatch.setenv(ttf_fonts.CACHE_DIR_ENV, str(tmp_path / "fonts"))
+    monkeypatch.setattr(ttf_fonts, "_metrics", {})
+
+def rows(n, start=0):
+    # Text outside WinAnsi, which the core fonts can't draw
+    out = benchmark.member_statement_rows(n + start)[start:]
+    for i, row in enumerate(out):
+        row[1] += f" € {i} ŠĐŽ"
+    return out
+
+def in_memory(statement_rows):
+    pdf = generate_member_statement.new_pdf(**ARGS, issued_at=ISSUED_AT)
+    pdf.print_statement(statement_rows)
+    return pdf.output_bytes()
+
+def streamed(statement_rows):
+    f = io.BytesIO()
+    pdf = generate_member_statement.new_pdf(**ARGS, issued_at=ISSUED_AT)
+    pdf.stream_to(f)
+    pdf.print_statement(statement_rows)
+    pdf.finish_stream()
+    return f.getvalue()
+
+def parallel(statement_rows):
+    f = io.BytesIO()
+    parallel_statement.render_parallel("member_statement", f, ARGS, statement_rows, ISSUED_AT, 2)
+    return f.getvalue()
+
+def parse(pdf_bytes):
+    reader = PdfReader(io.BytesIO(pdf_bytes), strict=True)
+    fonts = {str(font["/BaseFont"]) for page in reader.pages for font in page["/Resources"]["/Font"].values()}
+    return "\n".join(page.extract_text() for page in reader.pages), fonts
+
+@pytest.mark.parametrize("render", [in_memory, streamed, parallel])
+def test_unicode_in_every_output_path(roboto, render):
+    text, fonts = parse(render(rows(120)))
+    assert "Sócio Łódź" in text
+    assert "€ 119 ŠĐŽ" in text
+    assert fonts == {"/MPDFAA+Roboto", "/MPDFAA+RobotoBold", "/MPDFAA+RobotoItalic"}
+
+def test_streamed_matches_in_memory(roboto):
+    assert parse(streamed(rows(120)))[0] == parse(in_memory(rows(120)))[0]
+
+def test_parallel_matches_streamed(roboto):
+    assert parallel(rows(300)) == streamed(rows(300))
+
+def test_merged_documents(roboto):
+    f = io.BytesIO()
+    documents = [("member_statement", dict(ARGS, statement_data=rows(40, start), issued_at=ISSUED_AT), None) for start in (0, 40)]
+    merge_documents(documents, f, issued_at=ISSUED_AT)
+    text, fonts = parse(f.getvalue())
+    assert "€ 39 ŠĐŽ" in text
+    assert "/MPDFAA+Roboto" in fonts
+
+def test_append_keeps_the_statements_font(roboto, monkeypatch, tmp_path):
+    path = tmp_path / "statement.pdf"
+    path.write_bytes(generate_member_statement.render_bytes(**ARGS, statement_data=rows(30), issued_at=ISSUED_AT, appendable=True))
+    # Appended in Roboto even with the variable unset now
+    monkeypatch.delenv(ttf_fonts.FONT_ENV)
+    new_rows = [["2025-07-01", "Quota Julho ñ ß Ω", "100.00", "", ""]]
+    with open(path, "r+b") as f:
+        append_rows(f, new_rows, issued_at=ISSUED_AT)
+    text, fonts = parse(path.read_bytes())
+    assert "€ 0 ŠĐŽ" in text
+    assert "Quota Julho ñ ß Ω" in text
+    assert fonts == {"/MPDFAA+Roboto", "/MPDFAA+RobotoBold", "/MPDFAA+RobotoItalic"}
+
+def test_metrics_cache_round_trip(roboto, monkeypatch):
+    monkeypatch.setattr(ttf_fonts, "stats", {"memory_hits": 0, "disk_hits": 0, "parsed": 0})
+    parsed = fpdf.FPDF()
+    ttf_fonts.add_font(parsed, "roboto", "B")
+    monkeypatch.setattr(ttf_fonts, "_metrics", {})
+    cached = fpdf.FPDF()
+    ttf_fonts.add_font(cached, "roboto", "B")
+    assert ttf_fonts.stats == {"memory_hits": 0, "disk_hits": 1, "parsed": 1}
+    cached_font, parsed_font = cached.fonts["robotoB"], parsed.fonts["robotoB"]
+    for field in ttf_fonts.CACHED_FIELDS + ("cw",):
+        if field != "desc":
+            assert getattr(cached_font, field) == getattr(parsed_font, field)
+    for field in ttf_fonts.DESCRIPTOR_FIELDS:
+        assert getattr(cached_font.desc, field) == getattr(parsed_font.desc, field)
+
+@pytest.mark.parametrize("contents", [b"", b"{not json", b'{"format": "2"}'])
+def test_bad_cache_file_is_parsed_again(roboto, contents):
+    cache_path = ttf_fonts._cache_path(ttf_fonts.font_path("roboto", ""))
+    os.makedirs(os.path.dirname(cache_path))
+    with open(cache_path, "wb") as f:
+        f.write(contents)
+    pdf = fpdf.FPDF()
+    ttf_fonts.add_font(pdf, "roboto", "")
+    assert pdf.fonts["roboto"].name == "Roboto"
+
+def test_cache_file_is_not_unpickled(roboto, tmp_path):
+    marker = tmp_path / "unpickled"
+    cache_path = ttf_fonts._cache_path(ttf_fonts.font_path("roboto", ""))
+    os.makedirs(os.path.dirname(cache_path))
+    with open(cache_path, "wb") as f:
+        f.write(pickle.dumps(type("Payload", (), {"__reduce__": lambda self: (os.mkdir, (str(marker),))})()))
+    ttf_fonts.add_font(fpdf.FPDF(), "roboto", "")
+    assert not marker.exists()
+
+def test_characters_outside_the_bmp_are_left_out(roboto):
+    pdf = fpdf.FPDF()
+    ttf_fonts.add_font(pdf, "roboto", "")
+    pdf.add_page()
+    pdf.set_font("roboto", "", 12)
+    pdf.cell(0, 10, "€ 😀")
+    # 0 is .notdef, which every subset has
+    assert ttf_fonts.used_codes(pdf.fonts["roboto"]) == [0, 0x20, 0x20AC]
+    text, _ = parse(pdf.output())
+    assert "€" in text
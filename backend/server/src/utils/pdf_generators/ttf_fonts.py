@@ -0,0 +1,336 @@
+import os
+import sys
+import json
+import hashlib
+import tempfile
+from io import BytesIO
+from collections import defaultdict
+
+import fpdf
+from fontTools import ttLib
+from fpdf.enums import FontDescriptorFlags, TextEmphasis
+from fpdf.fonts import PDFFontDescriptor, SubsetMap, TTFFont
+
+# Roboto (TrueType, embedded and subset) instead of the Helvetica core fonts,
+# for text outside WinAnsi and a consistent look across viewers:
+#
+#   FININVEST_PDF_FONT=roboto             draw Helvetica text in Roboto
+#   FININVEST_PDF_FONT_DIR=<dir>          font files (default: backend/server/assets/fonts)
+#   FININVEST_PDF_FONT_CACHE=<dir>        metrics cache (default: $XDG_CACHE_HOME/fininvest/fonts)
+#
+# Every output path supports it: fpdf's output(), streamed and parallel
+# statements and merged documents (streaming_writer.py), and rows appended to
+# a statement (statement_append.py), which all write the font objects with
+# font_objects() below.
+#
+# Unset, the generators keep the core fonts and their output is unchanged.
+# Helvetica stays the default: the first document a process renders in Roboto
+# pays for importing and running fontTools' subsetter on top of the metrics
+# (about 140 ms more time to first byte with a warm metrics cache, see
+# startup_benchmark.py), which the CLI's start-up target can't take, and every
+# document already archived or cached would change bytes.
+#
+# Registering a TTF with fpdf parses its cmap and hmtx tables, which costs
+# more than the rest of a receipt's layout. The parsed metrics (widths, glyph
+# ids, descriptor) are stored once per font file as JSON, keyed by the
+# SHA-256 of the file and the fpdf version, and later processes load that
+# instead; a cache file that doesn't read back as the expected fields is
+# parsed again. The fontTools TTFont is still opened (lazily) for subsetting
+# at output time. add_font() builds fpdf's TTFFont from those fields without
+# running its __init__, which ties this module to the fpdf2 version pinned in
+# requirements.txt (another slot layout falls back to fpdf's add_font).
+#
+# Text is encoded with each character's code point as its code in the
+# subset font (fpdf numbers characters in the order they are first drawn), so
+# pages laid out in different processes (parallel_statement.py) or appended
+# later (statement_append.py) agree on the codes, and one font object with
+# all their characters serves them all. Characters outside the Basic
+# Multilingual Plane are left out, as fpdf does for glyphs the font lacks.
+
+FONT_ENV = "FININVEST_PDF_FONT"
+FONT_DIR_ENV = "FININVEST_PDF_FONT_DIR"
+CACHE_DIR_ENV = "FININVEST_PDF_FONT_CACHE"
+
+DEFAULT_FONT_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "assets", "fonts"))
+
+# family -> {style: file name}
+FAMILIES = {
+    "roboto": {
+        "": "Roboto-Regular.ttf",
+        "B": "Roboto-Bold.ttf",
+        "I": "Roboto-Italic.ttf",
+        "BI": "Roboto-BoldItalic.ttf",
+    },
+}
+
+# Bump when the cached fields change
+CACHE_FORMAT = "2"
+CACHED_FIELDS = ("name", "desc", "glyph_ids", "sp", "ss", "up", "ut", "scale", "cmap", "is_cff", "is_cid_keyed", "is_symbol", "cff_ros")
+# Set per document in add_font()
+DOCUMENT_FIELDS = (
+    "cw", "i", "type", "ttffile", "fontkey", "is_compressed", "collection_font_number", "unicode_range",
+    "_hbfont", "biggest_size_pt", "missing_glyphs", "palette_index", "color_font", "ttfont", "emphasis", "subset",
+)
+# add_font() fills TTFFont's slots itself; another fpdf layout goes through fpdf.add_font
+_SLOTS_KNOWN = set(TTFFont.__slots__) == set(CACHED_FIELDS) | set(DOCUMENT_FIELDS)
+DESCRIPTOR_FIELDS = ("ascent", "descent", "cap_height", "flags", "font_b_box", "italic_angle", "stem_v", "missing_width")
+# Subset font name, as fpdf names its subsets
+SUBSET_TAG = "MPDFAA+"
+# Tables the embedded subset doesn't need (as fpdf drops them)
+DROPPED_TABLES = ["FFTM", "GDEF", "GPOS", "GSUB", "MATH", "hdmx", "meta", "sbix", "CBDT", "CBLC", "EBDT", "EBLC", "EBSC", "SVG ", "CPAL", "COLR"]
+
+# path -> metrics dict, for documents rendered later in the same process
+_metrics = {}
+stats = {"memory_hits": 0, "disk_hits": 0, "parsed": 0}
+
+class UnicodeSubsetMap(SubsetMap):
+    # fpdf's map of the characters used, with each character's code point as
+    # its code instead of the next free one
+    def pick_glyph(self, glyph):
+        if glyph is None:
+            return None
+        code = self._char_id_per_glyph.get(glyph)
+        if code is None:
+            unicode = glyph.unicode if isinstance(glyph.unicode, tuple) else (glyph.unicode,)
+            if len(unicode) != 1 or unicode[0] > 0xFFFF or 0xD800 <= unicode[0] <= 0xDFFF:
+                return None
+            code = unicode[0]
+            self._char_id_per_glyph[glyph] = code
+        return code
+
+def family_from_env():
+    family = os.environ.get(FONT_ENV, "").strip().lower()
+    if not family or family in ("helvetica", "core"):
+        return None
+    if family not in FAMILIES:
+        print(f"Unknown {FONT_ENV} '{family}', using Helvetica (available: {', '.join(FAMILIES)})", file=sys.stderr)
+        return None
+    return family
+
+def font_dir():
+    return os.environ.get(FONT_DIR_ENV) or DEFAULT_FONT_DIR
+
+def cache_dir():
+    configured = os.environ.get(CACHE_DIR_ENV)
+    if configured:
+        return configured
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "fininvest", "fonts")
+
+def font_path(family, style):
+    return os.path.join(font_dir(), FAMILIES[family][style])
+
+def is_ttf(font):
+    return isinstance(font, TTFFont)
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _parse(pdf, path, fontkey, style):
+    # fpdf's own parser; keeps only what doesn't depend on the document
+    font = TTFFont(pdf, path, fontkey, style)
+    metrics = {field: getattr(font, field) for field in CACHED_FIELDS}
+    metrics["desc"] = {field: getattr(font.desc, field) for field in DESCRIPTOR_FIELDS}
+    metrics["desc"]["flags"] = font.desc.flags.value
+    metrics["glyph_ids"] = dict(font.glyph_ids)
+    metrics["cmap"] = dict(font.cmap)
+    metrics["cw"] = dict(font.cw)
+    metrics["default_width"] = font.desc.missing_width
+    return metrics
+
+def _to_json(metrics):
+    data = dict(metrics, format=CACHE_FORMAT)
+    for field in ("glyph_ids", "cmap", "cw"):
+        data[field] = sorted(metrics[field].items())
+    return data
+
+def _from_json(data):
+    # Raises KeyError/TypeError/ValueError on anything but the fields _to_json writes
+    if data["format"] != CACHE_FORMAT:
+        raise ValueError("Old cache format.")
+    desc = data["desc"]
+    metrics = {
+        "name": str(data["name"]),
+        "desc": {
+            "ascent": int(desc["ascent"]),
+            "descent": int(desc["descent"]),
+            "cap_height": int(desc["cap_height"]),
+            "flags": int(desc["flags"]),
+            "font_b_box": str(desc["font_b_box"]),
+            "italic_angle": int(desc["italic_angle"]),
+            "stem_v": int(desc["stem_v"]),
+            "missing_width": int(desc["missing_width"]),
+        },
+        "glyph_ids": {int(char): int(glyph_id) for char, glyph_id in data["glyph_ids"]},
+        "cmap": {int(char): str(name) for char, name in data["cmap"]},
+        "cw": {int(char): int(width) for char, width in data["cw"]},
+        "default_width": int(data["default_width"]),
+        "scale": float(data["scale"]),
+        "cff_ros": tuple(data["cff_ros"]) if data["cff_ros"] is not None else None,
+    }
+    for field in ("sp", "ss", "up", "ut"):
+        metrics[field] = int(data[field])
+    for field in ("is_cff", "is_cid_keyed", "is_symbol"):
+        metrics[field] = bool(data[field])
+    return metrics
+
+def _cache_path(path):
+    return os.path.join(cache_dir(), f"{_file_hash(path)}-fpdf{fpdf.FPDF_VERSION}-v{CACHE_FORMAT}.json")
+
+def _write_cache(cache_path, metrics):
+    directory = os.path.dirname(cache_path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(_to_json(metrics), f, separators=(",", ":"))
+            os.replace(tmp_path, cache_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError as e:
+        # A read-only cache only costs the parse on the next run
+        print(f"Warning: could not write font metrics cache {cache_path}: {e}", file=sys.stderr)
+
+def font_metrics(pdf, path, fontkey, style):
+    metrics = _metrics.get(path)
+    if metrics is not None:
+        stats["memory_hits"] += 1
+        return metrics
+    cache_path = _cache_path(path)
+    try:
+        with open(cache_path, encoding="utf-8") as f:
+            metrics = _from_json(json.load(f))
+        stats["disk_hits"] += 1
+    except (OSError, KeyError, TypeError, ValueError):
+        metrics = _parse(pdf, path, fontkey, style)
+        stats["parsed"] += 1
+        _write_cache(cache_path, metrics)
+    _metrics[path] = metrics
+    return metrics
+
+def add_font(pdf, family, style):
+    # Registers family/style on pdf like pdf.add_font(family, style, path),
+    # taking the metrics from the cache. Returns the fontkey.
+    fontkey = f"{family}{style}"
+    if fontkey in pdf.fonts:
+        return fontkey
+    path = font_path(family, style)
+    if not _SLOTS_KNOWN:
+        pdf.add_font(family, style, path)
+        font = pdf.fonts[fontkey]
+        font.subset = UnicodeSubsetMap(font)
+        return fontkey
+    metrics = font_metrics(pdf, path, fontkey, style)
+    font = TTFFont.__new__(TTFFont)
+    for field in CACHED_FIELDS:
+        setattr(font, field, metrics[field])
+    desc = metrics["desc"]
+    font.desc = PDFFontDescriptor(**dict(desc, flags=FontDescriptorFlags(desc["flags"])))
+    default_width = metrics["default_width"]
+    font.cw = defaultdict(lambda: default_width, metrics["cw"])
+    font.i = len(pdf.fonts) + 1
+    font.type = "TTF"
+    font.ttffile = path
+    font.fontkey = fontkey
+    font.is_compressed = False
+    font.collection_font_number = 0
+    font.unicode_range = None
+    font._hbfont = None
+    font.biggest_size_pt = 0
+    font.missing_glyphs = []
+    font.palette_index = 0
+    font.color_font = None
+    # Each document subsets its own copy, so the TTFont can't be shared
+    font.ttfont = ttLib.TTFont(path, recalcTimestamp=False, lazy=True)
+    font.emphasis = TextEmphasis.coerce(style)
+    font.subset = UnicodeSubsetMap(font)
+    pdf.fonts[fontkey] = font
+    return fontkey
+
+def used_codes(font):
+    # Code points drawn in font so far (its codes, see UnicodeSubsetMap)
+    return sorted(code for glyph, code in font.subset.items() if glyph is not None)
+
+def add_codes(font, codes):
+    # Adds characters drawn elsewhere (another process, an earlier revision) to font's subset
+    for code in codes:
+        font.subset.pick(code)
+
+def _width_array(widths):
+    # /W array: "first [w w ...]" per run of consecutive codes
+    runs = []
+    for code, width in sorted(widths.items()):
+        if runs and code == runs[-1][0] + len(runs[-1][1]):
+            runs[-1][1].append(width)
+        else:
+            runs.append((code, [width]))
+    return "[" + " ".join(f"{first} [{' '.join(map(str, run))}]" for first, run in runs) + "]"
+
+def _to_unicode(codes):
+    entries = [f"<{code:04X}> <{code:04X}>\n" for code in codes]
+    blocks = "".join(
+        f"{len(entries[i:i + 100])} beginbfchar\n{''.join(entries[i:i + 100])}endbfchar\n"
+        for i in range(0, len(entries), 100)
+    )
+    return (
+        "/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n"
+        "/CIDSystemInfo\n<</Registry (Adobe)\n/Ordering (UCS)\n/Supplement 0\n>> def\n"
+        "/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n"
+        "1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n"
+        f"{blocks}endcmap\nCMapName currentdict /CMap defineresource pop\nend\nend"
+    ).encode("latin-1")
+
+def font_objects(font, first_id):
+    # The objects of a TrueType font for a PDF writer, numbered from first_id
+    # (the font itself, what /F<i> refers to). Returns [(obj_id, dictionary
+    # entries, stream data or None)]; a writer adds << >> around the entries,
+    # and /Filter and /Length for a stream.
+    # Imported here: the subsetter is only needed once a document is written
+    from fontTools import subset as ftsubset
+    type0_id, cid_id, descriptor_id, file_id, map_id, unicode_id = range(first_id, first_id + 6)
+    glyphs = [(glyph, code) for glyph, code in font.subset.items() if glyph is not None]
+    options = ftsubset.Options(notdef_outline=True, recommended_glyphs=True)
+    options.drop_tables += DROPPED_TABLES
+    subsetter = ftsubset.Subsetter(options)
+    subsetter.populate(glyphs=[glyph.glyph_name for glyph, _ in glyphs])
+    ttfont = ttLib.TTFont(font.ttffile, recalcTimestamp=False, lazy=True)
+    subsetter.subset(ttfont)
+    output = BytesIO()
+    ttfont.save(output)
+    font_file = output.getvalue()
+
+    codes = sorted(code for _, code in glyphs)
+    cid_to_gid = bytearray(2 * (codes[-1] + 1 if codes else 1))
+    for glyph, code in glyphs:
+        cid_to_gid[2 * code:2 * code + 2] = ttfont.getGlyphID(glyph.glyph_name).to_bytes(2, "big")
+    widths = {code: glyph.glyph_width for glyph, code in glyphs}
+
+    name = SUBSET_TAG + font.name
+    desc = font.desc
+    return [
+        (type0_id, f"/BaseFont /{name}\n/DescendantFonts [{cid_id} 0 R]\n/Encoding /Identity-H\n/Subtype /Type0\n/ToUnicode {unicode_id} 0 R\n/Type /Font\n", None),
+        (cid_id, (
+            f"/BaseFont /{name}\n/CIDSystemInfo <</Ordering (Identity) /Registry (Adobe) /Supplement 0>>\n"
+            f"/CIDToGIDMap {map_id} 0 R\n/DW {desc.missing_width}\n/FontDescriptor {descriptor_id} 0 R\n"
+            f"/Subtype /CIDFontType2\n/Type /Font\n/W {_width_array(widths)}\n"
+        ), None),
+        (descriptor_id, (
+            f"/Ascent {desc.ascent}\n/CapHeight {desc.cap_height}\n/Descent {desc.descent}\n/Flags {desc.flags.value}\n"
+            f"/FontBBox {desc.font_b_box}\n/FontFile2 {file_id} 0 R\n/FontName /{name}\n/ItalicAngle {desc.italic_angle}\n"
+            f"/MissingWidth {desc.missing_width}\n/StemV {desc.stem_v}\n/Type /FontDescriptor\n"
+        ), None),
+        (file_id, f"/Length1 {len(font_file)}\n", font_file),
+        (map_id, "", bytes(cid_to_gid)),
+        (unicode_id, "", _to_unicode(codes)),
+    ]
+
+def core_font_object(font):
+    # Dictionary entries of a core (Type1) font, as the writers emit them
+    encoding = "" if font.name in ("Symbol", "ZapfDingbats") else "/Encoding /WinAnsiEncoding\n"
+    return f"/BaseFont /{font.name}\n{encoding}/Subtype /Type1\n/Type /Font\n"